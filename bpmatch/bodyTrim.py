@@ -0,0 +1,120 @@
+import re
+from typing import List, Optional, Tuple
+
+from .conf import get_setting
+
+# 送入 LLM 的正文上限（字符）；日文正文 1 字约 1 token，可直接视为 token 预算
+DEFAULT_BUDGET = 1200
+HEAD_CHARS = 300  # 预算不足时保留的开头部分（案件名/概要一般在最前）
+SECTION_CHARS = 400  # 每个关键见出し之后保留的长度
+_ELLIPSIS = "\n…\n"
+
+# 引用回复的起点：之后的内容都是对方原文
+_REPLY_HEADER_RE = re.compile(
+    r"^\s*(?:-{2,}\s*(?:Original Message|元のメッセージ|Forwarded message|転送メッセージ)\s*-{2,}"
+    r"|On .+ wrote:"
+    r"|\d{4}年\d{1,2}月\d{1,2}日.*(?:<[^>]+>|wrote|書きました)\s*[:：]?)\s*$",
+    re.MULTILINE | re.IGNORECASE,
+)
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*[>＞].*\n?", re.MULTILINE)
+# 署名分隔线（RFC 3676 的 "-- " 或一长串符号）
+_SIGNATURE_DELIM_RE = re.compile(
+    r"^(?:-- ?|[-=＝ー─━*＊_~〜※■□◆◇・]{10,})\s*$", re.MULTILINE
+)
+_SIGNATURE_HINT_RE = re.compile(r"〒|TEL|Tel|tel|電話|FAX|Mail|E-?mail|URL|https?://|株式会社|本社")
+# 与案件/人员无关的定型文：只认已知的免责/许可声明句式，且该行不含案件内容时才整行删除
+_BOILERPLATE_RE = re.compile(
+    r"(?:派遣事業|職業紹介事業)[^\n]{0,10}許可|許可番号\s*[:：]"
+    r"|個人情報(?:の取(?:り)?扱い|保護方針|保護ポリシー)|プライバシーポリシー"
+    r"|配信(?:停止|解除)|送信専用|配信専用"
+    r"|(?:本|この)メールは[^\n]{0,20}(?:BCC|送信専用|配信専用|誤って|機密|秘密)"
+    r"|誤送信|誤って(?:受信|届いた|送信)"
+    r"|unsubscribe|confidential",
+    re.IGNORECASE,
+)
+_CONTENT_RE = re.compile(r"単価|スキル|案件|募集|稼働|国籍|【")
+# 抽取关注的见出し：预算不足时以这些位置为中心截取
+_KEY_SECTION_RE = re.compile(
+    r"【[^】\n]{0,8}(?:スキル|単価|金額|報酬|国籍|条件|案件名|業務|備考|期間)[^】\n]{0,8}】"
+    r"|^\s*[■◆●・]?\s*(?:スキル|単価|金額|国籍)\s*[:：]",
+    re.MULTILINE,
+)
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+def strip_reply(text: str) -> str:
+    match = _REPLY_HEADER_RE.search(text)
+    if match and match.start() > 0:
+        text = text[: match.start()]
+    return _QUOTED_LINE_RE.sub("", text)
+
+
+def strip_signature(text: str) -> str:
+    """
+    正文后半部分出现分隔线、且其后像是公司署名（住所/TEL/URL 等）时，从分隔线截断。
+    分隔线在前半部分时多为正文内的区块分隔，保留。
+    """
+    for match in reversed(list(_SIGNATURE_DELIM_RE.finditer(text))):
+        if match.start() < len(text) // 2 or _KEY_SECTION_RE.search(text, match.end()):
+            break
+        if _SIGNATURE_HINT_RE.search(text, match.end()):
+            return text[: match.start()]
+    return text
+
+
+def strip_boilerplate(text: str) -> str:
+    return "\n".join(
+        line
+        for line in text.split("\n")
+        if not (_BOILERPLATE_RE.search(line) and not _CONTENT_RE.search(line))
+    )
+
+
+def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def fit_budget(text: str, budget: int) -> str:
+    """
+    超出预算时保留开头与各关键见出し（【スキル】【単価】等）之后的内容，按原顺序拼接。
+    """
+    if len(text) <= budget:
+        return text
+    spans = [(0, HEAD_CHARS)] + [
+        (m.start(), m.start() + SECTION_CHARS) for m in _KEY_SECTION_RE.finditer(text)
+    ]
+    parts: List[str] = []
+    remaining = budget
+    for start, end in _merge(spans):
+        if remaining <= 0:
+            break
+        piece = text[start : min(end, len(text), start + remaining)]
+        parts.append(piece)
+        remaining -= len(piece)
+    return _ELLIPSIS.join(parts)
+
+
+def clean(text: str) -> str:
+    """
+    去掉引用回复、署名与定型文，不截断。需要原样引用各段落的抽取（如回信模板）直接使用。
+    结果作为 LLM 输入与缓存键，修改规则时需同步升级 llmsTool.PROMPT_VERSIONS。
+    """
+    text = (text or "").replace("\r\n", "\n")
+    text = strip_signature(strip_reply(text))
+    text = strip_boilerplate(text)
+    return _BLANK_LINES_RE.sub("\n", text).strip()
+
+
+def trim(text: str, budget: Optional[int] = None) -> str:
+    """
+    LLM 抽取前的正文预处理：clean 之后按预算截断，用于只需国籍/技能/单价等字段的抽取。
+    """
+    if budget is None:
+        budget = int(get_setting("BPMATCH_LLM_BODY_BUDGET", DEFAULT_BUDGET))
+    return fit_budget(clean(text), budget)
@@ -1,21 +1,29 @@
 import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
-
-from .gmailTool import GmailTool
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+from . import (
+    candidatePool,
+    dedup,
+    llmSchema,
+    mailSync,
+    pipeline,
+    scoring,
+    skillMatrix,
+    vectorIndex,
+)
+from .conf import get_setting
+from .gmailTool import get_gmail_tool
+from .skillIndex import normalize_skills as _normalize_skills
 from .llmsTool import (
     title_analysis,
     qiuren_detail_analysis,
     qiuanjian_detail_analysis,
 )
 
-# Reuse one Gmail client to avoid repeating OAuth flows.
-gmail_tool = GmailTool()
-
-qiuanjian_message = None
-qiuanjian_jponly_message = None
-qiuanjian_other_message = None
-update_time = None
+# 人员池的时间窗口（天）
+# todo 正式生产环境改回14
+POOL_WINDOW_DAYS = 30
 
 
 def fetch_recent_two_weeks_emails(
@@ -25,38 +33,38 @@ def fetch_recent_two_weeks_emails(
 ) -> List[Dict]:
     """
     Fetch all emails from the past two weeks (inclusive), using the current time as the end point.
+    只负责取信，分类与人员池发布见 candidatePool.refresh。
     """
-    global qiuanjian_message, qiuanjian_jponly_message, qiuanjian_other_message, update_time
-    qiuanjian_message = None
-    qiuanjian_jponly_message = None
-    qiuanjian_other_message = None
-    update_time = None
     end_date = datetime.now().date()
-    # todo 正式生产环境改回14
-    start_date = end_date - timedelta(days=30)
+    start_date = end_date - timedelta(days=POOL_WINDOW_DAYS)
 
-    page = 1
     all_messages: List[Dict] = []
 
-    # todo 记得正式生产环境改回true
-    while page < 2:
-        messages, has_next = gmail_tool.fetch_messages(
-            query=query,
-            page=page,
-            page_size=page_size,
-            start_date=start_date,
-            end_date=end_date,
-            mark_seen=mark_seen,
-        )
-        all_messages.extend(qiuanjian_email_filter(messages))
+    if not query and not mark_seen:
+        # 无检索条件时：先增量同步到本地，再直接从本地存储读取窗口内邮件
+        mailSync.sync_inbox(get_gmail_tool(), start_date=start_date, end_date=end_date)
+        # BPMATCH_POOL_WINDOW_LIMIT：窗口内最多读取的邮件数，0 为不限（开发环境可调小以节省 LLM 调用）
+        limit = int(get_setting("BPMATCH_POOL_WINDOW_LIMIT", 0) or 0)
+        all_messages.extend(mailSync.load_window(start_date, end_date, limit=limit or None))
+    else:
+        page = 1
+        # todo 记得正式生产环境改回true
+        while page < 2:
+            messages, has_next = get_gmail_tool().fetch_messages(
+                query=query,
+                page=page,
+                page_size=page_size,
+                start_date=start_date,
+                end_date=end_date,
+                mark_seen=mark_seen,
+            )
+            all_messages.extend(messages)
 
-        if not has_next:
-            break
-        page += 1
+            if not has_next:
+                break
+            page += 1
 
-    qiuanjian_message = all_messages
-    update_time = datetime.now()
-    return qiuanjian_jponly_message
+    return all_messages
 
 
 def _parse_date(date_str: str):
@@ -78,23 +86,7 @@ def _normalize_str(value, default: str = "") -> str:
         return default
 
 
-def _normalize_skills(skills_raw) -> List[str]:
-    """
-    Normalize skills into lowercased unique list.
-    """
-    if not isinstance(skills_raw, (list, tuple, set)):
-        return []
-    dedup = []
-    seen = set()
-    for skill in skills_raw:
-        skill_str = str(skill).strip().lower()
-        if skill_str and skill_str not in seen:
-            dedup.append(skill_str)
-            seen.add(skill_str)
-    return dedup
-
-
-def fetch_page_emails(
+def _parse_page_params(
     keyword: str = "",
     date_str: str = "",
     start_date_str: str = "",
@@ -102,11 +94,7 @@ def fetch_page_emails(
     page_str: str = "1",
     page_size_str: str = "",
     limit_str: str = "",
-) -> Dict:
-    """
-    Fetch a single page of emails with optional keyword/date filters.
-    """
-
+) -> Dict[str, Any]:
     keyword = _normalize_str(keyword)
     date_str = _normalize_str(date_str)
     start_date_str = _normalize_str(start_date_str)
@@ -134,97 +122,201 @@ def fetch_page_emails(
         start_date = _parse_date(start_date_str)
         end_date = _parse_date(end_date_str)
 
-    query = keyword or ""
+    return {
+        "query": keyword or "",
+        "page": page,
+        "page_size": page_size,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+
+
+def _job_item(m: Dict, include_body: bool = False) -> Dict:
+    """
+    列表用的求人摘要；正文默认不内联，由 /messages/<id>/body 按需获取。
+    """
+    item = {
+        "id": m.get("id") or "",
+        "title": m.get("subject") or "(无标题)",
+        "desc": m.get("from") or "",
+        "date": m.get("date") or "",
+        "type": "0",
+        "thread_id": m.get("thread_id") or "",
+        "message_id_header": m.get("message_id_header") or "",
+        "references_header": m.get("references_header") or "",
+    }
+    if include_body:
+        item["detail"] = m.get("body") or ""
+    return item
+
 
-    messages, has_next = gmail_tool.fetch_messages(
-        query=query,
-        page=page,
-        page_size=page_size,
-        start_date=start_date,
-        end_date=end_date,
+def fetch_page_emails(include_body: bool = False, **kwargs) -> Dict:
+    """
+    Fetch a single page of emails with optional keyword/date filters.
+    参数同 _parse_page_params（keyword/date_str/start_date_str/end_date_str/page_str/page_size_str/limit_str）。
+    include_body=False 时只返回摘要，不拉取正文。
+    """
+    params = _parse_page_params(**kwargs)
+
+    # 两阶段：先只取头信息按标题分类，需要正文时再只为通过的邮件拉取
+    messages, has_next = get_gmail_tool().fetch_messages(
+        query=params["query"],
+        page=params["page"],
+        page_size=params["page_size"],
+        start_date=params["start_date"],
+        end_date=params["end_date"],
+        metadata_only=True,
     )
 
-    items = []
-    for m in messages:
-        if qiuren_email_filter(m.get("subject")):
-            items.append(
-                {
-                    "id": m.get("id") or "",
-                    "title": m.get("subject") or "(无标题)",
-                    "desc": m.get("from") or "",
-                    "detail": m.get("body") or "",
-                    "date": m.get("date") or "",
-                    "type": "0",
-                    "thread_id": m.get("thread_id") or "",
-                    "message_id_header": m.get("message_id_header") or "",
-                    "references_header": m.get("references_header") or "",
-                }
-            )
+    keep_flags = pipeline.map_bounded(
+        lambda m: qiuren_email_filter(m.get("subject")), messages
+    )
+    kept = [m for m, keep in zip(messages, keep_flags) if keep]
+    if include_body:
+        kept = get_gmail_tool().load_bodies(kept)
 
     return {
-        "items": items,
-        "page": page,
-        "page_size": page_size,
+        "items": [_job_item(m, include_body) for m in kept],
+        "page": params["page"],
+        "page_size": params["page_size"],
+        "has_next": has_next,
+    }
+
+
+def iter_page_emails(include_body: bool = False, **kwargs) -> Iterator[Tuple[str, Dict]]:
+    """
+    fetch_page_emails 的流式版本：先产出 ("meta", 分页信息)，
+    之后每封通过标题分类的求人邮件立即产出 ("item", item)（include_body 时先补齐正文）。
+    """
+    params = _parse_page_params(**kwargs)
+    messages, has_next = get_gmail_tool().fetch_messages(
+        query=params["query"],
+        page=params["page"],
+        page_size=params["page_size"],
+        start_date=params["start_date"],
+        end_date=params["end_date"],
+        metadata_only=True,
+    )
+    yield "meta", {
+        "page": params["page"],
+        "page_size": params["page_size"],
         "has_next": has_next,
     }
 
+    def classify(m: Dict) -> Optional[Dict]:
+        if not qiuren_email_filter(m.get("subject")):
+            return None
+        return get_gmail_tool().load_bodies([m])[0] if include_body else m
 
-def qiuanjian_email_filter(emails: List[Dict]) -> List[Dict]:
+    for m in pipeline.iter_bounded(classify, messages):
+        if m is not None:
+            yield "item", _job_item(m, include_body)
+
+
+def get_message(msg_id: str) -> Optional[Dict]:
+    """
+    按 ID 取单封邮件（含正文）：先查人员池快照，再查本地存储，最后才请求 Gmail。
+    """
+    msg_id = _normalize_str(msg_id)
+    if not msg_id:
+        return None
+    cached = candidatePool.get_snapshot().index.get(msg_id)
+    if cached is not None and cached.get("body") is not None:
+        return cached
+    found = get_gmail_tool().fetch_messages_by_ids([msg_id])
+    return found[0] if found else None
+
+
+def qiuanjian_email_filter(emails: List[Dict], known: Iterable[Dict] = ()) -> List[Dict]:
     """
     Classify emails by title using llmsTool.title_analysis and return enriched copies.
+    标题分类与正文抽取以有限并发执行（见 pipeline.map_bounded），结果保持原始顺序。
+    同一发件人的近重复邮件（与 known 中已分类的或本批中更早的一封）不再调用 LLM，直接复用其结果，
+    并与同 thread 的邮件一起标上 dup_group，匹配时折叠为一条。
     """
-    global qiuanjian_jponly_message, qiuanjian_other_message
-    classified: List[Dict] = []
+    known_by_id = {m.get("id"): m for m in known if m.get("id")}
+    dedup_index = dedup.DedupIndex(known_by_id.values())
+    plan: List[Tuple[Dict, Optional[str]]] = []
+    canonical: List[Dict] = []
     for email in emails:
-        subject = email.get("subject") or ""
-        label_raw = title_analysis(subject)
-        try:
-            label = int(str(label_raw).strip())
-        except Exception:
-            label = -1
-
-        if label == 1:  # 仅保留「求案件」类型
-            detail_text = _normalize_str(email.get("body") or email.get("detail") or "")
-            analysis_json: Any
-            try:
-                analysis_raw = (
-                    qiuanjian_detail_analysis(detail_text) if detail_text else ""
-                )
-                try:
-                    analysis_json = json.loads(analysis_raw) if analysis_raw else {}
-                except Exception:
-                    analysis_json = {"raw": analysis_raw}
-            except Exception as exc:
-                print(f"[qiuanjian_email_filter] 解析求案件正文失败: {exc}")
-                analysis_json = {"error": str(exc)}
-
-            extra_fields: Dict[str, Any]
-            if isinstance(analysis_json, dict):
-                extra_fields = analysis_json
+        fp = dedup.fingerprint(email)
+        near, group = dedup_index.find(email, fp)
+        email = {**email, "simhash": fp, "dup_group": group or email.get("id") or ""}
+        email.pop("duplicate_of", None)
+        canonical_id = None
+        if near is not None:
+            # 近重复不具传递性：near 可能是本批中本身也是重复的邮件，沿其 duplicate_of 找到真正被分析的那封
+            canonical_id = near.get("id")
+            if canonical_id not in known_by_id:
+                canonical_id = near.get("duplicate_of") or canonical_id
+            email["duplicate_of"] = canonical_id
+        dedup_index.add(email, fp)
+        plan.append((email, canonical_id))
+        if canonical_id is None:
+            canonical.append(email)
+
+    analyzed = {
+        email.get("id"): result
+        for email, result in zip(
+            canonical, pipeline.map_bounded(_analyze_qiuanjian, canonical)
+        )
+    }
+
+    results: List[Dict] = []
+    for email, canonical_id in plan:
+        if canonical_id is None:
+            to_add = analyzed.get(email.get("id"))
+        else:
+            # known 中的邮件本身就是分类结果；本批中的则取其分析结果（非求案件时为 None，一并丢弃）。
+            # 找不到已分类的来源时丢弃，绝不把未分类的原始邮件并入人员池
+            if canonical_id in analyzed:
+                source = analyzed[canonical_id]
             else:
-                extra_fields = {"analysis_raw": analysis_json}
-
-            to_add = {**email, "type": label, **extra_fields}
-            try:
-                print(
-                    "[qiuanjian_email_filter] 即将添加:",
-                    json.dumps(to_add, ensure_ascii=False),
-                )
-            except Exception as exc:
-                print(f"[qiuanjian_email_filter] 打印对象失败: {exc}")
-
-            country_str = str(to_add.get("country_code", "1")).strip()
-            if country_str == "0":
-                if qiuanjian_jponly_message is None:
-                    qiuanjian_jponly_message = []
-                qiuanjian_jponly_message.append(to_add)
-            if country_str == "1":
-                if qiuanjian_other_message is None:
-                    qiuanjian_other_message = []
-                qiuanjian_other_message.append(to_add)
-
-            classified.append(to_add)
-    return classified
+                source = known_by_id.get(canonical_id)
+            to_add = {**source, **email} if source else None
+            print(
+                f"[qiuanjian_email_filter] {email.get('id')} 与 {canonical_id} 近重复，"
+                f"{'复用其结果' if source else '来源非求案件，跳过'}"
+            )
+        if to_add is not None:
+            results.append(to_add)
+    return results
+
+
+def _analyze_qiuanjian(email: Dict) -> Optional[Dict]:
+    """
+    单封邮件的分类 + 抽取；非「求案件」返回 None。可在工作线程中执行。
+    """
+    subject = email.get("subject") or ""
+    label_raw = title_analysis(subject)
+    try:
+        label = int(str(label_raw).strip())
+    except Exception:
+        label = -1
+
+    if label != 1:  # 仅保留「求案件」类型
+        return None
+
+    detail_text = _normalize_str(email.get("body") or email.get("detail") or "")
+    extra_fields: Dict[str, Any] = {}
+    try:
+        if detail_text:
+            fields = qiuanjian_detail_analysis(detail_text)
+            # 抽取结果直接存规范名，匹配时无需再归一
+            extra_fields = {**fields._asdict(), "skills": _normalize_skills(fields.skills)}
+    except Exception as exc:
+        print(f"[qiuanjian_email_filter] 解析求案件正文失败: {exc}")
+        extra_fields = {"error": str(exc)}
+
+    to_add = {**email, "type": label, **extra_fields}
+    try:
+        print(
+            "[qiuanjian_email_filter] 即将添加:",
+            json.dumps(to_add, ensure_ascii=False),
+        )
+    except Exception as exc:
+        print(f"[qiuanjian_email_filter] 打印对象失败: {exc}")
+    return to_add
 
 
 def qiuren_email_filter(title: str) -> bool:
@@ -244,61 +336,110 @@ def match(job_payload: Dict[str, Any]) -> Dict[str, Any]:
     Analyze a 求人邮件正文，返回分析结果、国籍分支及匹配到的求案件列表。
     """
     detail = _normalize_str(job_payload.get("detail") or job_payload.get("body") or "")
+    if not detail and job_payload.get("id"):
+        # 列表只下发摘要，点击时前端只回传 ID，这里按 ID 补取正文
+        try:
+            message = get_message(job_payload.get("id"))
+        except Exception as exc:
+            print(f"[match] 读取求人正文失败: {exc}")
+            message = None
+        detail = _normalize_str((message or {}).get("body"))
     if not detail:
         print("[match] 求人正文为空，无法分析")
         return {"analysis": "", "error": "empty detail"}
 
-    # 1) 调用 LLM 做正文分析
+    # 1) 调用 LLM 做正文分析（结果已按 schema 校验）
     try:
-        analysis = qiuren_detail_analysis(detail)
+        fields = qiuren_detail_analysis(detail)
+        analysis = llmSchema.dumps(fields)
         print(f"[match] 求人分析结果: {analysis}")
     except Exception as exc:
         print(f"[match] 求人分析异常: {exc}")
         return {"analysis": "", "error": str(exc)}
 
-    # 2) 解析分析结果
-    country = 1
+    # 2) 取出分析结果
+    country = fields.country
+    job_price = fields.price
     matches: List[Dict[str, Any]] = []
-    skills_from_analysis: List[str] = []
-    try:
-        analysis_json = json.loads(analysis)
-        if isinstance(analysis_json, dict):
-            try:
-                country = int(str(analysis_json.get("country", 1)).strip())
-            except Exception:
-                country = 1
-
-            skills_from_analysis = _normalize_skills(analysis_json.get("skills", []))
-
-            if country == 0:
-                print("[match] 国籍=0，走日本籍分支")
-            elif country == 1:
-                print("[match] 国籍=1，走非日本籍分支")
-    except Exception as exc:
-        print(f"[match] 解析 analysis JSON 失败: {exc}")
-
-    # 3) 国籍为日本籍时，按技能匹配求案件列表
-    if skills_from_analysis:
-        if country == 0:
-            source_messages = qiuanjian_jponly_message or []
-        if country == 1:
-            source_messages = qiuanjian_other_message or []
-
-        skills_set = set(skills_from_analysis)
-        for message in source_messages:
-            message_skills = set(_normalize_skills(message.get("skills", [])))
-            overlap = skills_set & message_skills
-            if overlap:
-                matches.append({**message, "matched_skills": sorted(overlap)})
-
-    print(f"analysis: {analysis}, country: {country}, matches: {matches}")
+    total = 0
+    skills_from_analysis = _normalize_skills(fields.skills)
+    if country == 0:
+        print("[match] 国籍=0，走日本籍分支")
+    else:
+        print("[match] 国籍=1，走非日本籍分支")
+
+    page = _parse_positive_int(job_payload.get("page"), 1)
+    page_size = _parse_positive_int(
+        job_payload.get("page_size"), scoring.DEFAULT_PAGE_SIZE
+    )
+
+    # 3) 按国籍分区，通过技能倒排索引与正文向量检索取候选，再加权打分取 Top-K
+    snapshot = candidatePool.get_snapshot()
+    partition = "0" if country == 0 else "1"
+    similarities = _semantic_search(snapshot, detail, partition)
+    # 可选的单价上限（万円）：单价超出的候选人直接排除，而不只是降低得分
+    max_price = job_payload.get("max_price") or 0
+    if skills_from_analysis or similarities:
+        index = snapshot.index
+        if skillMatrix.available():
+            # 位矩阵上一次 AND + popcount 算出全部重叠，国籍/单价为向量化掩码
+            matches, total = scoring.rank_matrix(
+                index,
+                partition,
+                skills_from_analysis,
+                job_price=job_price,
+                page=page,
+                page_size=page_size,
+                similarities=similarities,
+                max_price=max_price,
+            )
+        else:
+            overlaps = index.overlaps(partition, skills_from_analysis)
+            matches, total = scoring.rank(
+                index,
+                partition,
+                overlaps,
+                job_price=job_price,
+                page=page,
+                page_size=page_size,
+                similarities=similarities,
+                max_price=max_price,
+            )
+
+    print(f"analysis: {analysis}, country: {country}, matches: {len(matches)}/{total}")
     return {
         "analysis": analysis,
         "country": country,
         "matches": matches,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "has_next": page * page_size < total,
         "job_skills": skills_from_analysis,
     }
 
 
+def _semantic_search(snapshot, detail: str, partition: str) -> Dict[str, float]:
+    """
+    求人正文向量化后在该国籍分区内做一次相似度检索；未启用或失败时返回空，只按技能匹配。
+    """
+    if snapshot.vectors is None or not vectorIndex.available():
+        return {}
+    try:
+        query = vectorIndex.embed(vectorIndex.embed_text_of({"body": detail}))
+        return snapshot.vectors.search(query, partition, scoring.SEMANTIC_TOP_K)
+    except Exception as exc:
+        print(f"[match] 语义检索失败，只按技能匹配: {exc}")
+        return {}
+
+
+def _parse_positive_int(value, default: int) -> int:
+    try:
+        parsed = int(_normalize_str(value))
+    except ValueError:
+        return default
+    return parsed if parsed > 0 else default
+
+
 if __name__ == "__main__":
-    emails = fetch_recent_two_weeks_emails()
+    candidatePool.refresh()
@@ -0,0 +1,407 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境：只做进程内互斥
+    fcntl = None
+
+from . import vectorIndex
+from .conf import get_setting
+from .skillCanon import canonicalizer
+from .skillIndex import SkillIndex, country_of
+from .vectorIndex import VectorIndex
+
+
+class PoolSnapshot(NamedTuple):
+    """
+    求案件人员池的只读快照。刷新时整体替换，读取方拿到的始终是一份完整、一致的数据。
+    """
+
+    messages: Tuple[Dict, ...]
+    jponly: Tuple[Dict, ...]
+    other: Tuple[Dict, ...]
+    rejected_ids: FrozenSet[str]  # 已判定为非「求案件」的邮件，增量刷新时跳过
+    update_time: Optional[datetime]
+    version: int = 0  # 发布时的版本戳（time_ns），各 worker 据此判断是否需要重新加载
+    index: Optional[SkillIndex] = None  # 技能倒排索引，随快照一起构建
+    vectors: Optional[VectorIndex] = None  # 正文向量索引（语义匹配），与快照 JSON 并列存为 .npy
+
+
+EMPTY_SNAPSHOT = PoolSnapshot((), (), (), frozenset(), None, 0, SkillIndex())
+
+# 快照以文件形式在多个 worker 进程间共享；每个进程只在文件版本变化时重新加载
+_snapshot: PoolSnapshot = EMPTY_SNAPSHOT
+_loaded_stamp: Optional[Tuple[int, int]] = None
+_load_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refreshing = threading.Event()  # 本进程持有刷新锁期间置位
+
+
+def _snapshot_path() -> Path:
+    path = get_setting("BPMATCH_POOL_SNAPSHOT_PATH")
+    if path:
+        return Path(path)
+    return Path(__file__).resolve().parent.parent / "var" / "candidate_pool.json"
+
+
+def _vectors_path(path: Path, version: int) -> Path:
+    return path.with_name(f"{path.stem}.{version}.npy")
+
+
+def _file_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    # os.replace 会换新 inode，(inode, mtime) 足以识别新版本，且只需一次 stat
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def get_snapshot() -> PoolSnapshot:
+    """
+    返回当前快照；共享快照文件有新版本时先惰性重新加载。
+    """
+    global _snapshot, _loaded_stamp
+    path = _snapshot_path()
+    stamp = _file_stamp(path)
+    if stamp is None or stamp == _loaded_stamp:
+        return _snapshot
+
+    with _load_lock:
+        if stamp != _loaded_stamp:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _snapshot = _decode(json.load(f), path)
+                _loaded_stamp = stamp
+            except Exception as exc:
+                print(f"[candidate_pool] 读取共享快照失败，继续使用当前快照: {exc}")
+    return _snapshot
+
+
+@contextmanager
+def _process_lock(blocking: bool):
+    """
+    跨进程刷新锁（lock 文件 + flock），保证同一时间只有一个进程在重建人员池。
+    持有期间另外在 .status 文件上持有排他锁并设置 _refreshing，供 is_refreshing 只读探测。
+    """
+    if not _refresh_lock.acquire(blocking=blocking):
+        yield False
+        return
+    lock_file = None
+    status_file = None
+    try:
+        if fcntl is not None:
+            path = _snapshot_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = open(f"{path}.lock", "a")
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            # 探测方只短暂持有共享锁，这里阻塞等待即可，不会因轮询而放弃刷新
+            status_file = open(_status_path(path), "a")
+            fcntl.flock(status_file, fcntl.LOCK_EX)
+        _refreshing.set()
+        try:
+            yield True
+        finally:
+            _refreshing.clear()
+    finally:
+        if status_file is not None:
+            status_file.close()
+        if lock_file is not None:
+            lock_file.close()
+        _refresh_lock.release()
+
+
+def _status_path(path: Path) -> str:
+    return f"{path}.status"
+
+
+def is_refreshing() -> bool:
+    """
+    是否有进程正在刷新人员池。只读探测，不获取 refresh 所需的锁，轮询不会挤掉用户发起的刷新。
+    """
+    if _refreshing.is_set():
+        return True
+    if fcntl is None:
+        return False
+    try:
+        with open(_status_path(_snapshot_path()), "a") as status_file:
+            fcntl.flock(status_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def build_snapshot(
+    messages: List[Dict],
+    rejected_ids: FrozenSet[str] = frozenset(),
+    index: Optional[SkillIndex] = None,
+    vectors: Optional[VectorIndex] = None,
+) -> PoolSnapshot:
+    """
+    由求案件列表构造快照；未传入增量维护好的 index 时按 messages 全量构建。
+    向量需要调用 embedding 模型，不在这里生成，见 _update_vectors。
+    """
+    jponly = []
+    other = []
+    for m in messages:
+        country_str = country_of(m)
+        if country_str == "0":
+            jponly.append(m)
+        if country_str == "1":
+            other.append(m)
+    return PoolSnapshot(
+        messages=tuple(messages),
+        jponly=tuple(jponly),
+        other=tuple(other),
+        rejected_ids=frozenset(rejected_ids),
+        update_time=datetime.now(),
+        index=index if index is not None else SkillIndex.build(messages),
+        vectors=vectors,
+    )
+
+
+def _encode(snapshot: PoolSnapshot) -> Dict:
+    data = {
+        "version": snapshot.version,
+        "update_time": snapshot.update_time.isoformat() if snapshot.update_time else "",
+        "rejected_ids": sorted(snapshot.rejected_ids),
+        "messages": list(snapshot.messages),
+    }
+    if snapshot.vectors is not None:
+        data["vectors"] = {
+            "model": snapshot.vectors.model,
+            "ids": snapshot.vectors.ids,
+            "partitions": snapshot.vectors.partitions.tolist(),
+        }
+    return data
+
+
+def _decode(data: Dict, path: Path) -> PoolSnapshot:
+    update_time = data.get("update_time") or ""
+    version = int(data.get("version") or 0)
+    snapshot = build_snapshot(
+        data.get("messages") or [], frozenset(data.get("rejected_ids") or [])
+    )
+    vectors = None
+    meta = data.get("vectors")
+    if meta and vectorIndex.available():
+        try:
+            vectors = VectorIndex.load(
+                _vectors_path(path, version), meta["ids"], meta["partitions"], meta["model"]
+            )
+        except Exception as exc:
+            print(f"[candidate_pool] 读取向量文件失败，本次只按技能匹配: {exc}")
+    return snapshot._replace(
+        update_time=datetime.fromisoformat(update_time) if update_time else None,
+        version=version,
+        vectors=vectors,
+    )
+
+
+def publish(snapshot: PoolSnapshot):
+    """
+    原子发布快照：写临时文件后 os.replace 到共享路径，其他 worker 读到的要么是旧版本要么是完整的新版本。
+    向量文件按版本号命名，先于 JSON 写入，因此 JSON 引用的向量文件总是已经存在。
+    """
+    global _snapshot, _loaded_stamp
+    snapshot = snapshot._replace(version=time.time_ns())
+    path = _snapshot_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if snapshot.vectors is not None:
+        snapshot.vectors.save(_vectors_path(path, snapshot.version))
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_encode(snapshot), f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    with _load_lock:
+        _snapshot = snapshot
+        _loaded_stamp = _file_stamp(path)
+    _prune_vectors(path)
+
+
+def _prune_vectors(path: Path, keep: int = 2):
+    """
+    只保留最新的几个向量文件；其他 worker 已 mmap 的旧文件删除后映射仍然有效。
+    """
+
+    def version_of(file: Path) -> int:
+        suffix = file.stem.rsplit(".", 1)[-1]
+        return int(suffix) if suffix.isdigit() else 0
+
+    files = sorted(path.parent.glob(f"{path.stem}.*.npy"), key=version_of)
+    for old in files[:-keep]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+
+
+def _update_vectors(
+    previous: PoolSnapshot, messages: List[Dict]
+) -> Optional[VectorIndex]:
+    """
+    只为上一份快照中没有向量的候选人调用 embedding 模型，其余复用；未启用语义匹配时返回 None。
+    """
+    if not vectorIndex.available():
+        return None
+    known = previous.vectors
+    if known is not None and known.model != vectorIndex.embed_model():
+        known = None
+    missing = [m for m in messages if known is None or m.get("id") not in known]
+    try:
+        vectors = vectorIndex.embed_messages(missing)
+    except Exception as exc:
+        print(f"[candidate_pool] 正文向量化失败，本次只按技能匹配: {exc}")
+        vectors = {}
+    return vectorIndex.build(messages, vectors, known)
+
+
+def refresh() -> Optional[PoolSnapshot]:
+    """
+    增量重建人员池并发布新快照：已在上一份快照中分类过的邮件直接复用，只对新邮件调用 LLM。
+    任一进程已有刷新在进行时直接返回 None；失败时保留上一份快照。
+    """
+    with _process_lock(blocking=False) as acquired:
+        if not acquired:
+            return None
+        return _refresh()
+
+
+def _refresh() -> PoolSnapshot:
+    try:
+        from . import bpmatch
+
+        previous = get_snapshot()
+        known = {m.get("id"): m for m in previous.messages if m.get("id")}
+
+        emails = bpmatch.fetch_recent_two_weeks_emails()
+        new_emails = [
+            e
+            for e in emails
+            if e.get("id") not in known and e.get("id") not in previous.rejected_ids
+        ]
+        classified_new = {
+            m.get("id"): m
+            for m in bpmatch.qiuanjian_email_filter(new_emails, known.values())
+        }
+
+        messages: List[Dict] = []
+        rejected = set()
+        for e in emails:
+            msg_id = e.get("id")
+            if msg_id in known:
+                messages.append(known[msg_id])
+            elif msg_id in classified_new:
+                messages.append(classified_new[msg_id])
+            elif msg_id:
+                rejected.add(msg_id)
+
+        # 在上一份索引的副本上增量维护：移除滑出窗口的候选人，加入新分类的候选人
+        # 同义词表升级后旧索引的规范名已失效，整体重建
+        if previous.index is None or previous.index.canon_version != canonicalizer.version:
+            index = SkillIndex.build(messages)
+        else:
+            index = previous.index.copy()
+            current_ids = {m.get("id") for m in messages}
+            for msg_id in list(known):
+                if msg_id not in current_ids:
+                    index.remove(msg_id)
+            for m in classified_new.values():
+                index.add(m)
+
+        vectors = _update_vectors(previous, messages)
+        snapshot = build_snapshot(messages, frozenset(rejected), index, vectors)
+        publish(snapshot)
+        print(
+            f"[candidate_pool] 刷新完成：共 {len(messages)} 人，新增分类 {len(new_emails)} 封"
+        )
+        return snapshot
+    except Exception as exc:
+        print(f"[candidate_pool] 刷新失败，保留上一份快照: {exc}")
+        raise
+
+
+def ingest(emails: List[Dict]) -> Optional[PoolSnapshot]:
+    """
+    把新到达的邮件（推送通知触发的增量同步结果）直接分类并并入当前快照，不重新列出时间窗口。
+    等待进行中的刷新结束后执行；没有需要分类的邮件时返回 None。
+    """
+    with _process_lock(blocking=True) as acquired:
+        if not acquired:
+            return None
+        from . import bpmatch
+
+        previous = get_snapshot()
+        known = {m.get("id") for m in previous.messages}
+        new_emails = [
+            e
+            for e in emails
+            if e.get("id")
+            and e.get("id") not in known
+            and e.get("id") not in previous.rejected_ids
+        ]
+        if not new_emails:
+            return None
+
+        classified = bpmatch.qiuanjian_email_filter(new_emails, previous.messages)
+        classified_ids = {m.get("id") for m in classified}
+        rejected = previous.rejected_ids | {
+            e.get("id") for e in new_emails if e.get("id") not in classified_ids
+        }
+
+        if previous.index is None or previous.index.canon_version != canonicalizer.version:
+            index = None  # build_snapshot 全量重建
+        else:
+            index = previous.index.copy()
+            for m in classified:
+                index.add(m)
+
+        # 快照按接收时间倒序，新邮件排在最前
+        messages = sorted(
+            classified, key=lambda m: m.get("internal_ts") or 0, reverse=True
+        ) + list(previous.messages)
+        vectors = _update_vectors(previous, messages)
+        snapshot = build_snapshot(messages, frozenset(rejected), index, vectors)
+        publish(snapshot)
+        print(
+            f"[candidate_pool] 增量并入 {len(new_emails)} 封，新增候选人 {len(classified)} 人"
+        )
+        return snapshot
+
+
+def refresh_async() -> bool:
+    """
+    在后台线程中刷新人员池，立即返回；已有刷新在进行时不重复启动。
+    """
+    if is_refreshing():
+        return False
+
+    def run():
+        from django.db import connections
+
+        try:
+            refresh()
+        except Exception:
+            pass
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, name="bpmatch-pool-refresh", daemon=True).start()
+    return True
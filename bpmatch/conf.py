@@ -0,0 +1,10 @@
+def get_setting(name: str, default=None):
+    """
+    读取 Django settings 中的 BPMATCH_* 配置；未配置 Django（脚本单独运行）时返回默认值。
+    """
+    try:
+        from django.conf import settings
+
+        return getattr(settings, name, default)
+    except Exception:
+        return default
@@ -0,0 +1,96 @@
+import hashlib
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from email.utils import parseaddr
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SHINGLE_SIZE = 3  # 字符 3-gram：日文无需分词
+# 汉明距离不超过该值视为近重复（64 位指纹）
+NEAR_DUP_DISTANCE = 3
+
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*>.*$", re.MULTILINE)
+_SPACE_RE = re.compile(r"\s+")
+# 每个字节值置位的 bit 下标，按字节统计后一次性累加到 64 个 bit 上
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _QUOTED_LINE_RE.sub("", text)  # 回复中引用的原文不参与指纹
+    return _SPACE_RE.sub("", text).lower()
+
+
+def simhash(text: str) -> int:
+    """
+    正文的 64 位 SimHash（字符 3-gram，不加权）。指纹需跨进程稳定，故用 blake2b 而非内置 hash。
+    """
+    norm = _normalize(text)
+    if not norm:
+        return 0
+    shingles = {norm[i : i + SHINGLE_SIZE] for i in range(max(len(norm) - SHINGLE_SIZE + 1, 1))}
+    digests = [
+        hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles
+    ]
+    ones = [0] * 64
+    for pos in range(8):
+        for value, count in Counter(d[pos] for d in digests).items():
+            for bit in _BYTE_BITS[value]:
+                ones[pos * 8 + bit] += count
+    half = len(digests) / 2
+    return sum(1 << i for i, n in enumerate(ones) if n > half)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def sender_key(message: Dict) -> str:
+    raw = message.get("from") or ""
+    return (parseaddr(raw)[1] or raw).strip().lower()
+
+
+def fingerprint(message: Dict) -> int:
+    value = message.get("simhash")
+    if isinstance(value, int):
+        return value
+    return simhash(message.get("body") or message.get("detail") or "")
+
+
+class DedupIndex:
+    """
+    同一发件人的邮件按两种关系归并：
+    - 同一 thread_id：视为同一候选人的往来，匹配结果中折叠为一条；
+    - 正文 SimHash 近重复：除折叠外，还直接复用先到邮件（canonical）的抽取结果，不再调用 LLM。
+    """
+
+    def __init__(self, messages: Iterable[Dict] = ()):
+        self._by_sender: Dict[str, List[Tuple[int, Dict]]] = defaultdict(list)
+        for m in messages:
+            self.add(m)
+
+    def add(self, message: Dict, fp: Optional[int] = None):
+        key = sender_key(message)
+        if key:
+            self._by_sender[key].append(
+                (fingerprint(message) if fp is None else fp, message)
+            )
+
+    def find(self, message: Dict, fp: int) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        返回 (近重复的 canonical 邮件或 None, 所属折叠分组或 None)。
+        """
+        thread_id = message.get("thread_id") or ""
+        group = None
+        for other_fp, other in self._by_sender.get(sender_key(message), ()):
+            near = fp and other_fp and hamming(fp, other_fp) <= NEAR_DUP_DISTANCE
+            same_thread = thread_id and thread_id == other.get("thread_id")
+            if near or same_thread:
+                group = group or group_of(other)
+            if near:
+                return other, group
+        return None, group
+
+
+def group_of(message: Dict) -> str:
+    return message.get("dup_group") or message.get("id") or ""
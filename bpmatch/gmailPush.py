@@ -0,0 +1,160 @@
+import base64
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional
+
+from .conf import get_setting
+
+
+class PushNotification(NamedTuple):
+    """
+    Gmail users.watch 推送的内容：哪个邮箱、变化后的 historyId。
+    """
+
+    email_address: str
+    history_id: int
+
+
+class PushError(ValueError):
+    """
+    推送请求体无法解析。
+    """
+
+
+def _notification_from(data: Dict) -> PushNotification:
+    try:
+        history_id = int(data.get("historyId") or 0)
+    except (TypeError, ValueError):
+        raise PushError("historyId 不是整数")
+    if history_id <= 0:
+        raise PushError("缺少 historyId")
+    return PushNotification(str(data.get("emailAddress") or ""), history_id)
+
+
+def pubsub_transport(body: bytes) -> PushNotification:
+    """
+    Pub/Sub push 订阅的信封：{"message": {"data": base64(JSON), "messageId": ...}, "subscription": ...}。
+    """
+    try:
+        envelope = json.loads(body or b"{}")
+        data = base64.b64decode((envelope.get("message") or {}).get("data") or "")
+        return _notification_from(json.loads(data or b"{}"))
+    except PushError:
+        raise
+    except Exception as exc:
+        raise PushError(f"Pub/Sub 信封格式错误: {exc}")
+
+
+def local_transport(body: bytes) -> PushNotification:
+    """
+    本地替身/测试用：直接 POST {"emailAddress": ..., "historyId": ...}，不经过 Pub/Sub。
+    """
+    try:
+        return _notification_from(json.loads(body or b"{}"))
+    except PushError:
+        raise
+    except Exception as exc:
+        raise PushError(f"JSON 格式错误: {exc}")
+
+
+TRANSPORTS: Dict[str, Callable[[bytes], PushNotification]] = {
+    "pubsub": pubsub_transport,
+    "local": local_transport,
+}
+
+
+def get_transport(name: Optional[str] = None) -> Callable[[bytes], PushNotification]:
+    """
+    按名称（TRANSPORTS 中注册的）或点分路径取得解码函数，默认读取 BPMATCH_GMAIL_PUSH_TRANSPORT。
+    """
+    name = name or get_setting("BPMATCH_GMAIL_PUSH_TRANSPORT", "pubsub")
+    if name in TRANSPORTS:
+        return TRANSPORTS[name]
+    from django.utils.module_loading import import_string
+
+    return import_string(name)
+
+
+def make_envelope(notification: PushNotification, message_id: str = "") -> Dict:
+    """
+    按 Pub/Sub 的格式打包一条通知，供本地替身向推送端点投递。
+    """
+    data = json.dumps(
+        {"emailAddress": notification.email_address, "historyId": notification.history_id}
+    ).encode("utf-8")
+    return {
+        "message": {
+            "data": base64.b64encode(data).decode("ascii"),
+            "messageId": message_id or str(notification.history_id),
+        },
+        "subscription": "local-standin",
+    }
+
+
+class PushDispatcher:
+    """
+    推送端点必须尽快应答（Pub/Sub 超时会重投），实际同步交给后台线程。
+    同步进行中到达的通知只记下最大的 historyId，当前一轮结束后再合并执行一次。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._worker: Optional[threading.Thread] = None
+
+    def notify(self, notification: PushNotification) -> bool:
+        """
+        记下通知并确保后台线程在运行；返回是否新启动了线程。
+        """
+        with self._lock:
+            self._pending = max(self._pending, notification.history_id)
+            if self._worker is not None and self._worker.is_alive():
+                return False
+            self._worker = threading.Thread(
+                target=self._drain, name="bpmatch-gmail-push", daemon=True
+            )
+            self._worker.start()
+            return True
+
+    def _drain(self):
+        from django.db import connections
+
+        try:
+            while True:
+                with self._lock:
+                    target = self._pending
+                    self._pending = 0
+                    if not target:
+                        self._worker = None
+                        return
+                try:
+                    sync_to(target)
+                except Exception as exc:
+                    print(f"[gmail_push] 增量同步失败: {exc}")
+        finally:
+            connections.close_all()
+
+
+def sync_to(history_id: int):
+    """
+    同步到 history_id：本地游标已不落后时跳过（重复/乱序投递），
+    否则 history.list 增量拉取新邮件，再直接分类并入人员池。
+    """
+    from . import bpmatch, candidatePool, mailSync
+    from .gmailTool import get_gmail_tool
+    from .models import GmailSyncState
+
+    state = GmailSyncState.objects.filter(name=mailSync.SYNC_STATE_NAME).first()
+    if state is not None and state.history_id >= history_id:
+        return
+
+    # 首次同步（尚无 historyId）时退回窗口全量，与人员池刷新的窗口一致
+    start_date = datetime.now().date() - timedelta(days=bpmatch.POOL_WINDOW_DAYS)
+    gmail_tool = get_gmail_tool()
+    new_ids = mailSync.sync_inbox(gmail_tool, start_date=start_date, force=True)
+    if new_ids:
+        candidatePool.ingest(gmail_tool.fetch_messages_by_ids(new_ids))
+
+
+dispatcher = PushDispatcher()
@@ -1,11 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional, Tuple
-import re
 import base64
 import os.path
+import queue
+import threading
+import time
+import weakref
 from pathlib import Path
-from html import unescape
-from html.parser import HTMLParser
 import json
 
 from email.message import EmailMessage
@@ -14,7 +16,23 @@ from django.utils import timezone as dj_timezone
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+
+from .mimeText import extract_text
+from .pageTokenCache import page_tokens
+
+
+class _ServiceLease:
+    """
+    当前线程借用的 service；随 thread-local 一起回收时把 service 归还空闲池。
+    """
+
+    __slots__ = ("service", "__weakref__")
+
+    def __init__(self, service):
+        self.service = service
 
 
 class GmailTool:
@@ -25,16 +43,107 @@ class GmailTool:
     # 需要的 scope：读写+标记已读
     SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
     BATCH_LIMIT = 100  # Gmail batch API 限制：单批最多100个请求
+    # 增量同步只收收件箱：发件箱、草稿、垃圾邮件等新增的邮件都不入库
+    SYNC_LABEL = "INBOX"
+    # metadata 模式只取列表展示与分类需要的头
+    METADATA_HEADERS = ["Subject", "From", "To", "Date", "Message-ID", "References", "Received"]
+
+    PREFETCH_TTL = 120  # 预取的下一页 list 结果有效期（秒）
+    PREFETCH_WAIT = 2  # 命中仍在进行中的预取时最多等待的秒数，超时直接请求
+    SERVICE_POOL_SIZE = 8  # 空闲 service 池上限
+    # access token 剩余有效期不足该值时提前刷新，避免请求中途过期、多个线程同时刷新
+    TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+    # discovery 文档只读取一次，进程内所有 service 共用
+    _discovery_doc: Optional[str] = None
+    _discovery_lock = threading.Lock()
+
+    def __init__(self, prefetch: bool = True):
+        self._creds = self._load_credentials()
+        self._creds_lock = threading.Lock()
+        # httplib2 非线程安全：每个线程独占一个 service（及其 keep-alive 连接）。
+        # 线程结束时 service 归还到有界空闲池，每请求一个线程的服务器上新线程也能复用已有连接
+        self._local = threading.local()
+        self._idle_services: queue.LifoQueue = queue.LifoQueue(maxsize=self.SERVICE_POOL_SIZE)
+        self._prefetch_enabled = prefetch
+        self._prefetch_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="gmail-prefetch"
+        )
+        self._prefetched: dict = {}
+        self._prefetch_lock = threading.Lock()
+        # 构造时即在当前线程建好 service，凭据问题尽早暴露
+        self.service
+
+    @property
+    def service(self):
+        self._ensure_fresh_token()
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            lease = self._local.lease = _ServiceLease(self._checkout_service())
+            # 线程退出后 thread-local 被回收，触发归还
+            weakref.finalize(lease, self._checkin_service, lease.service)
+        return lease.service
+
+    def _checkout_service(self):
+        try:
+            return self._idle_services.get_nowait()
+        except queue.Empty:
+            return self._build_service()
+
+    def _checkin_service(self, service):
+        try:
+            self._idle_services.put_nowait(service)
+        except queue.Full:
+            pass  # 池已满，丢弃该 service（连接随之关闭）
 
-    def __init__(self):
-        self.service = self._build_service()
+    def _ensure_fresh_token(self):
+        """
+        各线程的 service 共用同一个 Credentials；临近过期时在锁内刷新一次并写回 token.json。
+        """
+        creds = self._creds
+
+        def fresh() -> bool:
+            # google-auth 的 expiry 是 naive UTC
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            return creds.expiry is None or creds.expiry - now > self.TOKEN_REFRESH_MARGIN
+
+        if not getattr(creds, "refresh_token", None) or fresh():
+            return
+        with self._creds_lock:
+            if fresh():
+                return  # 其他线程已刷新
+            try:
+                creds.refresh(Request())
+                self._token_path().write_text(creds.to_json())
+            except Exception as exc:
+                # 刷新失败时保持原凭据，真正过期后由 google-auth 在请求时再刷新
+                print(f"[gmail] 提前刷新 token 失败: {exc}")
+
+    @classmethod
+    def _get_discovery_doc(cls) -> Optional[str]:
+        if cls._discovery_doc is None:
+            with cls._discovery_lock:
+                if cls._discovery_doc is None:
+                    cls._discovery_doc = get_static_doc("gmail", "v1") or ""
+        return cls._discovery_doc or None
 
     def _build_service(self):
+        # build() 每次都会查找并读取 discovery 文档；这里缓存文档文本直接构建。
+        # 传文本而非解析后的 dict：build_from_document 会改写传入的文档，不能跨线程共用
+        doc = self._get_discovery_doc()
+        if doc is None:
+            return build("gmail", "v1", credentials=self._creds)
+        return build_from_document(doc, credentials=self._creds)
+
+    @staticmethod
+    def _token_path() -> Path:
+        return Path(__file__).resolve().parent.parent / "token.json"
+
+    def _load_credentials(self):
         creds = None
         # Use absolute paths so Django working dir changes won't break token/credentials lookup.
-        base_dir = Path(__file__).resolve().parent.parent
-        token_path = base_dir / "token.json"
-        credentials_path = base_dir / "credentials.json"
+        token_path = self._token_path()
+        credentials_path = token_path.with_name("credentials.json")
 
         if token_path.exists():
             creds = Credentials.from_authorized_user_file(token_path, self.SCOPES)
@@ -55,7 +164,7 @@ class GmailTool:
             with open(token_path, "w") as token:
                 token.write(creds.to_json())
 
-        return build("gmail", "v1", credentials=creds)
+        return creds
 
     def fetch_messages(
         self,
@@ -65,52 +174,327 @@ class GmailTool:
         mark_seen: bool = False,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
+        metadata_only: bool = False,
     ) -> Tuple[List[dict], bool]:
         """
         从 Gmail 获取邮件列表（按时间倒序）。分页返回指定页的数据以及是否存在下一页。
+        metadata_only=True 时只取头信息（body 为空，body_loaded=False），正文用 load_bodies 按需补齐。
         """
         service = self.service
         # 构造包含时间范围的 Gmail 查询字符串
         final_query = self._compose_query(query, start_date, end_date)
 
-        current_token: Optional[str] = None
+        try:
+            resp, current_token = self._advance_to_page(final_query, page_size, page)
+        except HttpError as exc:
+            # 缓存的 pageToken 被 Gmail 拒绝（过期等）时，清掉该查询的缓存从第 1 页重走
+            if exc.resp.status != 400:
+                raise
+            page_tokens.invalidate(final_query)
+            resp, current_token = self._advance_to_page(final_query, page_size, page)
+
+        if not resp:
+            return [], False
+
+        ids = self._extract_ids(resp)
+        if not ids:
+            return [], False
+
+        # 当前页渲染期间，后台预取下一页的 list 结果和邮件详情
+        if self._prefetch_enabled and current_token:
+            self._prefetch_next(
+                final_query, page_size, current_token, with_details=not metadata_only
+            )
+
+        # 目标页邮件详情：优先读本地 inbound_emails，只对未见过的 ID 批量拉取
+        if metadata_only:
+            page_messages = self.fetch_metadata_by_ids(ids)
+        else:
+            page_messages = self.fetch_messages_by_ids(ids)
+        has_next = resp.get("nextPageToken") is not None
+
+        # 如需标记已读，批量移除 UNREAD 标签
+        if mark_seen and page_messages:
+            self._mark_seen(service, page_messages)
+
+        return page_messages, has_next
+
+    def _advance_to_page(
+        self, final_query: str, page_size: int, page: int
+    ) -> Tuple[Optional[dict], Optional[str]]:
+        """
+        从最近一个已缓存 pageToken 的页开始逐页前进到目标页，沿途缓存每页的 pageToken。
+        返回 (目标页的 list 结果, 下一页 token)。
+        """
+        start_page, current_token = page_tokens.lookup(final_query, page_size, page)
         resp: Optional[dict] = None
 
-        # 逐页前进到目标页，只对目标页的 ID 拉详情
-        for idx in range(page):
+        for current_page in range(start_page, page + 1):
+            resp = self._list_page(final_query, page_size, current_token)
+            if current_page == 1:
+                page_tokens.observe_head(final_query, resp)
+            current_token = resp.get("nextPageToken")
+            if current_token:
+                page_tokens.store(final_query, page_size, current_page + 1, current_token)
+            # 已经到达最后一页但仍未到目标页，提前结束
+            if current_token is None and current_page < page:
+                break
+
+        return resp, current_token
+
+    def _list_page(
+        self, final_query: str, page_size: int, page_token: Optional[str]
+    ) -> dict:
+        """
+        messages.list 单页；命中预取（含仍在进行中的预取）时直接复用，每条预取结果只消费一次。
+        """
+        key = (final_query, page_size, page_token)
+        with self._prefetch_lock:
+            cached = self._prefetched.pop(key, None)
+        if cached is not None:
+            started_at, future = cached
+            if time.monotonic() - started_at < self.PREFETCH_TTL:
+                # 预取卡住时不能拖住用户请求：只短暂等待，之后直接请求
+                try:
+                    return future.result(timeout=self.PREFETCH_WAIT)
+                except Exception as exc:
+                    print(f"[gmail] 预取结果不可用，重新请求: {exc!r}")
+
+        return self._request_list(final_query, page_size, page_token)
+
+    def _request_list(
+        self, final_query: str, page_size: int, page_token: Optional[str]
+    ) -> dict:
+        return (
+            self.service.users()
+            .messages()
+            .list(
+                userId="me",
+                q=final_query,
+                maxResults=page_size,
+                pageToken=page_token,
+            )
+            .execute()
+        )
+
+    def _prefetch_next(
+        self,
+        final_query: str,
+        page_size: int,
+        page_token: str,
+        with_details: bool = True,
+    ):
+        key = (final_query, page_size, page_token)
+        now = time.monotonic()
+        with self._prefetch_lock:
+            # 清理过期条目，防止无人翻页时无限增长
+            for stale in [
+                k for k, (ts, _) in self._prefetched.items() if now - ts >= self.PREFETCH_TTL
+            ]:
+                del self._prefetched[stale]
+            if key in self._prefetched:
+                return
+
+            def run() -> dict:
+                resp = self._request_list(final_query, page_size, page_token)
+                # 详情写入 inbound_emails，翻到下一页时直接从本地读取（metadata 模式不预取正文）
+                if with_details:
+                    self._prefetch_executor.submit(self._prefetch_details, resp)
+                return resp
+
+            self._prefetched[key] = (now, self._prefetch_executor.submit(run))
+
+    def _prefetch_details(self, resp: dict):
+        try:
+            self.fetch_messages_by_ids(self._extract_ids(resp))
+        except Exception as exc:
+            print(f"[gmail] 预取邮件详情失败: {exc}")
+        finally:
+            self._close_db_connections()
+
+    @staticmethod
+    def _close_db_connections():
+        try:
+            from django.db import connections
+
+            connections.close_all()
+        except Exception:
+            pass
+
+    def fetch_messages_by_ids(self, ids: List[str]) -> List[dict]:
+        """
+        按 Gmail message id 取邮件详情（保持 ids 顺序）。已存入本地的直接返回，
+        其余通过 batch 拉取 format=full 并写入本地存储。
+        """
+        if not ids:
+            return []
+
+        stored = self._load_stored_messages(ids)
+        missing = [msg_id for msg_id in ids if msg_id not in stored]
+        if missing:
+            details = self._fetch_details(self.service, missing)
+            fetched = [self._parse_message(msg) for msg in details]
+            self._persist_inbound(fetched)
+            for m in fetched:
+                stored[m.get("id")] = m
+
+        return [stored[msg_id] for msg_id in ids if msg_id in stored]
+
+    def fetch_metadata_by_ids(self, ids: List[str]) -> List[dict]:
+        """
+        只取头信息：本地已有的直接返回完整邮件，其余 batch 拉取 format=metadata（不落库）。
+        """
+        if not ids:
+            return []
+
+        stored = self._load_stored_messages(ids)
+        missing = [msg_id for msg_id in ids if msg_id not in stored]
+        if missing:
+            for msg in self._fetch_details(self.service, missing, metadata_only=True):
+                parsed = self._parse_message(msg, with_body=False)
+                stored[parsed.get("id")] = parsed
+
+        return [stored[msg_id] for msg_id in ids if msg_id in stored]
+
+    def load_bodies(self, messages: List[dict]) -> List[dict]:
+        """
+        为 metadata 模式取得的邮件补齐正文（format=full，写入本地存储），保持顺序。
+        """
+        pending = [m.get("id") for m in messages if m.get("body_loaded") is False]
+        if not pending:
+            return messages
+        full = {m.get("id"): m for m in self.fetch_messages_by_ids(pending)}
+        return [full.get(m.get("id"), m) for m in messages]
+
+    def list_message_ids(
+        self,
+        query: str = "",
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        max_ids: Optional[int] = None,
+        label_ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        只列出符合条件的邮件 ID（按时间倒序），不拉详情。label_ids 指定时只列出同时带这些标签的邮件。
+        """
+        service = self.service
+        final_query = self._compose_query(query, start_date, end_date)
+        ids: List[str] = []
+        page_token: Optional[str] = None
+        while True:
             resp = (
                 service.users()
                 .messages()
                 .list(
                     userId="me",
                     q=final_query,
-                    maxResults=page_size,
-                    pageToken=current_token,
+                    labelIds=label_ids,
+                    maxResults=500,
+                    pageToken=page_token,
                 )
                 .execute()
             )
-            current_token = resp.get("nextPageToken")
-            # 已经到达最后一页但仍未到目标页，提前结束
-            if current_token is None and idx < page - 1:
+            ids.extend(self._extract_ids(resp))
+            page_token = resp.get("nextPageToken")
+            if not page_token or (max_ids and len(ids) >= max_ids):
                 break
+        return ids[:max_ids] if max_ids else ids
 
-        if not resp:
-            return [], False
+    def get_history_id(self) -> int:
+        """
+        当前邮箱最新的 historyId，用作增量同步的起点。
+        """
+        profile = self.service.users().getProfile(userId="me").execute()
+        return int(profile.get("historyId") or 0)
 
-        ids = self._extract_ids(resp)
-        if not ids:
-            return [], False
+    def watch(self, topic_name: str, label_ids: Optional[List[str]] = None) -> dict:
+        """
+        注册 users.watch：邮箱有变化时 Gmail 向 Pub/Sub topic 推送 {emailAddress, historyId}。
+        有效期 7 天，需定期重新注册（见 gmail_watch 命令）。返回 {historyId, expiration}。
+        """
+        body = {"topicName": topic_name, "labelFilterBehavior": "INCLUDE"}
+        body["labelIds"] = label_ids or ["INBOX"]
+        return self.service.users().watch(userId="me", body=body).execute()
 
-        # 批量拉取目标页邮件详情
-        details = self._fetch_details(service, ids)
-        page_messages = [self._parse_message(msg) for msg in details]
-        has_next = resp.get("nextPageToken") is not None
+    def stop_watch(self):
+        self.service.users().stop(userId="me").execute()
 
-        # 如需标记已读，批量移除 UNREAD 标签
-        if mark_seen and page_messages:
-            self._mark_seen(service, page_messages)
+    def list_history(self, start_history_id: int) -> Tuple[List[str], int]:
+        """
+        通过 history.list 获取 start_history_id 之后新增到收件箱的邮件 ID。
+        返回 (新增 ID 列表, 最新 historyId)。historyId 过期时 Gmail 返回 404，由调用方处理。
+        """
+        service = self.service
+        added: List[str] = []
+        seen = set()
+        latest = start_history_id
+        page_token: Optional[str] = None
+        while True:
+            resp = (
+                service.users()
+                .history()
+                .list(
+                    userId="me",
+                    startHistoryId=str(start_history_id),
+                    historyTypes=["messageAdded"],
+                    labelId=self.SYNC_LABEL,
+                    pageToken=page_token,
+                )
+                .execute()
+            )
+            for record in resp.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    msg = item.get("message") or {}
+                    msg_id = msg.get("id")
+                    labels = set(msg.get("labelIds") or [])
+                    # 再按消息自身的标签确认一次，labelIds 缺失的记录同样跳过
+                    if not msg_id or msg_id in seen or self.SYNC_LABEL not in labels:
+                        continue
+                    seen.add(msg_id)
+                    added.append(msg_id)
+            latest = max(latest, int(resp.get("historyId") or 0))
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                break
+        # history 按时间正序返回，这里与 messages.list 一致改为倒序
+        added.reverse()
+        return added, latest
 
-        return page_messages, has_next
+    def _load_stored_messages(self, ids: List[str]) -> dict:
+        """
+        从 inbound_emails 读取已缓存的邮件；ORM 不可用时返回空，退回 Gmail 拉取。
+        """
+        try:
+            from .models import InboundEmail
+        except Exception:
+            return {}
+
+        try:
+            rows = InboundEmail.objects.filter(gmail_id__in=ids)
+            return {row.gmail_id: row.to_message() for row in rows}
+        except Exception as exc:
+            print(f"[gmail] 读取本地邮件失败: {exc}")
+            return {}
+
+    def _persist_inbound(self, messages: List[dict]):
+        """
+        将新拉取的邮件写入 inbound_emails；写入失败不影响主流程。
+        """
+        if not messages:
+            return
+
+        try:
+            from .models import InboundEmail
+        except Exception:
+            return
+
+        try:
+            InboundEmail.objects.bulk_create(
+                [InboundEmail.from_message(m) for m in messages if m.get("id")],
+                ignore_conflicts=True,
+            )
+        except Exception as exc:
+            print(f"[gmail] 保存收件失败: {exc}")
 
     def _compose_query(
         self, query: str, start_date: Optional[date], end_date: Optional[date]
@@ -126,8 +510,15 @@ class GmailTool:
     def _extract_ids(self, resp: dict) -> List[str]:
         return [item.get("id") for item in resp.get("messages", []) if item.get("id")]
 
-    def _fetch_details(self, service, ids: List[str]) -> List[dict]:
+    def _fetch_details(
+        self, service, ids: List[str], metadata_only: bool = False
+    ) -> List[dict]:
         detail_items: List[dict] = []
+        get_kwargs = (
+            {"format": "metadata", "metadataHeaders": self.METADATA_HEADERS}
+            if metadata_only
+            else {"format": "full"}
+        )
 
         def handle_detail(_, response, exception):
             if exception:
@@ -143,14 +534,14 @@ class GmailTool:
                     .get(
                         userId="me",
                         id=msg_id,
-                        format="full",
+                        **get_kwargs,
                     ),
                     callback=handle_detail,
                 )
             batch.execute()
         return detail_items
 
-    def _parse_message(self, msg: dict) -> dict:
+    def _parse_message(self, msg: dict, with_body: bool = True) -> dict:
         headers = msg.get("payload", {}).get("headers", [])
 
         header_map = {}
@@ -177,7 +568,7 @@ class GmailTool:
         internal_ts_ms = msg.get("internalDate")  # 接收时间（毫秒）
         received_headers = get_header_list("Received")
 
-        body_text = self._extract_text_from_gmail_msg(msg)
+        body_text = self._extract_text_from_gmail_msg(msg) if with_body else ""
 
         iso_ts, ts_float = self._parse_dates(
             received_headers, date_header, internal_ts_ms
@@ -191,10 +582,12 @@ class GmailTool:
             "date": iso_ts or date_header or "",  # 前端显示使用 ISO，缺失则原始
             "date_header": date_header,
             "thread_id": msg.get("threadId"),
+            "label_ids": msg.get("labelIds") or [],
             "message_id_header": message_id_header,
             "references_header": references_header,
             "internal_ts": ts_float,
             "body": body_text,
+            "body_loaded": with_body,
         }
 
     def _parse_dates(
@@ -284,7 +677,48 @@ class GmailTool:
         attachments: List[{"filename": str, "content_type": str, "content": bytes}]
         thread_id/in_reply_to/references 用于保持 Gmail 会话上下文。
         """
-        service = self.service
+        send_body = self.build_send_body(
+            to=to,
+            subject=subject,
+            body=body,
+            sender=sender,
+            cc=cc,
+            attachments=attachments,
+            thread_id=thread_id,
+            in_reply_to=in_reply_to,
+            references=references,
+        )
+        sent = self.service.users().messages().send(userId="me", body=send_body).execute()
+
+        message_id = sent.get("id")
+        sent_at = self._extract_sent_time(sent)
+        self._persist_sent_log(
+            message_id=message_id,
+            sent_at=sent_at,
+            to=to,
+            cc=cc,
+            subject=subject,
+            body=body,
+            attachments=attachments,
+        )
+
+        return message_id
+
+    @staticmethod
+    def build_send_body(
+        to: str,
+        subject: str,
+        body: str,
+        sender: str = None,
+        cc: str = None,
+        attachments: Optional[List[dict]] = None,
+        thread_id: Optional[str] = None,
+        in_reply_to: Optional[str] = None,
+        references: Optional[str] = None,
+    ) -> dict:
+        """
+        组装 messages.send 的请求体（raw MIME + threadId）；参数同 send_message。
+        """
         message = EmailMessage()
         message.set_content(body)
 
@@ -323,21 +757,27 @@ class GmailTool:
         if thread_id:
             send_body["threadId"] = thread_id
 
-        sent = service.users().messages().send(userId="me", body=send_body).execute()
+        return send_body
 
-        message_id = sent.get("id")
-        sent_at = self._extract_sent_time(sent)
-        self._persist_sent_log(
-            message_id=message_id,
-            sent_at=sent_at,
-            to=to,
-            cc=cc,
-            subject=subject,
-            body=body,
-            attachments=attachments,
-        )
+    def send_batch(self, send_bodies: List[dict]) -> List[Tuple[Optional[dict], Optional[Exception]]]:
+        """
+        用一次 batch 请求发送多封（build_send_body 的结果），按输入顺序返回 (响应, 异常)。
+        不写 SentEmailLog，由调用方（发件队列）自行更新状态。
+        """
+        results: List[Tuple[Optional[dict], Optional[Exception]]] = [(None, None)] * len(send_bodies)
 
-        return message_id
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        service = self.service
+        batch = service.new_batch_http_request(callback=callback)
+        for i, send_body in enumerate(send_bodies):
+            batch.add(
+                service.users().messages().send(userId="me", body=send_body),
+                request_id=str(i),
+            )
+        batch.execute()
+        return results
 
     def _extract_sent_time(self, sent_response: dict) -> datetime:
         """
@@ -399,77 +839,28 @@ class GmailTool:
 
     def _extract_text_from_gmail_msg(self, msg: dict) -> str:
         """
-        从 Gmail API 返回的 message 结构中抽取文本正文（优先 text/plain）。
+        从 Gmail API 返回的 message 结构中抽取文本正文（优先 text/plain），见 mimeText.extract_text。
         """
+        return extract_text(msg.get("payload", {}))
 
-        class _HTMLStripper(HTMLParser):
-            def __init__(self):
-                super().__init__()
-                self.parts: List[str] = []
-
-            def handle_starttag(self, tag, attrs):
-                if tag in ("br", "p", "div", "li", "tr"):
-                    self.parts.append("\n")
-
-            def handle_endtag(self, tag):
-                if tag in ("p", "div", "li", "tr", "table"):
-                    self.parts.append("\n")
 
-            def handle_data(self, data):
-                if data:
-                    self.parts.append(data)
+_shared_tool: Optional[GmailTool] = None
+_shared_lock = threading.Lock()
 
-            def get_text(self):
-                text = "".join(self.parts)
-                # 去掉过多空行
-                text = re.sub(r"\n{3,}", "\n\n", text)
-                # 行尾空白
-                text = "\n".join(line.rstrip() for line in text.splitlines())
-                return text.strip()
 
-        def html_to_text(html_body: str) -> str:
-            stripper = _HTMLStripper()
-            try:
-                stripper.feed(html_body)
-                stripper.close()
-            except Exception:
-                return html_body
-            text = stripper.get_text()
-            return unescape(text)
-
-        def _get_parts(payload):
-            if "parts" in payload:
-                for part in payload["parts"]:
-                    mime_type = part.get("mimeType", "")
-                    if mime_type.startswith("multipart/"):
-                        yield from _get_parts(part)
-                    else:
-                        yield part
-            else:
-                yield payload
-
-        payload = msg.get("payload", {})
-        body_texts = []
-
-        for part in _get_parts(payload):
-            mime_type = part.get("mimeType", "")
-            body = part.get("body", {})
-            data = body.get("data")
-            if not data:
-                continue
-
-            decoded_bytes = base64.urlsafe_b64decode(data.encode("utf-8"))
-            text = decoded_bytes.decode("utf-8", errors="ignore")
-
-            if mime_type == "text/plain":
-                body_texts.insert(0, text)  # 优先 text/plain
-            else:
-                if mime_type == "text/html":
-                    body_texts.append(html_to_text(text))
-                else:
-                    body_texts.append(text)
-
-        return "\n\n".join(body_texts).strip()
+def get_gmail_tool() -> GmailTool:
+    """
+    进程内共享的 GmailTool：首次调用时才加载凭据、构建 service（不在 import 时进行），
+    之后所有请求复用同一实例。创建失败（如凭据缺失）时抛出异常，下次调用会重试。
+    """
+    global _shared_tool
+    tool = _shared_tool
+    if tool is None:
+        with _shared_lock:
+            if _shared_tool is None:
+                _shared_tool = GmailTool()
+            tool = _shared_tool
+    return tool
 
 
 # ---------------------------
@@ -0,0 +1,113 @@
+import hashlib
+import re
+import unicodedata
+from datetime import timedelta
+from typing import Callable
+
+from .conf import get_setting
+
+DEFAULT_TTL_SECONDS = 60 * 60 * 24 * 30
+DEFAULT_MAX_ENTRIES = 50000
+# 命中时 last_used_at 的最小刷新间隔，避免每次命中都写库
+TOUCH_INTERVAL = timedelta(hours=1)
+# 每写入多少条检查一次容量上限
+EVICT_EVERY = 200
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_writes_since_evict = 0
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化输入文本：NFKC（全角/半角统一）+ 折叠空白，使同一封邮件在不同页面、线程中得到相同哈希。
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def make_key(func_name: str, prompt_version: str, model_name: str, text: str):
+    text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    raw = "\x00".join([func_name, prompt_version, model_name, text_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest(), text_hash
+
+
+def get_or_compute(
+    func_name: str,
+    prompt_version: str,
+    model_name: str,
+    text: str,
+    compute: Callable[[], str],
+) -> str:
+    """
+    先查 llm_result_cache，未命中或已过期时调用 compute() 并写回。
+    ORM 不可用（例如脱离 Django 单独运行）时直接调用 compute()。
+    """
+    try:
+        from django.utils import timezone as dj_timezone
+        from .models import LlmResultCache
+    except Exception:
+        return compute()
+
+    cache_key, text_hash = make_key(func_name, prompt_version, model_name, text)
+    now = None
+    try:
+        now = dj_timezone.now()
+        entry = LlmResultCache.objects.filter(cache_key=cache_key).first()
+        if entry and entry.expires_at > now:
+            updates = {"hit_count": entry.hit_count + 1}
+            if now - entry.last_used_at >= TOUCH_INTERVAL:
+                updates["last_used_at"] = now
+            LlmResultCache.objects.filter(pk=entry.pk).update(**updates)
+            return entry.result
+    except Exception as exc:
+        print(f"[llm_cache] 读取缓存失败: {exc}")
+
+    result = compute()
+
+    if now is None:
+        return result
+    try:
+        ttl = int(get_setting("BPMATCH_LLM_CACHE_TTL", DEFAULT_TTL_SECONDS))
+        LlmResultCache.objects.update_or_create(
+            cache_key=cache_key,
+            defaults={
+                "func_name": func_name,
+                "prompt_version": prompt_version,
+                "model_name": model_name,
+                "text_hash": text_hash,
+                "result": result,
+                "hit_count": 0,
+                "expires_at": now + timedelta(seconds=ttl),
+                "last_used_at": now,
+            },
+        )
+        _maybe_evict()
+    except Exception as exc:
+        print(f"[llm_cache] 写入缓存失败: {exc}")
+    return result
+
+
+def _maybe_evict():
+    """
+    删除过期条目，并在超过容量上限时按 last_used_at 淘汰最久未使用的条目（LRU）。
+    """
+    global _writes_since_evict
+    _writes_since_evict += 1
+    if _writes_since_evict < EVICT_EVERY:
+        return
+    _writes_since_evict = 0
+
+    from django.utils import timezone as dj_timezone
+    from .models import LlmResultCache
+
+    LlmResultCache.objects.filter(expires_at__lte=dj_timezone.now()).delete()
+
+    max_entries = int(get_setting("BPMATCH_LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    overflow = LlmResultCache.objects.count() - max_entries
+    if overflow > 0:
+        stale_ids = list(
+            LlmResultCache.objects.order_by("last_used_at").values_list("id", flat=True)[
+                :overflow
+            ]
+        )
+        LlmResultCache.objects.filter(id__in=stale_ids).delete()
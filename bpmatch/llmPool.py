@@ -0,0 +1,219 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+
+import httpx
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+from ollama import ResponseError
+
+from .conf import get_setting
+
+# 连续失败达到该次数后熔断，冷却期内不再向该主机派发请求
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 30  # 秒
+HEALTH_CHECK_INTERVAL = 15  # 秒
+HEALTH_CHECK_TIMEOUT = 3  # 秒
+# 延迟的指数滑动平均系数；同等并发数时优先选更快的主机
+LATENCY_ALPHA = 0.2
+
+_FAILOVER_ERRORS = (TimeoutError, ConnectionError, httpx.TransportError)
+
+T = TypeVar("T")
+
+
+class NoHostAvailable(ConnectionError):
+    """
+    所有 Ollama 主机都处于熔断状态。
+    """
+
+
+class OllamaHost:
+    """
+    单个 Ollama 服务：并发计数、延迟统计与熔断状态（closed → open → half-open → closed）。
+    """
+
+    def __init__(self, base_url: Optional[str], model: str, temperature: float, timeout: float):
+        self.base_url = base_url
+        self.name = base_url or "default"
+        self.timeout = timeout
+        self.client = ChatOllama(
+            model=model,
+            base_url=base_url,
+            temperature=temperature,
+            client_kwargs={"timeout": timeout},
+        )
+        self._embedders: Dict[str, OllamaEmbeddings] = {}
+        self.outstanding = 0
+        self.latency = 0.0
+        self.failures = 0
+        self.opened_at: Optional[float] = None  # 熔断开始时间；None 表示 closed
+        self.probing = False  # half-open 状态下已放行一个试探请求
+
+    def embedder(self, model: str) -> OllamaEmbeddings:
+        if model not in self._embedders:
+            self._embedders[model] = OllamaEmbeddings(
+                model=model,
+                base_url=self.base_url,
+                client_kwargs={"timeout": self.timeout},
+            )
+        return self._embedders[model]
+
+    def available(self, now: float) -> bool:
+        if self.opened_at is None:
+            return True
+        # 冷却期过后进入 half-open，只放行一个请求试探
+        return now - self.opened_at >= BREAKER_COOLDOWN and not self.probing
+
+    def record_success(self, elapsed: float):
+        self.latency = (
+            elapsed if not self.latency else LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * self.latency
+        )
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= BREAKER_FAILURES:
+            self.opened_at = now
+
+    def stats(self) -> dict:
+        return {
+            "host": self.name,
+            "outstanding": self.outstanding,
+            "latency_ms": round(self.latency * 1000),
+            "failures": self.failures,
+            "state": "closed" if self.opened_at is None else "open",
+        }
+
+
+class LlmPool:
+    """
+    多个 Ollama 主机组成的推理池，对外提供与 ChatOllama 相同的 invoke / model。
+    - 选择进行中请求最少的可用主机（并列时选延迟更低的）；
+    - 超时、连接失败或 5xx 时换一台主机重试，连续失败的主机熔断一段时间；
+    - 后台线程定期探测 /api/tags，宕机的主机提前熔断，恢复后重新参与调度。
+    所有主机须部署同一个模型（LLM 结果缓存以模型名为键）。
+    """
+
+    def __init__(
+        self,
+        hosts: Sequence[Optional[str]],
+        model: str,
+        temperature: float = 0,
+        timeout: float = 120,
+        max_retries: int = 2,
+    ):
+        self.model = model
+        self.max_retries = max_retries
+        self.hosts: List[OllamaHost] = [
+            OllamaHost(url, model, temperature, timeout) for url in (list(hosts) or [None])
+        ]
+        self._lock = threading.Lock()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def _acquire(self, exclude: set) -> OllamaHost:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [h for h in self.hosts if h.available(now) and h.name not in exclude]
+            if not candidates:
+                # 其他主机都已试过时，允许回到已试过但仍可用的主机
+                candidates = [h for h in self.hosts if h.available(now)]
+            if not candidates:
+                raise NoHostAvailable("所有 Ollama 主机均已熔断")
+            host = min(candidates, key=lambda h: (h.outstanding, h.latency))
+            host.outstanding += 1
+            if host.opened_at is not None:
+                host.probing = True
+            return host
+
+    def _release(self, host: OllamaHost, elapsed: Optional[float]):
+        now = time.monotonic()
+        with self._lock:
+            host.outstanding -= 1
+            if elapsed is None:
+                host.record_failure(now)
+            else:
+                host.record_success(elapsed)
+
+    def invoke(self, messages, **kwargs):
+        """
+        kwargs 原样传给 ChatOllama.invoke（如 format=JSON schema）。
+        """
+        return self._call(lambda host: host.client.invoke(messages, **kwargs))
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        用 embedding 模型（各主机须已 pull）批量向量化，与对话调用共用调度与熔断。
+        """
+        return self._call(lambda host: host.embedder(model).embed_documents(texts))
+
+    def _call(self, func: Callable[[OllamaHost], T]) -> T:
+        self._ensure_health_checks()
+        tried: set = set()
+        for attempt in range(self.max_retries + 1):
+            host = self._acquire(tried)
+            tried.add(host.name)
+            started = time.monotonic()
+            try:
+                result = func(host)
+            except Exception as exc:
+                retryable = isinstance(exc, _FAILOVER_ERRORS) or (
+                    isinstance(exc, ResponseError) and exc.status_code >= 500
+                )
+                self._release(host, None if retryable else time.monotonic() - started)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                print(f"[llm_pool] {host.name} 调用失败，第 {attempt + 1} 次重试: {exc}")
+                if len(tried) >= len(self.hosts):
+                    time.sleep(2**attempt)  # 已没有别的主机可换，退避后再试
+                continue
+            self._release(host, time.monotonic() - started)
+            return result
+
+    def _ensure_health_checks(self):
+        if len(self.hosts) < 2 or self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(
+                    target=self._health_loop, name="bpmatch-llm-health", daemon=True
+                )
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(HEALTH_CHECK_INTERVAL)
+            for host in self.hosts:
+                self.check(host)
+
+    def check(self, host: OllamaHost) -> bool:
+        """
+        探测 /api/tags：失败则直接熔断；熔断中的主机探测成功后恢复调度。
+        """
+        url = (host.base_url or "http://127.0.0.1:11434").rstrip("/") + "/api/tags"
+        try:
+            ok = httpx.get(url, timeout=HEALTH_CHECK_TIMEOUT).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        now = time.monotonic()
+        with self._lock:
+            if ok and host.opened_at is not None and not host.probing:
+                host.failures = 0
+                host.opened_at = None
+            elif not ok:
+                host.failures = max(host.failures, BREAKER_FAILURES)
+                host.opened_at = host.opened_at or now
+        return ok
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [h.stats() for h in self.hosts]
+
+
+def hosts_from_settings() -> List[Optional[str]]:
+    """
+    BPMATCH_OLLAMA_HOSTS：Ollama 地址列表；未配置时使用默认地址（OLLAMA_HOST 或本机 11434）。
+    """
+    return list(get_setting("BPMATCH_OLLAMA_HOSTS", None) or [None])
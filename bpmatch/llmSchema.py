@@ -0,0 +1,134 @@
+import json
+from typing import Dict, List, NamedTuple
+
+
+class SchemaError(ValueError):
+    """
+    LLM 输出不是合法 JSON，或字段/类型不符合 schema。
+    """
+
+
+class MailFields(NamedTuple):
+    """
+    求人 / 求案件正文的抽取结果。
+    """
+
+    country: int  # 0 日本籍，1 国籍不限 / 非日本籍
+    skills: List[str]
+    price: int  # 万数（60）或円（600000），未知为 0
+
+
+class ProjectDetail(NamedTuple):
+    """
+    求人案件的结构化内容，用于生成回信模板。
+    """
+
+    project_name: str
+    project_detail: str
+    requirement: str
+    skills_must: List[str]
+    skills_can: List[str]
+    remark: str
+
+
+# 传给 Ollama 的 format 参数：解码时即约束为该结构，几乎不会再出现多余文字或代码块
+MAIL_FIELDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "country": {"type": "integer", "enum": [0, 1]},
+        "skills": {"type": "array", "items": {"type": "string"}},
+        "price": {"type": "integer", "minimum": 0},
+    },
+    "required": list(MailFields._fields),
+}
+
+PROJECT_DETAIL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "project_name": {"type": "string"},
+        "project_detail": {"type": "string"},
+        "requirement": {"type": "string"},
+        "skills_must": {"type": "array", "items": {"type": "string"}},
+        "skills_can": {"type": "array", "items": {"type": "string"}},
+        "remark": {"type": "string"},
+    },
+    "required": list(ProjectDetail._fields),
+}
+
+
+def _load(raw: str) -> Dict:
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError) as exc:
+        raise SchemaError(f"不是合法的 JSON: {exc}")
+    if not isinstance(data, dict):
+        raise SchemaError("顶层必须是 JSON 对象")
+    return data
+
+
+def _integer(data: Dict, name: str, errors: List[str]) -> int:
+    value = data.get(name)
+    if isinstance(value, bool):
+        errors.append(f"{name} 必须是整数")
+        return 0
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    errors.append(f"{name} 必须是整数")
+    return 0
+
+
+def _string(data: Dict, name: str, errors: List[str]) -> str:
+    value = data.get(name)
+    if isinstance(value, str):
+        return value.strip()
+    errors.append(f"{name} 必须是字符串")
+    return ""
+
+
+def _strings(data: Dict, name: str, errors: List[str]) -> List[str]:
+    value = data.get(name)
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return [v.strip() for v in value if v.strip()]
+    errors.append(f"{name} 必须是字符串数组")
+    return []
+
+
+def parse_mail_fields(raw: str) -> MailFields:
+    data = _load(raw)
+    errors: List[str] = []
+    fields = MailFields(
+        country=_integer(data, "country", errors),
+        skills=_strings(data, "skills", errors),
+        price=_integer(data, "price", errors),
+    )
+    if fields.country not in (0, 1):
+        errors.append("country 只能是 0 或 1")
+    if fields.price < 0:
+        errors.append("price 不能为负数")
+    if errors:
+        raise SchemaError("；".join(errors))
+    return fields
+
+
+def parse_project_detail(raw: str) -> ProjectDetail:
+    data = _load(raw)
+    errors: List[str] = []
+    detail = ProjectDetail(
+        project_name=_string(data, "project_name", errors),
+        project_detail=_string(data, "project_detail", errors),
+        requirement=_string(data, "requirement", errors),
+        skills_must=_strings(data, "skills_must", errors),
+        skills_can=_strings(data, "skills_can", errors),
+        remark=_string(data, "remark", errors),
+    )
+    if errors:
+        raise SchemaError("；".join(errors))
+    return detail
+
+
+def dumps(result: NamedTuple) -> str:
+    return json.dumps(result._asdict(), ensure_ascii=False)
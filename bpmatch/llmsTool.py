@@ -1,217 +1,204 @@
-from langchain_ollama import ChatOllama
-from langchain_core.messages import SystemMessage, HumanMessage
+from typing import Callable, Dict, TypeVar
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from . import bodyTrim, llmCache, llmSchema, ruleExtractor, titleRules
+from .conf import get_setting
+from .llmPool import LlmPool, hosts_from_settings
+from .llmSchema import MailFields, ProjectDetail, SchemaError
+
+LLM_TIMEOUT = get_setting("BPMATCH_LLM_TIMEOUT", 120)  # 单次推理超时（秒）
+LLM_MAX_RETRIES = get_setting("BPMATCH_LLM_MAX_RETRIES", 2)  # 超时/连接失败后的重试次数（换主机）
 
 
 # ---------------------------
-#  初始化 LLM（建议单例）
+#  初始化 LLM（建议单例）：BPMATCH_OLLAMA_HOSTS 中的多台 Ollama 组成推理池
 # ---------------------------
-llm = ChatOllama(
-    model="llama3.2:3b-instruct-q4_K_M",
+llm = LlmPool(
+    hosts_from_settings(),
+    model=get_setting("BPMATCH_OLLAMA_MODEL", "llama3.2:3b-instruct-q4_K_M"),
     # model="llama3.1:8b-instruct-q4_K_M",
     # model="gpt-oss:20b",
     # model="phi3:mini",
     temperature=0,
+    timeout=LLM_TIMEOUT,
+    max_retries=LLM_MAX_RETRIES,
+)
+
+# 修改某个 prompt（或 bodyTrim 的预处理规则）时同步升级版本号，旧的缓存结果即自然失效
+PROMPT_VERSIONS = {
+    "title_analysis": "v2",
+    "qiuren_detail_analysis": "v4",
+    "qiuanjian_detail_analysis": "v4",
+    "extract_qiuren_detail": "v5",
+}
+
+T = TypeVar("T")
+
+# system prompt 为模块级常量、逐字固定，变化的正文只放在 HumanMessage 中，
+# Ollama 可对相同前缀复用 KV cache；prompt 已去掉缩进与重复说明以减少 token。
+TITLE_PROMPT = """根据日文邮件标题（subject）判断类型，只输出一个整数：
+0=求人（发件方有案件）；1=求案件（发件方有人）；-1=其他或无法确定。
+倾向 0：案件のご紹介、案件、エンジニア募集、支援、エンド直、フルリモート、急募案件、技術者募集。
+倾向 1：弊社所属、弊社のご紹介、案件募集、案件探してます、実績、人材、稼働可能、社員、フリーランス、〇〇歳、直個人、1社下社員。
+只看标题，不臆测正文；除整数外不输出任何内容。"""
+
+# 求人 / 求案件抽取共用的部分放在最前，两种调用交替时仍能复用同一段前缀
+_DETAIL_PROMPT_PREFIX = """你是信息抽取模型。根据日文邮件正文，只输出一个 JSON 对象，不要任何说明或 markdown：
+{"country":整数,"skills":[字符串],"price":整数}
+skills：技术名/框架名/云服务名，小写去重（如 java、vue、react、c#、python、go、typescript、node、spring、.net、aws、azure、gcp、docker、kubernetes、sql、oracle、sap、salesforce），没有则 []。
+price：最先出现的报酬金额（単価、時給、月給、月額、年収、報酬、円、万円 附近）。「60万円」「60万」→60；「600000円」「600000」→600000；没有则 0。
+"""
+
+QIUREN_DETAIL_PROMPT = (
+    _DETAIL_PROMPT_PREFIX
+    + "邮件类型为「求人」（发件方有案件、在找人）。country：出现「外国籍不可」「日本国籍」为 0；「外国籍可」「非日本籍」或未提及为 1。"
+)
+
+QIUANJIAN_DETAIL_PROMPT = (
+    _DETAIL_PROMPT_PREFIX
+    + "邮件类型为「求案件」（发件方有人、在找案件）。country：技术者为「日本籍」「日本国籍」为 0；否则或未提及为 1。"
 )
 
+EXTRACT_QIUREN_PROMPT = """求人案件メールから、本文に明記された情報のみを抽出し JSON 1個だけを出力する（説明・Markdown・コードブロック禁止）。
+推測・補完・要約・言い換え禁止。日本語は原文のまま。記載がなければ文字列は ""、配列は []。null・キー省略禁止。
+{"project_name":"","project_detail":"","requirement":"","skills_must":[],"skills_can":[],"remark":""}
+project_name：【案件名】の内容。
+project_detail：【業務概要】【業務内容】などの内容。
+requirement：【条件】【応募条件】などの内容。
+skills_must：【必須スキル】のスキル名を1項目ずつ（経験年数・記号・補足は除く）。
+skills_can：【尚可スキル】のスキル名を1項目ずつ（同上）。
+remark：【備考】、期間、開始日などの内容。"""
+
+# 输出不符合 schema 时追加的修复指令（只修复一次）
+REPAIR_PROMPT = "上面的输出不符合要求：{errors}。请按同样的 JSON 结构只输出修正后的 JSON 对象。"
+
+
+def _messages(system_prompt: str, text: str):
+    return [SystemMessage(content=system_prompt), HumanMessage(content=text)]
+
+
+def _invoke(func_name: str, messages, text: str) -> str:
+    """
+    调用 LLM 并通过 llm_result_cache 复用相同输入的结果。
+    """
+
+    def compute() -> str:
+        # 超时、连接失败时的换主机重试由 LlmPool 负责
+        return llm.invoke(messages).content.strip()
+
+    return llmCache.get_or_compute(
+        func_name, PROMPT_VERSIONS[func_name], llm.model, text, compute
+    )
+
+
+def _invoke_structured(
+    func_name: str,
+    messages,
+    text: str,
+    schema: Dict,
+    parse: Callable[[str], T],
+) -> T:
+    """
+    以 Ollama 的 format=JSON schema 模式调用，并按 schema 校验为类型化结果。
+    校验失败时带上错误说明修复一次；仍失败则抛出 SchemaError。
+    缓存中只写入校验通过、重新序列化后的 JSON。
+    """
+
+    def compute() -> str:
+        raw = llm.invoke(messages, format=schema).content.strip()
+        try:
+            return llmSchema.dumps(parse(raw))
+        except SchemaError as exc:
+            print(f"[llm] {func_name} 输出不符合 schema，修复重试一次: {exc}")
+            repair = messages + [
+                AIMessage(content=raw),
+                HumanMessage(content=REPAIR_PROMPT.format(errors=exc)),
+            ]
+            raw = llm.invoke(repair, format=schema).content.strip()
+            return llmSchema.dumps(parse(raw))
+
+    return parse(
+        llmCache.get_or_compute(
+            func_name, PROMPT_VERSIONS[func_name], llm.model, text, compute
+        )
+    )
+
+
+def _extract_with_rules(
+    func_name: str, kind: str, system_prompt: str, text: str
+) -> MailFields:
+    """
+    先用 ruleExtractor 对完整正文做确定性抽取，只有无法可靠判定的字段才调用 LLM 补齐；
+    送入 LLM 的是 bodyTrim 预处理后的正文。LLM 输出修复后仍不合格时沿用规则抽取结果。
+    """
+    fields, unresolved = ruleExtractor.extractor.extract(text, kind)
+    if unresolved:
+        body = bodyTrim.trim(text)
+        try:
+            llm_fields = _invoke_structured(
+                func_name,
+                _messages(system_prompt, body),
+                body,
+                llmSchema.MAIL_FIELDS_SCHEMA,
+                llmSchema.parse_mail_fields,
+            )
+            for name in unresolved:
+                fields[name] = getattr(llm_fields, name)
+        except SchemaError as exc:
+            print(f"[llm] {func_name} 输出无法解析，使用规则抽取结果: {exc}")
+    return MailFields(**fields)
+
 
 # ---------------------------
 #  分析邮件标题 返回邮件类型
 # ---------------------------
 def title_analysis(text: str) -> str:
-    # 规则 A：出现这些关键词 → 优先判定为 0（求人）
-    KEYWORDS_JOB = ["急募案件", "エンド直", "代替"]
-    # 规则 B：出现这些关键词 → 优先判定为 1（求案件）
-    KEYWORDS_PROJECT = ["歳", "人材", "要員", "社員", "フリーランス"]
-    # 检查规则 A（求人）
-    matched_job = [kw for kw in KEYWORDS_JOB if kw in text]
-    if matched_job:
-        print("匹配到【求人（0）】关键词：", matched_job)
-        return 0
-
-    # 检查规则 B（求案件）
-    matched_project = [kw for kw in KEYWORDS_PROJECT if kw in text]
-    if matched_project:
-        print("匹配到【求案件（1）】关键词：", matched_project)
-        return 1
-
-    messages = [
-        SystemMessage(
-            content=(
-                """
-                你现在的任务是：只根据整封邮件的日文标题（subject）来判断这封邮件的类型，并输出一个固定整型标签。
-
-                分类：
-                ・0 = 求人：我这边有案件
-                ・1 = 求案件：我这边有人
-                ・-1 = 其他类型：非以上两种。
-
-                判断要点：
-                ・标题中主要在介绍案件，多数是 0（求人），例如：
-                　「案件のご紹介」「案件」「エンジニア募集」「支援」「エンド直」「フルリモート」「急募案件」「技術者募集」等。
-                ・标题中主要在介绍候補者，多数是 1（求案件），例如：
-                　「弊社所属」「弊社のご紹介」「案件募集」「案件探してます」「実績」「人材」「稼働可能」「社員」「フリーランス」「歳」等。。
-
-                关键词规则：
-                ・包含「案件のご紹介」「案件」「エンジニア募集」「支援」「エンド直」「フルリモート」「急募案件」「技術者募集」时，优先判定为 0（求人）。
-                ・包含「弊社所属」「弊社のご紹介」「案件募集」「案件探してます」「実績」「人材」「稼働可能」「社員」「フリーランス」「〇〇歳」「直個人」「1社下社員」时，优先判定为 1（求案件）。
-
-                其他说明：
-                1. 只看标题，不要臆测正文内容。
-                2. 邮件标题是日文，你需要根据日文标题的含义进行判断。
-                3. 必须只输出一个整数标签：0、1 或 -1，不要输出其它任何文字、符号或说明。
-                4. 如果无法确定是「求人」还是「求案件」，默认输出 -1。"""
-            )
-        ),
-        HumanMessage(content=text),
-    ]
+    # 规则快速通道：加权关键词足以判定时不调用 LLM（命中率见 titleRules.classifier.stats()）
+    label = titleRules.classifier.classify(text)
+    if label is not None:
+        return label
 
-    ai_msg = llm.invoke(messages)
-    return ai_msg.content.strip()
+    return _invoke("title_analysis", _messages(TITLE_PROMPT, text), text)
 
 
 # ---------------------------
-#  分析求人邮件内容 返回json
+#  分析求人邮件内容 返回 MailFields
 # ---------------------------
-def qiuren_detail_analysis(text: str) -> str:
-    messages = [
-        SystemMessage(
-            content=(
-                """你是一个信息抽取模型。已知当前邮件类型为「求人」，即发件方这边有案件/项目/工作机会，希望寻找可以做这个案件的人、工程师或候选人。
-
-                现在，请你根据整封日语邮件正文，抽取关键信息，只输出一个 JSON 对象，不包含任何额外文字或说明。
-
-                JSON 对象包含字段：country、skills、price。
-
-                字段规则：
-                1. country：整数。0 表示此求人仅招日本籍，1 表示国籍不限。出现「外国籍不可」「日本国籍」则 country=0；出现「外国籍可」「非日本籍」则 country=1；若邮件中未提及国籍，则默认 country=1。
-                2. skills：字符串数组。从邮件正文中识别技术相关关键词，全部转为小写并去重。常见技术词包括但不限于：java、vue、react、c#、c++、python、php、ruby、go、typescript、javascript、node、kotlin、swift、spring、.net、azure、aws、gcp、docker、kubernetes、oracle、sql、postgresql、mysql、sap、salesforce、laravel、django。若出现其他明显为技术名 / 框架名 / 云服务名，也一并加入 skills。若未识别到任何技术词，则 skills=[]。
-                3. price：整数。从与报酬相关的描述中提取第一个数值，优先从包含「単価」「時給」「月給」「月額」「年収」「報酬」以及包含「円」「万円」「万」等金额表述的部分抽取。
-                - 若金额以「万」或「万円」表示（如「60万円」「60万」），则输出对应的整数万数（例：60）。
-                - 若金额以「円」表示或为纯数字（如「600000円」「600000」），则输出该数值本身（例：600000）。
-                - 若存在多个金额，只取正文中最先出现的一个。
-                - 若没有任何可识别的报酬或单价相关数值，则 price=0。
-
-                输出格式要求：
-                - 只输出 JSON 对象本身，例如：{"country":1,"skills":["java","aws"],"price":60}
-                - 不要输出任何解释性文字、前后缀、markdown 代码块等。"""
-            ),
-        ),
-        HumanMessage(content=text),
-    ]
-    ai_msg = llm.invoke(messages)
-    return ai_msg.content.strip()
+def qiuren_detail_analysis(text: str) -> MailFields:
+    return _extract_with_rules(
+        "qiuren_detail_analysis", ruleExtractor.KIND_QIUREN, QIUREN_DETAIL_PROMPT, text
+    )
 
 
 # ---------------------------
-#  分析求案件邮件内容 返回json
+#  分析求案件邮件内容 返回 MailFields
 # ---------------------------
-def qiuanjian_detail_analysis(text: str) -> str:
-    messages = [
-        SystemMessage(
-            content=(
-                """你是一个信息抽取模型。已知当前邮件类型为「求案件」，即发件方这边有人 / 候选人 / 工程师 / 团队，希望寻找合适的案件 / 项目 / 职位 / 工作来对接。
-
-                现在，请你根据整封日语邮件正文，抽取关键信息，只输出一个 JSON 对象，不包含任何额外文字或说明。
-
-                JSON 对象包含字段：country, skills, price。
-
-                字段规则：
-                1. country：整数。0 表示求案件的技术者是日本籍，1 表示求案件的技术者是非日本籍。出现「日本籍」「日本国籍」则 country=0；若邮件中未提及国籍，则默认 country=1。
-                2. skills：字符串数组。从邮件正文中识别技术相关关键词，全部转为小写并去重。常见技术词包括但不限于：java、vue、react、c#、c++、python、php、ruby、go、typescript、javascript、node、kotlin、swift、spring、.net、azure、aws、gcp、docker、kubernetes、oracle、sql、postgresql、mysql、sap、salesforce、laravel、django。若出现其他明显为技术名 / 框架名 / 云服务名，也一并加入 skills。若未识别到任何技术词，则 skills=[]。
-                3. price：整数。从与报酬相关的描述中提取第一个数值，优先从包含「単価」「時給」「月給」「月額」「年収」「報酬」以及包含「円」「万円」「万」等金额表述的部分抽取。
-                - 若金额以「万」或「万円」表示（如「60万円」「60万」），则输出对应的整数万数（例：60）。
-                - 若金额以「円」表示或为纯数字（如「600000円」「600000」），则输出该数值本身（例：600000）。
-                - 若存在多个金额，只取正文中最先出现的一个。
-                - 若没有任何可识别的报酬或单价相关数值，则 price=0。
-
-                输出格式要求：
-                - 只输出 JSON 对象本身，例如：{"country":1,"skills":["java","aws"],"price":60}
-                - 不要输出任何解释性文字、前后缀、markdown 代码块等。"""
-            ),
-        ),
-        HumanMessage(content=text),
-    ]
-    ai_msg = llm.invoke(messages)
-    return ai_msg.content.strip()
+def qiuanjian_detail_analysis(text: str) -> MailFields:
+    return _extract_with_rules(
+        "qiuanjian_detail_analysis",
+        ruleExtractor.KIND_QIUANJIAN,
+        QIUANJIAN_DETAIL_PROMPT,
+        text,
+    )
 
 
 # -----------------------------
-# 解析求人案件邮件内容，返回 JSON
+# 解析求人案件邮件内容，返回 ProjectDetail
 # -----------------------------
-def extract_qiuren_detail(text: str) -> str:
-    messages = [
-        SystemMessage(
-            content=(
-                """
-                あなたは求人案件メールを解析する情報抽出エンジンです。
-
-                以下のメール本文は、日本語で書かれた求人案件の内容です。
-                本文から、明確に記載されている情報のみを抽出してください。
-                
-                【最重要ルール（厳守）】
-                ・推測、補完、要約、言い換えは禁止
-                ・本文に明確な記載が存在しない項目は必ず空値を返す
-                ・文字列項目は空文字列 ""、配列項目は空配列 [] を返す
-                ・日本語は原文のまま使用する
-                ・案件情報と無関係な挨拶文、署名、注意書きは抽出対象外とする
-                
-                【出力制約（絶対遵守）】
-                ・出力は JSON 1個のみとする
-                ・JSON の前後に、説明文・注釈・理由・補足・挨拶・Markdown・コードブロック（```）を一切付けない
-                ・JSON の後に 1 文字でも文字列を出力した場合は不正解
-                ・「注:」「備考:」「理由:」「抽出できませんでした」等の説明文は禁止
-                ・抽出できない理由は絶対に書かない（空値で表現する）
-                
-                【出力フォーマット（キー・型を厳守）】
-                {
-                  "project_name": "",
-                  "project_detail": "",
-                  "requirement": "",
-                  "skills_must": [],
-                  "skills_can": [],
-                  "remark": ""
-                }
-                
-                【型ルール（絶対遵守）】
-                ・project_name / project_detail / requirement / remark は必ず文字列型
-                ・skills_must / skills_can は必ず文字列の配列（array of string）
-                ・null、未定義、キー省略は禁止
-                
-                【各項目の定義】
-                - project_name：
-                本文中に「【案件名】」という見出しが明確に存在する場合のみ抽出する。
-                存在しない場合は ""。
-                
-                - project_detail：
-                本文中に「【業務概要】」「業務内容」などの見出しが明確に存在する場合のみ抽出する。
-                存在しない場合は ""。
-                
-                - requirement：
-                本文中に「【条件】」「【応募条件】」などの見出しが明確に存在する場合のみ抽出する。
-                存在しない場合は ""。
-                
-                - skills_must：
-                「【必須スキル】」に記載されている各スキル名のみを1項目ずつ配列として抽出する。
-                経験年数、記号、補足説明は含めない。
-                存在しない場合は []。
-                
-                - skills_can：
-                「【尚可スキル】」に記載されている各スキル名のみを1項目ずつ配列として抽出する。
-                経験年数、記号、補足説明は含めない。
-                存在しない場合は []。
-                
-                - remark：
-                「【備考】」「期間」「開始日」などが明確に存在する場合のみ抽出する。
-                存在しない場合は ""。
-
-                """
-            )
-        ),
-        HumanMessage(content=text),
-    ]
-
-    ai_msg = llm.invoke(messages)
-    return ai_msg.content.strip()
+def extract_qiuren_detail(text: str) -> ProjectDetail:
+    """
+    修复重试后仍不符合 schema 时抛出 SchemaError，由调用方返回错误而不是空结果。
+    各段落会原样写入回信，正文只做 clean 不按预算截断，避免【業務概要】等被截掉一半。
+    """
+    body = bodyTrim.clean(text)
+    return _invoke_structured(
+        "extract_qiuren_detail",
+        _messages(EXTRACT_QIUREN_PROMPT, body),
+        body,
+        llmSchema.PROJECT_DETAIL_SCHEMA,
+        llmSchema.parse_project_detail,
+    )
 
 
 # ---------------------------
@@ -0,0 +1,90 @@
+import json
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from django.utils import timezone as dj_timezone
+from googleapiclient.errors import HttpError
+
+from .models import GmailSyncState, InboundEmail
+from .pageTokenCache import page_tokens
+
+SYNC_STATE_NAME = "inbox"
+# 两次同步之间的最短间隔，避免每个请求都打 Gmail API
+MIN_SYNC_INTERVAL = timedelta(seconds=60)
+
+
+def sync_inbox(
+    gmail_tool,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    force: bool = False,
+) -> List[str]:
+    """
+    将 Gmail 新邮件同步到 inbound_emails，返回本次新增的 message id 列表。
+    有 historyId 时走 history.list 增量同步；首次同步或 historyId 过期时按时间窗口全量列 ID，
+    两种情况都只对本地没有的 ID 拉取详情。
+    """
+    state, _ = GmailSyncState.objects.get_or_create(name=SYNC_STATE_NAME)
+    now = dj_timezone.now()
+    if not force and state.synced_at and now - state.synced_at < MIN_SYNC_INTERVAL:
+        return []
+
+    ids: Optional[List[str]] = None
+    latest_history_id = state.history_id
+    if state.history_id:
+        try:
+            ids, latest_history_id = gmail_tool.list_history(state.history_id)
+        except HttpError as exc:
+            # historyId 过期（约一周）时 Gmail 返回 404，退回窗口全量同步
+            if exc.resp.status != 404:
+                raise
+            print(f"[mail_sync] historyId {state.history_id} 已失效，执行全量同步")
+            ids = None
+
+    if ids is None:
+        # 先取 historyId 再列 ID，保证两者之间到达的邮件下次增量时不会漏掉
+        latest_history_id = gmail_tool.get_history_id()
+        ids = gmail_tool.list_message_ids(
+            start_date=start_date, end_date=end_date, label_ids=[InboundEmail.INBOX_LABEL]
+        )
+
+    existing = set(
+        InboundEmail.objects.filter(gmail_id__in=ids).values_list("gmail_id", flat=True)
+    )
+    # ids 都来自收件箱：为 label_ids 字段加入之前入库的记录回填 INBOX，load_window 才能读到
+    InboundEmail.objects.filter(gmail_id__in=existing, label_ids__in=["", "[]"]).update(
+        label_ids=json.dumps([InboundEmail.INBOX_LABEL])
+    )
+    new_ids = [msg_id for msg_id in ids if msg_id not in existing]
+    if new_ids:
+        gmail_tool.fetch_messages_by_ids(new_ids)
+        # 有新邮件时列表分页位置整体后移，缓存的 pageToken 全部失效
+        page_tokens.invalidate()
+
+    state.history_id = latest_history_id
+    state.synced_at = now
+    state.save(update_fields=["history_id", "synced_at", "updated_at"])
+    print(f"[mail_sync] 同步完成，新增 {len(new_ids)} 封，historyId={latest_history_id}")
+    return new_ids
+
+
+def load_window(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: Optional[int] = None,
+) -> List[dict]:
+    """
+    从本地存储读取时间窗口内的收件箱邮件（按接收时间倒序），结构与 GmailTool.fetch_messages 相同。
+    """
+    qs = InboundEmail.inbox()
+    tz = dj_timezone.get_current_timezone()
+    if start_date:
+        start_ts = datetime.combine(start_date, time.min, tzinfo=tz).timestamp()
+        qs = qs.filter(internal_ts__gte=start_ts)
+    if end_date:
+        end_ts = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=tz).timestamp()
+        qs = qs.filter(internal_ts__lt=end_ts)
+    qs = qs.order_by("-internal_ts")
+    if limit:
+        qs = qs[:limit]
+    return [row.to_message() for row in qs]
@@ -0,0 +1,109 @@
+import json
+import time
+import urllib.request
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bpmatch import gmailPush
+from bpmatch.conf import get_setting
+
+# users.watch 7 天过期，Google 建议每天重新注册
+RENEW_INTERVAL = 60 * 60 * 24
+
+
+class Command(BaseCommand):
+    help = (
+        "注册/续期 Gmail users.watch 推送；或以 --standin 运行本地替身，"
+        "轮询 historyId 并以 Pub/Sub 信封格式投递到推送端点（无需真实 Pub/Sub）。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--topic",
+            default="",
+            help="Pub/Sub topic，默认取 BPMATCH_GMAIL_PUSH_TOPIC",
+        )
+        parser.add_argument(
+            "--renew",
+            action="store_true",
+            help="常驻运行，每天重新注册一次 watch",
+        )
+        parser.add_argument("--stop", action="store_true", help="停止推送")
+        parser.add_argument(
+            "--standin",
+            default="",
+            metavar="URL",
+            help="本地替身模式：推送端点 URL，如 http://127.0.0.1:8000/gmail/push",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=10,
+            help="本地替身轮询 historyId 的间隔（秒）",
+        )
+
+    def handle(self, *args, **options):
+        from bpmatch.gmailTool import get_gmail_tool
+
+        gmail_tool = get_gmail_tool()
+
+        if options["standin"]:
+            self._run_standin(gmail_tool, options["standin"], options["interval"])
+            return
+
+        if options["stop"]:
+            gmail_tool.stop_watch()
+            self.stdout.write("已停止 Gmail 推送")
+            return
+
+        topic = options["topic"] or get_setting("BPMATCH_GMAIL_PUSH_TOPIC", "")
+        if not topic:
+            raise CommandError("缺少 Pub/Sub topic：使用 --topic 或配置 BPMATCH_GMAIL_PUSH_TOPIC")
+
+        while True:
+            try:
+                resp = gmail_tool.watch(topic)
+                expiration = datetime.fromtimestamp(int(resp.get("expiration", 0)) / 1000)
+                self.stdout.write(
+                    f"watch 已注册：historyId={resp.get('historyId')}，到期 {expiration:%Y-%m-%d %H:%M}"
+                )
+            except Exception as exc:
+                self.stderr.write(f"watch 注册失败: {exc}")
+            if not options["renew"]:
+                break
+            time.sleep(RENEW_INTERVAL)
+
+    def _run_standin(self, gmail_tool, url: str, interval: int):
+        """
+        用 getProfile 的 historyId 变化模拟 Gmail 推送，每次变化投递一条 Pub/Sub 信封。
+        """
+        token = get_setting("BPMATCH_GMAIL_PUSH_TOKEN", "")
+        if not token:
+            raise CommandError("推送端点要求 token：请先配置 BPMATCH_GMAIL_PUSH_TOKEN")
+        url = f"{url}{'&' if '?' in url else '?'}token={token}"
+        profile = gmail_tool.service.users().getProfile(userId="me").execute()
+        email_address = profile.get("emailAddress") or ""
+        last = int(profile.get("historyId") or 0)
+        self.stdout.write(f"本地替身已启动：{email_address} historyId={last} → {url}")
+
+        while True:
+            time.sleep(max(interval, 1))
+            try:
+                current = gmail_tool.get_history_id()
+                if current <= last:
+                    continue
+                envelope = gmailPush.make_envelope(
+                    gmailPush.PushNotification(email_address, current)
+                )
+                request = urllib.request.Request(
+                    url,
+                    data=json.dumps(envelope).encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST",
+                )
+                with urllib.request.urlopen(request, timeout=10) as resp:
+                    self.stdout.write(f"已投递 historyId={current}（HTTP {resp.status}）")
+                last = current
+            except Exception as exc:
+                self.stderr.write(f"投递失败，下次重试: {exc}")
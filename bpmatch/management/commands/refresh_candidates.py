@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bpmatch import candidatePool
+
+
+class Command(BaseCommand):
+    help = "增量刷新求案件人员池；指定 --interval 时常驻循环执行。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="循环刷新间隔（秒），0 表示只执行一次",
+        )
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        while True:
+            try:
+                snapshot = candidatePool.refresh()
+                if snapshot is not None:
+                    self.stdout.write(
+                        f"刷新完成：{len(snapshot.messages)} 人 @ {snapshot.update_time:%Y-%m-%d %H:%M:%S}"
+                    )
+            except Exception as exc:
+                self.stderr.write(f"刷新失败: {exc}")
+            if interval <= 0:
+                break
+            time.sleep(interval)
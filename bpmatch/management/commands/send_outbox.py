@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bpmatch import outbox
+
+
+class Command(BaseCommand):
+    help = "发送发件队列中已到期的邮件；指定 --interval 时常驻循环执行。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="循环检查间隔（秒），0 表示只执行一次",
+        )
+
+    def handle(self, *args, **options):
+        from bpmatch.gmailTool import get_gmail_tool
+
+        interval = options["interval"]
+        while True:
+            try:
+                sent = outbox.drain(get_gmail_tool())
+                if sent:
+                    self.stdout.write(f"本轮处理 {sent} 封")
+            except Exception as exc:
+                self.stderr.write(f"发送失败: {exc}")
+            if interval <= 0:
+                break
+            time.sleep(interval)
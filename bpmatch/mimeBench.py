@@ -0,0 +1,117 @@
+"""
+正文抽取的微基准：用几种典型的 SES 邮件结构测 mimeText.extract_text 的单封耗时。
+
+    python -m bpmatch.mimeBench [--number 2000]
+
+不依赖 Django / Gmail API，可直接运行；修改 mimeText 前后各跑一次对比。
+"""
+import argparse
+import base64
+import timeit
+from typing import Dict, List
+
+from .mimeText import extract_text
+
+_PLAIN_BODY = """\
+いつもお世話になっております。
+株式会社サンプルの山田でございます。
+
+下記案件にて要員を募集しております。
+ご提案いただけますと幸いです。
+
+【案件名】　物流系基幹システム更改
+【業務概要】　Java/Spring Boot による API 開発、詳細設計〜結合試験
+【必須スキル】
+・Java での開発経験 3 年以上
+・Spring Boot / MyBatis
+・Oracle もしくは PostgreSQL
+【尚可スキル】
+・AWS（ECS, RDS）
+・React
+【場所】　東京都品川区（週 2 リモート可）
+【期間】　即日〜長期
+【単価】　60〜70万円（スキル見合い）
+【精算】　140-180h
+【面談】　1 回（Web）
+【国籍】　日本籍のみ
+【商流】　エンド直
+
+以上、よろしくお願いいたします。
+
+--
+株式会社サンプル　営業部　山田 太郎
+TEL: 03-0000-0000　Mail: yamada@example.co.jp
+"""
+
+_STYLE = "<style>p{margin:0}.sig{color:#888}td{padding:2px}</style>"
+
+
+def _html_body(text: str) -> str:
+    paragraphs = "".join(
+        f"<p>{line or '&nbsp;'}</p>" for line in text.splitlines()
+    )
+    return f"<html><head>{_STYLE}</head><body><div>{paragraphs}</div></body></html>"
+
+
+def _leaf(mime_type: str, text: str, charset: str = "utf-8") -> Dict:
+    data = base64.urlsafe_b64encode(text.encode(charset)).decode("ascii")
+    return {
+        "mimeType": mime_type,
+        "headers": [{"name": "Content-Type", "value": f"{mime_type}; charset={charset}"}],
+        "body": {"size": len(data), "data": data},
+    }
+
+
+def _multipart(mime_type: str, parts: List[Dict]) -> Dict:
+    return {"mimeType": mime_type, "body": {"size": 0}, "parts": parts}
+
+
+def fixtures() -> Dict[str, Dict]:
+    attachment = {
+        "mimeType": "application/vnd.ms-excel",
+        "filename": "skillsheet.xls",
+        "body": {"size": 24576, "attachmentId": "ANGjdJ-sample"},
+    }
+    return {
+        "plain_utf8": _leaf("text/plain", _PLAIN_BODY),
+        "plain_iso2022jp": _leaf("text/plain", _PLAIN_BODY, "iso-2022-jp"),
+        "html_only": _leaf("text/html", _html_body(_PLAIN_BODY)),
+        "alternative": _multipart(
+            "multipart/alternative",
+            [_leaf("text/plain", _PLAIN_BODY), _leaf("text/html", _html_body(_PLAIN_BODY))],
+        ),
+        "mixed_with_attachment": _multipart(
+            "multipart/mixed",
+            [
+                _multipart(
+                    "multipart/alternative",
+                    [
+                        _leaf("text/plain", _PLAIN_BODY, "shift_jis"),
+                        _leaf("text/html", _html_body(_PLAIN_BODY), "shift_jis"),
+                    ],
+                ),
+                attachment,
+            ],
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="每种邮件的解析次数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复轮数，取最快一轮")
+    args = parser.parse_args()
+
+    print(f"{'fixture':<24}{'chars':>8}{'us/msg':>12}")
+    for name, payload in fixtures().items():
+        chars = len(extract_text(payload))
+        best = min(
+            timeit.repeat(
+                lambda: extract_text(payload), number=args.number, repeat=args.repeat
+            )
+        )
+        print(f"{name:<24}{chars:>8}{best / args.number * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
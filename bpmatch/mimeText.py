@@ -0,0 +1,162 @@
+import base64
+import threading
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# 换行语义的标签：开始标签前、结束标签后各断一行
+_BREAK_BEFORE = frozenset(("br", "p", "div", "li", "tr"))
+_BREAK_AFTER = frozenset(("p", "div", "li", "tr", "table"))
+# 内容不属于正文的标签（CSS/脚本），整体跳过
+_SKIP_CONTENT = frozenset(("style", "script", "head", "title"))
+# 有状态的 7bit 编码：按 UTF-8 也能「解码成功」，必须先按声明的字符集解
+_STATEFUL_CHARSETS = ("iso-2022-jp",)
+
+
+class HtmlToText(HTMLParser):
+    """
+    单遍 HTML → 纯文本：解析过程中直接按行输出，行尾空白去掉、连续空行折叠为一行，
+    不再对结果做正则/逐行的二次处理。实例可复用（convert 前自动 reset），但不是线程安全的。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+
+    def reset(self):
+        super().reset()
+        self._lines: List[str] = []
+        self._line: List[str] = []
+        self._blank = False
+        self._skip_depth = 0
+
+    def convert(self, html: str) -> str:
+        self.reset()
+        try:
+            self.feed(html)
+            self.close()
+        except Exception:
+            return html
+        self._break()
+        return "\n".join(self._lines).strip()
+
+    def _break(self):
+        line = "".join(self._line).rstrip()
+        self._line = []
+        if not line:
+            self._blank = True
+            return
+        if self._blank and self._lines:
+            self._lines.append("")
+        self._lines.append(line)
+        self._blank = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_CONTENT:
+            self._skip_depth += 1
+        elif tag in _BREAK_BEFORE:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_CONTENT:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in _BREAK_AFTER:
+            self._break()
+
+    def handle_data(self, data):
+        if self._skip_depth or not data:
+            return
+        first, *rest = data.split("\n")
+        self._line.append(first)
+        for segment in rest:
+            self._break()
+            self._line.append(segment)
+
+
+_local = threading.local()
+
+
+def html_to_text(html: str) -> str:
+    """
+    线程内复用同一个 HtmlToText（Gmail 详情在预取线程池中解析）。
+    """
+    converter = getattr(_local, "converter", None)
+    if converter is None:
+        converter = _local.converter = HtmlToText()
+    return converter.convert(html)
+
+
+def _charset_of(part: dict) -> Optional[str]:
+    for header in part.get("headers") or []:
+        if (header.get("name") or "").lower() != "content-type":
+            continue
+        for param in (header.get("value") or "").split(";")[1:]:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "charset":
+                return value.strip().strip('"').lower() or None
+    return None
+
+
+def decode_part(part: dict) -> str:
+    """
+    解码单个叶子 part 的 body.data。先试 UTF-8（可自校验），再按声明的字符集（Shift_JIS 等），
+    ISO-2022-JP 这类 7bit 编码则反过来优先按声明解码。
+    """
+    data = (part.get("body") or {}).get("data")
+    if not data:
+        return ""
+    raw = base64.urlsafe_b64decode(data)
+    charset = _charset_of(part)
+    candidates = ["utf-8"]
+    if charset and charset != "utf-8":
+        if charset.startswith(_STATEFUL_CHARSETS):
+            candidates.insert(0, charset)
+        else:
+            candidates.append(charset)
+    for encoding in candidates:
+        try:
+            return raw.decode(encoding)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return raw.decode("utf-8", errors="ignore")
+
+
+def _pick_alternative(parts: List[dict]) -> Optional[dict]:
+    """
+    multipart/alternative 只取一个：有 text/plain 就直接用它（不解码也不转换 HTML），
+    否则取最后一个（通常是最完整的 HTML 或 multipart/related）。
+    """
+    for part in parts:
+        if part.get("mimeType") == "text/plain" and (part.get("body") or {}).get("data"):
+            return part
+    return parts[-1] if parts else None
+
+
+def _collect(part: dict, plain: List[str], other: List[str]):
+    mime_type = part.get("mimeType", "")
+    children = part.get("parts")
+    if children:
+        if mime_type == "multipart/alternative":
+            chosen = _pick_alternative(children)
+            if chosen is not None:
+                _collect(chosen, plain, other)
+        else:
+            for child in children:
+                _collect(child, plain, other)
+        return
+
+    if mime_type == "text/plain":
+        plain.append(decode_part(part))
+    elif mime_type == "text/html":
+        other.append(html_to_text(decode_part(part)))
+    elif mime_type.startswith("text/"):
+        other.append(decode_part(part))
+
+
+def extract_text(payload: dict) -> str:
+    """
+    从 Gmail message.payload 抽取正文：text/plain 优先（按原顺序），其后是转换后的 HTML 等其他文本。
+    非 text/* 的叶子（图片、附件）不解码。
+    """
+    plain: List[str] = []
+    other: List[str] = []
+    _collect(payload or {}, plain, other)
+    return "\n\n".join(text for text in plain + other if text).strip()
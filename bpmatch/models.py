@@ -1,3 +1,5 @@
+import json
+
 from django.db import models
 
 
@@ -23,3 +25,178 @@ class SentEmailLog(models.Model):
 
     def __str__(self) -> str:
         return f"{self.message_id} @ {self.sent_at}"
+
+
+class OutboundEmail(models.Model):
+    """
+    发件队列（outbox）：待发送邮件的完整内容与重试状态，由 outbox worker 按配额发送，
+    结果同步到对应的 SentEmailLog.status。
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    sent_log = models.OneToOneField(
+        SentEmailLog, on_delete=models.CASCADE, related_name="outbound"
+    )
+    batch_id = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    payload = models.TextField()  # JSON：send_message 的参数（附件为 base64）
+    status = models.CharField(max_length=20, default=STATUS_QUEUED, db_index=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(db_index=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "outbound_emails"
+        ordering = ["next_attempt_at", "id"]
+
+    def __str__(self) -> str:
+        return f"{self.id}:{self.status}"
+
+
+class SendRateBucket(models.Model):
+    """
+    发件令牌桶的共享状态：web 进程内的发件线程与 send_outbox 命令按行锁更新同一行。
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    tokens = models.FloatField(default=0)
+    refilled_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "send_rate_buckets"
+
+    def __str__(self) -> str:
+        return f"{self.name}:{self.tokens:.2f}"
+
+
+class InboundEmail(models.Model):
+    """
+    本地缓存的 Gmail 收件，按 Gmail message id 去重，避免重复拉取 format=full 正文。
+    """
+
+    gmail_id = models.CharField(max_length=64, unique=True, db_index=True)
+    thread_id = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    subject = models.CharField(max_length=512, blank=True, default="")
+    sender = models.CharField(max_length=512, blank=True, default="")
+    to = models.TextField(blank=True, default="")
+    date = models.CharField(max_length=64, blank=True, default="")  # ISO 时间字符串
+    date_header = models.CharField(max_length=255, blank=True, default="")
+    message_id_header = models.CharField(max_length=512, blank=True, default="")
+    references_header = models.TextField(blank=True, default="")
+    internal_ts = models.FloatField(null=True, blank=True, db_index=True)  # 接收时间戳（秒）
+    body = models.TextField(blank=True, default="")
+    # JSON：拉取时的 Gmail labelIds；关键词检索也会落库发件箱等邮件，读取收件时按 INBOX 过滤
+    label_ids = models.TextField(blank=True, default="[]")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    INBOX_LABEL = "INBOX"
+
+    class Meta:
+        db_table = "inbound_emails"
+        ordering = ["-internal_ts"]
+
+    def __str__(self) -> str:
+        return f"{self.gmail_id}:{self.subject}"
+
+    @classmethod
+    def from_message(cls, message: dict) -> "InboundEmail":
+        """
+        由 GmailTool._parse_message 的结果构造模型实例（不保存）。
+        """
+        ts = message.get("internal_ts")
+        if ts is None or ts == float("-inf"):
+            ts = None
+        return cls(
+            gmail_id=message.get("id") or "",
+            thread_id=message.get("thread_id") or "",
+            subject=(message.get("subject") or "")[:512],
+            sender=(message.get("from") or "")[:512],
+            to=message.get("to") or "",
+            date=(message.get("date") or "")[:64],
+            date_header=(message.get("date_header") or "")[:255],
+            message_id_header=(message.get("message_id_header") or "")[:512],
+            references_header=message.get("references_header") or "",
+            internal_ts=ts,
+            body=message.get("body") or "",
+            label_ids=json.dumps(list(message.get("label_ids") or [])),
+        )
+
+    @classmethod
+    def inbox(cls):
+        return cls.objects.filter(label_ids__contains=json.dumps(cls.INBOX_LABEL))
+
+    def to_message(self) -> dict:
+        """
+        还原为 GmailTool._parse_message 的 dict 结构，供 bpmatch 直接使用。
+        """
+        return {
+            "id": self.gmail_id,
+            "subject": self.subject,
+            "from": self.sender,
+            "to": self.to,
+            "date": self.date,
+            "date_header": self.date_header,
+            "thread_id": self.thread_id,
+            "label_ids": self.labels(),
+            "message_id_header": self.message_id_header,
+            "references_header": self.references_header,
+            "internal_ts": (
+                self.internal_ts if self.internal_ts is not None else float("-inf")
+            ),
+            "body": self.body,
+            "body_loaded": True,
+        }
+
+    def labels(self) -> list:
+        try:
+            labels = json.loads(self.label_ids or "[]")
+        except ValueError:
+            return []
+        return labels if isinstance(labels, list) else []
+
+
+class GmailSyncState(models.Model):
+    """
+    Gmail 增量同步游标：记录上次同步到的 historyId。
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    history_id = models.BigIntegerField(default=0)
+    synced_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "gmail_sync_state"
+
+    def __str__(self) -> str:
+        return f"{self.name}@{self.history_id}"
+
+
+class LlmResultCache(models.Model):
+    """
+    LLM 调用结果缓存，按 (函数, prompt 版本, 模型, 归一化文本哈希) 内容寻址，多 worker 共享。
+    """
+
+    cache_key = models.CharField(max_length=64, unique=True, db_index=True)
+    func_name = models.CharField(max_length=64, db_index=True)
+    prompt_version = models.CharField(max_length=32)
+    model_name = models.CharField(max_length=128)
+    text_hash = models.CharField(max_length=64)
+    result = models.TextField(blank=True, default="")
+    hit_count = models.IntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "llm_result_cache"
+
+    def __str__(self) -> str:
+        return f"{self.func_name}:{self.cache_key[:12]}"
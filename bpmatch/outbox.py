@@ -0,0 +1,341 @@
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.db import connections, transaction
+from django.utils import timezone as dj_timezone
+
+from .conf import get_setting
+
+# messages.send 消耗 100 配额单位，单用户上限 250 单位/秒，约 2.5 封/秒；留出余量
+DEFAULT_SEND_RATE = 2.0  # 封/秒
+DEFAULT_SEND_BURST = 5
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # 秒，按 2^n 增长并加随机抖动
+BACKOFF_MAX = 30 * 60
+# 处于 sending 超过该时长说明 worker 中途退出，发送结果未知
+STALE_SENDING = timedelta(minutes=10)
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+BUCKET_NAME = "gmail_send"
+# 队列状态之外，SentEmailLog.status 额外使用的值
+LOG_STATUS_RETRYING = "retrying"
+
+
+class TokenBucket:
+    """
+    令牌桶：rate 个/秒匀速补充，最多积攒 capacity 个。acquire 在令牌不足时阻塞等待。
+    状态存于 send_rate_buckets 表的一行并在行锁内更新，web 进程的发件线程与 send_outbox 命令
+    （及多个 worker 进程）共用同一份 Gmail 配额，合计速率不会超过 rate。
+    """
+
+    def __init__(self, rate: float, capacity: int, name: str = BUCKET_NAME):
+        self.rate = max(float(rate), 0.01)
+        self.capacity = max(int(capacity), 1)
+        self.name = name
+
+    def _locked_state(self, now):
+        from .models import SendRateBucket
+
+        state, _ = SendRateBucket.objects.select_for_update().get_or_create(
+            name=self.name, defaults={"tokens": float(self.capacity), "refilled_at": now}
+        )
+        # 各进程时钟可能略有偏差，倒退时不补充
+        elapsed = max((now - state.refilled_at).total_seconds(), 0.0)
+        state.tokens = min(self.capacity, state.tokens + elapsed * self.rate)
+        state.refilled_at = max(now, state.refilled_at)
+        return state
+
+    def _take(self, n: int) -> float:
+        """
+        令牌足够时扣除并返回 0，否则不扣除，返回还需等待的秒数。
+        """
+        with transaction.atomic():
+            state = self._locked_state(dj_timezone.now())
+            wait = 0.0
+            if state.tokens >= n:
+                state.tokens -= n
+            else:
+                wait = (n - state.tokens) / self.rate
+            state.save(update_fields=["tokens", "refilled_at", "updated_at"])
+        return wait
+
+    def acquire(self, n: int = 1):
+        n = min(max(n, 1), self.capacity)
+        while True:
+            wait = self._take(n)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def drain(self):
+        """
+        Gmail 返回限流错误时清空令牌，所有进程的后续发送一起放慢。
+        """
+        with transaction.atomic():
+            state = self._locked_state(dj_timezone.now())
+            state.tokens = 0.0
+            state.save(update_fields=["tokens", "refilled_at", "updated_at"])
+
+
+bucket = TokenBucket(
+    float(get_setting("BPMATCH_SEND_RATE", DEFAULT_SEND_RATE)),
+    int(get_setting("BPMATCH_SEND_BURST", DEFAULT_SEND_BURST)),
+)
+
+
+def enqueue(messages: List[Dict], batch_id: str = "") -> List[int]:
+    """
+    将待发邮件写入队列，返回对应 SentEmailLog 的 ID（状态 queued，发送后更新）。
+    messages 中每项为 GmailTool.send_message 的参数 dict。
+    """
+    from .models import OutboundEmail, SentEmailLog
+
+    now = dj_timezone.now()
+    log_ids: List[int] = []
+    with transaction.atomic():
+        for msg in messages:
+            filenames = [
+                str(att.get("filename"))
+                for att in msg.get("attachments") or []
+                if isinstance(att, dict) and att.get("filename")
+            ]
+            log = SentEmailLog.objects.create(
+                # 真正的 Gmail message id 发送成功后才有，先用占位 ID
+                message_id=f"outbox:{uuid.uuid4().hex}",
+                to=msg.get("to") or "",
+                cc=msg.get("cc") or "",
+                subject=msg.get("subject") or "",
+                body=msg.get("body") or "",
+                attachments=json.dumps(filenames, ensure_ascii=False),
+                status=OutboundEmail.STATUS_QUEUED,
+                sent_at=now,
+            )
+            OutboundEmail.objects.create(
+                sent_log=log,
+                batch_id=batch_id,
+                payload=json.dumps(msg, ensure_ascii=False),
+                next_attempt_at=now,
+            )
+            log_ids.append(log.id)
+    return log_ids
+
+
+def _set_status(row, status: str, log_status: Optional[str] = None, **log_fields):
+    from .models import SentEmailLog
+
+    row.status = status
+    row.save(update_fields=["status", "attempts", "next_attempt_at", "last_error", "updated_at"])
+    SentEmailLog.objects.filter(id=row.sent_log_id).update(
+        status=log_status or status, updated_at=dj_timezone.now(), **log_fields
+    )
+
+
+def _recover_stale():
+    from .models import OutboundEmail, SentEmailLog
+
+    cutoff = dj_timezone.now() - STALE_SENDING
+    stale = list(
+        OutboundEmail.objects.filter(
+            status=OutboundEmail.STATUS_SENDING, updated_at__lt=cutoff
+        ).values_list("id", "sent_log_id")
+    )
+    if not stale:
+        return
+    # 可能已经发出，不自动重发，避免重复送信；标记失败由人工确认
+    OutboundEmail.objects.filter(id__in=[i for i, _ in stale]).update(
+        status=OutboundEmail.STATUS_FAILED,
+        last_error="发送中断，结果未知",
+        updated_at=dj_timezone.now(),
+    )
+    SentEmailLog.objects.filter(id__in=[log_id for _, log_id in stale]).update(
+        status=OutboundEmail.STATUS_FAILED
+    )
+
+
+def _claim(limit: int) -> list:
+    """
+    取出到期的 queued 记录并标记为 sending；SKIP LOCKED 保证多个 worker 进程不会重复领取。
+    """
+    from .models import OutboundEmail, SentEmailLog
+
+    now = dj_timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.STATUS_QUEUED, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:limit]
+        )
+        if rows:
+            OutboundEmail.objects.filter(id__in=[r.id for r in rows]).update(
+                status=OutboundEmail.STATUS_SENDING, updated_at=now
+            )
+            SentEmailLog.objects.filter(id__in=[r.sent_log_id for r in rows]).update(
+                status=OutboundEmail.STATUS_SENDING, updated_at=now
+            )
+    return rows
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(exc, HttpError):
+        return False
+    status = exc.resp.status
+    return status == 429 or (
+        status == 403 and any(reason in str(exc) for reason in RATE_LIMIT_REASONS)
+    )
+
+
+def is_transient(exc: Exception) -> bool:
+    from googleapiclient.errors import HttpError
+
+    if isinstance(exc, HttpError):
+        return exc.resp.status in TRANSIENT_STATUSES or is_rate_limited(exc)
+    return isinstance(exc, (TimeoutError, ConnectionError, OSError))
+
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _record(gmail_tool, row, response: Optional[dict], exc: Optional[Exception]):
+    from .models import OutboundEmail
+
+    row.attempts += 1
+    if exc is None and response and response.get("id"):
+        row.last_error = ""
+        _set_status(
+            row,
+            OutboundEmail.STATUS_SENT,
+            message_id=response["id"],
+            sent_at=gmail_tool._extract_sent_time(response),
+        )
+        return
+
+    exc = exc or RuntimeError("Gmail 未返回 message id")
+    row.last_error = str(exc)[:2000]
+    if is_transient(exc) and row.attempts < MAX_ATTEMPTS:
+        if is_rate_limited(exc):
+            bucket.drain()
+        row.next_attempt_at = dj_timezone.now() + _backoff(row.attempts)
+        _set_status(row, OutboundEmail.STATUS_QUEUED, LOG_STATUS_RETRYING)
+        print(f"[outbox] {row.id} 第 {row.attempts} 次发送失败，稍后重试: {exc}")
+    else:
+        _set_status(row, OutboundEmail.STATUS_FAILED)
+        print(f"[outbox] {row.id} 发送失败: {exc}")
+
+
+def run_once(gmail_tool) -> int:
+    """
+    领取一批（不超过令牌桶容量）到期邮件，等到令牌足够后用一次 batch 请求发出。返回本批数量。
+    """
+    from .models import OutboundEmail
+
+    rows = _claim(bucket.capacity)
+    if not rows:
+        return 0
+
+    send_bodies = []
+    ready = []
+    for row in rows:
+        try:
+            send_bodies.append(gmail_tool.build_send_body(**json.loads(row.payload)))
+            ready.append(row)
+        except Exception as exc:  # 参数错误，重试也不会成功
+            row.attempts += 1
+            row.last_error = str(exc)[:2000]
+            _set_status(row, OutboundEmail.STATUS_FAILED)
+    if not ready:
+        return len(rows)
+
+    bucket.acquire(len(ready))
+    try:
+        results = gmail_tool.send_batch(send_bodies)
+    except Exception as exc:
+        results = [(None, exc)] * len(ready)
+    for row, (response, exc) in zip(ready, results):
+        _record(gmail_tool, row, response, exc)
+    return len(rows)
+
+
+def drain(gmail_tool) -> int:
+    """
+    发送所有已到期的邮件，返回处理数量。
+    """
+    _recover_stale()
+    total = 0
+    while True:
+        n = run_once(gmail_tool)
+        if not n:
+            return total
+        total += n
+
+
+def seconds_until_next() -> Optional[float]:
+    from .models import OutboundEmail
+
+    next_at = (
+        OutboundEmail.objects.filter(status=OutboundEmail.STATUS_QUEUED)
+        .order_by("next_attempt_at")
+        .values_list("next_attempt_at", flat=True)
+        .first()
+    )
+    if next_at is None:
+        return None
+    return max((next_at - dj_timezone.now()).total_seconds(), 0.0)
+
+
+class OutboxWorker:
+    """
+    进程内的发件线程：enqueue 后 kick 一下即可，队列里还有待重试的邮件时睡到下次到期再继续，
+    队列清空后退出。也可以用 send_outbox 命令单独常驻运行，两者共用同一个令牌桶。
+    """
+
+    MAX_SLEEP = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kicked = False
+        self._thread: Optional[threading.Thread] = None
+
+    def kick(self) -> bool:
+        with self._lock:
+            self._kicked = True
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._run, name="bpmatch-outbox", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def _run(self):
+        from .gmailTool import get_gmail_tool
+
+        try:
+            while True:
+                with self._lock:
+                    self._kicked = False
+                try:
+                    drain(get_gmail_tool())
+                    delay = seconds_until_next()
+                except Exception as exc:
+                    print(f"[outbox] 发件线程异常: {exc}")
+                    delay = self.MAX_SLEEP
+                with self._lock:
+                    if delay is None and not self._kicked:
+                        self._thread = None
+                        return
+                if delay:
+                    time.sleep(min(delay, self.MAX_SLEEP))
+        finally:
+            connections.close_all()
+
+
+worker = OutboxWorker()
@@ -0,0 +1,114 @@
+import hashlib
+from typing import Optional, Tuple
+
+from .conf import get_setting
+
+CACHE_ALIAS = "bpmatch"
+TOKEN_TTL = 600  # 秒；Gmail 的 pageToken 本身也不宜长期使用
+# 向前查找已缓存 pageToken 的最大页数
+MAX_LOOKBACK = 50
+INBOX_GENERATION_KEY = "gmail:inbox_gen"
+
+
+def _cache():
+    try:
+        from django.core.cache import caches
+
+        return caches[get_setting("BPMATCH_PAGE_TOKEN_CACHE", CACHE_ALIAS)]
+    except Exception:
+        return None
+
+
+def _query_hash(final_query: str) -> str:
+    return hashlib.sha1(final_query.encode("utf-8")).hexdigest()
+
+
+class PageTokenCache:
+    """
+    (final_query, page_size, page) → pageToken 的缓存，存放在 Django cache（文件缓存，多 worker 共享）。
+    键中带有「收件代数 + 查询代数」：有新邮件到达时代数加一，旧的 pageToken 整体失效。
+    Django cache 不可用时所有操作都是空操作。
+    """
+
+    def _generation(self, cache, qhash: str) -> str:
+        gens = cache.get_many([INBOX_GENERATION_KEY, f"gmail:gen:{qhash}"])
+        return f"{gens.get(INBOX_GENERATION_KEY, 0)}.{gens.get(f'gmail:gen:{qhash}', 0)}"
+
+    def _key(self, qhash: str, gen: str, page_size: int, page: int) -> str:
+        return f"gmail:pt:{qhash}:{gen}:{page_size}:{page}"
+
+    def lookup(self, final_query: str, page_size: int, page: int) -> Tuple[int, Optional[str]]:
+        """
+        返回 (起始页, 该页的 pageToken)：取目标页及之前最近一个已缓存的 token；都没有时从第 1 页开始。
+        """
+        cache = _cache()
+        if cache is None or page <= 1:
+            return 1, None
+        try:
+            qhash = _query_hash(final_query)
+            gen = self._generation(cache, qhash)
+            pages = list(range(page, max(page - MAX_LOOKBACK, 1), -1))
+            found = cache.get_many([self._key(qhash, gen, page_size, p) for p in pages])
+            for p in pages:
+                token = found.get(self._key(qhash, gen, page_size, p))
+                if token:
+                    return p, token
+        except Exception as exc:
+            print(f"[page_token] 读取缓存失败: {exc}")
+        return 1, None
+
+    def store(self, final_query: str, page_size: int, page: int, token: str):
+        cache = _cache()
+        if cache is None or not token:
+            return
+        try:
+            qhash = _query_hash(final_query)
+            gen = self._generation(cache, qhash)
+            cache.set(self._key(qhash, gen, page_size, page), token, TOKEN_TTL)
+        except Exception as exc:
+            print(f"[page_token] 写入缓存失败: {exc}")
+
+    def observe_head(self, final_query: str, first_page_resp: dict):
+        """
+        第 1 页的首条邮件 ID 变化说明该查询有新邮件，令该查询的 pageToken 失效。
+        """
+        cache = _cache()
+        messages = first_page_resp.get("messages") or []
+        if cache is None or not messages:
+            return
+        try:
+            qhash = _query_hash(final_query)
+            head_id = messages[0].get("id")
+            head_key = f"gmail:head:{qhash}"
+            previous = cache.get(head_key)
+            if previous and previous != head_id:
+                self._bump(cache, f"gmail:gen:{qhash}")
+            cache.set(head_key, head_id, None)
+        except Exception as exc:
+            print(f"[page_token] 更新查询代数失败: {exc}")
+
+    def invalidate(self, final_query: Optional[str] = None):
+        """
+        指定查询时只让该查询失效；否则（有新邮件同步进来）让所有查询失效。
+        """
+        cache = _cache()
+        if cache is None:
+            return
+        try:
+            if final_query is None:
+                self._bump(cache, INBOX_GENERATION_KEY)
+            else:
+                self._bump(cache, f"gmail:gen:{_query_hash(final_query)}")
+        except Exception as exc:
+            print(f"[page_token] 失效处理失败: {exc}")
+
+    @staticmethod
+    def _bump(cache, key: str):
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+page_tokens = PageTokenCache()
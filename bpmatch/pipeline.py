@@ -0,0 +1,94 @@
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, TypeVar
+
+from django.db import connections
+
+from .conf import get_setting
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# 每台 Ollama 主机的默认并发数；主机的并行度由 OLLAMA_NUM_PARALLEL 决定，两者保持一致即可
+DEFAULT_CONCURRENCY = 4
+
+# 进程内共用一个线程池：并发上限对整个进程生效，而不是每个请求各自一份
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_worker = threading.local()
+
+
+def get_concurrency() -> int:
+    """
+    总并发 = 每台主机的并发 × BPMATCH_OLLAMA_HOSTS 中的主机数，增加主机即可线性提升吞吐。
+    """
+    per_host = max(int(get_setting("BPMATCH_LLM_CONCURRENCY", DEFAULT_CONCURRENCY)), 1)
+    return per_host * max(len(get_setting("BPMATCH_OLLAMA_HOSTS", None) or ()), 1)
+
+
+def map_bounded(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    concurrency: Optional[int] = None,
+) -> List[R]:
+    """
+    以有限并发对 items 执行 func，结果顺序与输入一致。
+    LLM / Gmail 调用的耗时主要在等待 IO，线程池即可打满本地模型服务。
+    """
+    return list(iter_bounded(func, items, concurrency))
+
+
+def iter_bounded(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    concurrency: Optional[int] = None,
+) -> Iterator[R]:
+    """
+    map_bounded 的流式版本：按输入顺序逐个产出结果，前面的结果完成即可被消费。
+    任务提交到进程共用的线程池，每次调用最多同时占用 concurrency 个任务，多个请求交替排队；
+    生成器被关闭（如流式响应的客户端断开）时取消尚未开始的任务，不等待它们完成。
+    """
+    items = list(items)
+    workers = concurrency or get_concurrency()
+    # 在池内线程中再次调用时直接顺序执行，避免占满线程池后互相等待
+    if workers <= 1 or len(items) <= 1 or getattr(_worker, "active", False):
+        for item in items:
+            yield func(item)
+        return
+
+    def run(item: T) -> R:
+        _worker.active = True
+        try:
+            return func(item)
+        finally:
+            _worker.active = False
+            # 工作线程内的 ORM 连接（如 LLM 缓存查询）用完即关，避免连接泄漏
+            connections.close_all()
+
+    executor = _get_executor()
+    remaining = iter(items)
+    pending: Deque = deque(
+        executor.submit(run, item) for item in itertools.islice(remaining, workers)
+    )
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for item in itertools.islice(remaining, 1):
+                pending.append(executor.submit(run, item))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_concurrency(), thread_name_prefix="bpmatch-llm"
+                )
+    return _executor
@@ -0,0 +1,162 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from .skillCanon import canonicalizer
+
+KIND_QIUREN = "qiuren"  # 求人：发件方有案件
+KIND_QIUANJIAN = "qiuanjian"  # 求案件：发件方有人
+
+# 国籍标记（NFKC 之后匹配）。「非日本籍」「日本人と同等（の日本語力）」等不能算作日本籍
+_JP_NATIONALITY = r"(?<!非)日本国?籍(?![^\n]{0,4}(?:以外|不問))"
+_NATIVE_LIKE = r"(?:と同等|同等|並み|並|レベル|ネイティブ)"
+_QIUREN_JP_ONLY_RE = re.compile(
+    r"外国籍(?:の方は)?(?:不可|NG|ng)|" + _JP_NATIONALITY + r"(?:のみ|限定)?"
+    r"|(?<!非)日本人(?:のみ|限定)|国籍\s*[:：]\s*日本(?![^\n]{0,4}(?:以外|不問))"
+)
+_QIUREN_ANY_RE = re.compile(r"外国籍(?:の方も)?(?:可|OK|ok)|非日本国?籍|国籍不問|国籍\s*[:：]\s*不問")
+_QIUANJIAN_JP_RE = re.compile(
+    _JP_NATIONALITY
+    + r"|(?<![非外])日本人(?!" + _NATIVE_LIKE + r")"
+    + r"|国籍\s*[:：]\s*日本(?![^\n]{0,4}(?:以外|不問))"
+)
+_QIUANJIAN_FOREIGN_RE = re.compile(
+    r"外国籍|非日本国?籍|日本国?籍以外|(?:中国|韓国|台湾|ベトナム|フィリピン|インド|ミャンマー|ネパール|タイ)国?籍"
+    r"|国籍\s*[:：]\s*(?:(?!日本|不問)\S|日本以外)"
+)
+# 出现这些词但未命中上面的模式时（含「日本人と同等」这类），视为置信度不足交给 LLM
+_NATIONALITY_HINT_RE = re.compile(r"国籍|外国|日本人")
+
+_AMOUNT = r"(\d[\d,]*(?:\.\d+)?)(?:\s*[~〜～\-ー]\s*\d[\d,]*(?:\.\d+)?)?\s*(万円|万|円)"
+_AMOUNT_RE = re.compile(_AMOUNT)
+# 关键词后紧跟的金额（允许无单位，如「単価:60」）
+_KEYWORD_AMOUNT_RE = re.compile(
+    r"(?:単価|時給|月給|月額|年収|報酬|金額|希望額)[^\d\n]{0,20}(\d[\d,]*(?:\.\d+)?)\s*(万円|万|円)?"
+)
+
+# 非关键词位置的金额中，这些上下文（署名中的资本金等）不是报酬
+_NON_PRICE_CONTEXT_RE = re.compile(r"(?:資本金|売上|年商|従業員|設立)[^\n]{0,10}$")
+# 技能相关的行：其中出现词典外的技术词时，技能交给 LLM 补充
+_SKILL_LINE_RE = re.compile(r"^.*(?:スキル|言語|技術|環境|経験|フレームワーク|ツール|DB|OS).*$", re.MULTILINE)
+_TECH_WORD = r"[A-Za-z][A-Za-z0-9.+#_-]*[A-Za-z0-9+#]"
+# 空格相连的多个英文词作为一个整体先查词典（Spring Boot、Ruby on Rails），查不到再逐词判断
+_TECH_TOKEN_RE = re.compile(rf"{_TECH_WORD}(?: {_TECH_WORD})*")
+# 技能行中常见、但不是技术名的英文缩写
+_NON_TECH_TOKENS = frozenset(
+    "pm pl pmo se pg tl pjm ok ng it web api db os ui ux sier ses fr etc nda eng "
+    "mail tel fax url year years skill skills".split()
+)
+
+FIELDS = ("country", "skills", "price")
+
+
+class RuleExtractor:
+    """
+    求人/求案件正文的确定性抽取：国籍标记、技能关键词、首个金额。
+    返回无法可靠判定的字段列表，只有这些字段才需要 LLM 补充。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resolved = 0
+        self._partial = 0
+
+    def extract(self, text: str, kind: str) -> Tuple[Dict, List[str]]:
+        folded = unicodedata.normalize("NFKC", text or "")
+        result: Dict = {}
+        unresolved: List[str] = []
+
+        country = self._country(folded, kind)
+        if country is None:
+            unresolved.append("country")
+            country = 1
+        result["country"] = country
+
+        skills = canonicalizer.scan(folded)
+        if not skills or self._has_unknown_tech(folded):
+            unresolved.append("skills")
+        result["skills"] = skills
+
+        price, confident = self._price(folded)
+        if not confident:
+            unresolved.append("price")
+        result["price"] = price
+
+        with self._lock:
+            if unresolved:
+                self._partial += 1
+            else:
+                self._resolved += 1
+        return result, unresolved
+
+    def _country(self, text: str, kind: str) -> Optional[int]:
+        if kind == KIND_QIUREN:
+            jp_hit = bool(_QIUREN_JP_ONLY_RE.search(text))
+            any_hit = bool(_QIUREN_ANY_RE.search(text))
+        else:
+            jp_hit = bool(_QIUANJIAN_JP_RE.search(text))
+            any_hit = bool(_QIUANJIAN_FOREIGN_RE.search(text))
+        if jp_hit and any_hit:
+            return None  # 矛盾标记
+        if jp_hit:
+            return 0
+        if any_hit:
+            return 1
+        # 完全没有国籍相关表述时，按规则默认 1；有相关字眼却未命中模式时交给 LLM
+        return None if _NATIONALITY_HINT_RE.search(text) else 1
+
+    def _has_unknown_tech(self, text: str) -> bool:
+        """
+        技能相关行中是否有词典外、像技术名的英文词（如 Nuxt、Snowflake）；有则规则结果不完整。
+        """
+        for line in _SKILL_LINE_RE.findall(text):
+            for phrase in _TECH_TOKEN_RE.findall(line):
+                if canonicalizer.known(phrase):
+                    continue
+                for token in phrase.split():
+                    folded = token.lower()
+                    if folded in _NON_TECH_TOKENS or sum(ch.isalpha() for ch in folded) < 2:
+                        continue
+                    if not canonicalizer.known(folded):
+                        return True
+        return False
+
+    def _price(self, text: str) -> Tuple[int, bool]:
+        """
+        返回 (金额, 是否可靠)。金额关键词之后的第一个数值视为可靠；
+        否则取正文中第一个带「万/円」、且不在资本金等上下文中的金额，但交给 LLM 复核；都没有则为 (0, True)。
+        「万」单位输出万数（60），「円」或无单位输出数值本身（600000）。
+        """
+        m = _KEYWORD_AMOUNT_RE.search(text)
+        confident = m is not None
+        if m is None:
+            m = next(
+                (
+                    a
+                    for a in _AMOUNT_RE.finditer(text)
+                    if not _NON_PRICE_CONTEXT_RE.search(text, 0, a.start())
+                ),
+                None,
+            )
+            if m is None:
+                # 只有资本金之类的金额时也交给 LLM，没有任何金额时 0 即为结论
+                return 0, not _AMOUNT_RE.search(text)
+        try:
+            value = float(m.group(1).replace(",", ""))
+        except ValueError:
+            return 0, False
+        return int(value), confident
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self._resolved + self._partial
+            return {
+                "total": total,
+                "rule_only": self._resolved,
+                "llm_assisted": self._partial,
+                "rule_only_rate": round(self._resolved / total, 4) if total else 0.0,
+            }
+
+
+extractor = RuleExtractor()
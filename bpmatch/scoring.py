@@ -0,0 +1,240 @@
+import heapq
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .skillIndex import SkillIndex, normalize_skills
+
+# 各项得分权重：技能重叠为主，正文语义相似度补足同义不同写法，单价与新鲜度做次要排序
+SKILL_WEIGHT = 1.0
+SEMANTIC_WEIGHT = 2.0
+PRICE_WEIGHT = 0.3
+RECENCY_WEIGHT = 0.2
+# 语义检索每次取回的候选数；没有技能重叠的候选人须达到该相似度才进入结果
+SEMANTIC_TOP_K = 200
+SEMANTIC_MIN_SIMILARITY = 0.6
+# 新鲜度半衰期（天）
+RECENCY_HALF_LIFE_DAYS = 7
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def to_man_yen(value) -> float:
+    """
+    单价统一换算为「万円」：LLM 抽取结果可能是 60（万）也可能是 600000（円）。
+    """
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if price <= 0:
+        return 0.0
+    return price / 10000 if price >= 10000 else price
+
+
+def idf(index: SkillIndex, partition: str, skill: str) -> float:
+    """
+    稀有技能权重更高（IDF）；在该国籍分区内出现越少的技能得分越高。
+    """
+    n = index.partition_size(partition)
+    df = index.doc_freq(partition, skill)
+    return math.log(1 + (n + 1) / (df + 1))
+
+
+def price_score(job_price: float, candidate_price: float) -> float:
+    """
+    候选人单价不高于求人单价时满分；超出部分按比例衰减。任一方未知时给中性分。
+    """
+    if job_price <= 0 or candidate_price <= 0:
+        return 0.5
+    if candidate_price <= job_price:
+        return 1.0
+    return max(0.0, 1.0 - (candidate_price - job_price) / job_price)
+
+
+def recency_score(internal_ts, now: Optional[float] = None) -> float:
+    try:
+        ts = float(internal_ts)
+    except (TypeError, ValueError):
+        return 0.0
+    if not math.isfinite(ts):
+        return 0.0
+    age_days = max((now or time.time()) - ts, 0) / 86400
+    return 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def rank(
+    index: SkillIndex,
+    partition: str,
+    overlaps: Dict[str, List[str]],
+    job_price=0,
+    page: int = 1,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    similarities: Optional[Dict[str, float]] = None,
+    max_price=0,
+) -> Tuple[List[Dict], int]:
+    """
+    对倒排索引命中的候选人打分，同一 dup_group（同 thread / 近重复）只保留得分最高的一封，
+    再用堆只选出目标页所需的前 page*page_size 个。返回 (当前页结果, 折叠后的命中总数)。
+    similarities 为向量检索结果 {id: 余弦相似度}：按权重计入得分，
+    技能没有重叠但相似度足够高的候选人也一并参与排序。max_price（万円）> 0 时排除单价超出的候选人。
+    """
+    similarities = similarities or {}
+    overlaps = dict(overlaps)
+    for msg_id, sim in similarities.items():
+        if msg_id not in overlaps and sim >= SEMANTIC_MIN_SIMILARITY:
+            overlaps[msg_id] = []
+    max_price_man = to_man_yen(max_price)
+    if max_price_man > 0:
+        overlaps = {
+            msg_id: matched
+            for msg_id, matched in overlaps.items()
+            if to_man_yen((index.get(msg_id) or {}).get("price")) <= max_price_man
+        }
+    page = max(int(page or 1), 1)
+    page_size = min(max(int(page_size or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    job_price_man = to_man_yen(job_price)
+    now = time.time()
+
+    idf_cache: Dict[str, float] = {}
+
+    def score_of(item: Tuple[str, List[str]]) -> float:
+        msg_id, matched = item
+        message = index.get(msg_id) or {}
+        skill_score = 0.0
+        for skill in matched:
+            if skill not in idf_cache:
+                idf_cache[skill] = idf(index, partition, skill)
+            skill_score += idf_cache[skill]
+        return (
+            SKILL_WEIGHT * skill_score
+            + SEMANTIC_WEIGHT * max(similarities.get(msg_id, 0.0), 0.0)
+            + PRICE_WEIGHT * price_score(job_price_man, to_man_yen(message.get("price")))
+            + RECENCY_WEIGHT * recency_score(message.get("internal_ts"), now)
+        )
+
+    # dup_group → [最高分, 对应条目, 被折叠的其他 ID]
+    best: Dict[str, list] = {}
+    for item in overlaps.items():
+        score = score_of(item)
+        message = index.get(item[0]) or {}
+        group = message.get("dup_group") or item[0]
+        current = best.get(group)
+        if current is None:
+            best[group] = [score, item, []]
+        elif score > current[0]:
+            current[2].append(current[1][0])
+            current[0], current[1] = score, item
+        else:
+            current[2].append(item[0])
+
+    top = heapq.nlargest(page * page_size, best.values(), key=lambda entry: entry[0])
+
+    results: List[Dict] = []
+    for score, (msg_id, matched), duplicates in top[(page - 1) * page_size :]:
+        message = index.get(msg_id)
+        if message is None:
+            continue
+        results.append(
+            {
+                **message,
+                "matched_skills": sorted(matched),
+                "score": round(score, 4),
+                "semantic_score": round(similarities.get(msg_id, 0.0), 4),
+                "duplicate_ids": duplicates,
+            }
+        )
+    return results, len(best)
+
+
+def rank_matrix(
+    index: SkillIndex,
+    partition: str,
+    skills: List[str],
+    job_price=0,
+    page: int = 1,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    similarities: Optional[Dict[str, float]] = None,
+    max_price=0,
+) -> Tuple[List[Dict], int]:
+    """
+    rank 的向量化版本：在 index.matrix() 的位矩阵上一次算出分区内所有候选人的得分，
+    折叠 dup_group 后只为当前页构造结果。打分公式、返回值与 rank 相同；未安装 numpy 时调用方改用 rank。
+    """
+    import numpy as np
+
+    matrix = index.matrix()
+    page = max(int(page or 1), 1)
+    page_size = min(max(int(page_size or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    similarities = similarities or {}
+    job_price_man = to_man_yen(job_price)
+    if not len(matrix):
+        return [], 0
+
+    packed, known = matrix.query(normalize_skills(list(skills)))
+    skill_score = np.zeros(len(matrix))
+    for skill in known:
+        skill_score += idf(index, partition, skill) * matrix.has_skill(skill)
+    sims = np.zeros(len(matrix))
+    for msg_id, sim in similarities.items():
+        row = matrix.row_of(msg_id)
+        if row is not None:
+            sims[row] = sim
+
+    hit = sims >= SEMANTIC_MIN_SIMILARITY
+    if known:
+        hit |= matrix.overlap_counts(packed) > 0
+    rows = np.flatnonzero(matrix.mask(partition, to_man_yen(max_price)) & hit)
+    if not rows.size:
+        return [], 0
+
+    prices = matrix.prices[rows]
+    if job_price_man > 0:
+        price = np.where(
+            prices <= 0,
+            0.5,
+            np.where(
+                prices <= job_price_man,
+                1.0,
+                np.clip(1.0 - (prices - job_price_man) / job_price_man, 0.0, None),
+            ),
+        )
+    else:
+        price = np.full(rows.size, 0.5)
+    ts = matrix.timestamps[rows]
+    finite = np.isfinite(ts)
+    age_days = np.maximum(time.time() - np.where(finite, ts, 0.0), 0) / 86400
+    recency = np.where(finite, 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS), 0.0)
+
+    scores = (
+        SKILL_WEIGHT * skill_score[rows]
+        + SEMANTIC_WEIGHT * np.maximum(sims[rows], 0.0)
+        + PRICE_WEIGHT * price
+        + RECENCY_WEIGHT * recency
+    )
+
+    # 按得分降序排列后，每个 dup_group 第一次出现的位置即该组得分最高的一封
+    order = rows[np.argsort(-scores, kind="stable")]
+    score_of = dict(zip(rows.tolist(), scores.tolist()))
+    groups = matrix.groups[order]
+    _, first = np.unique(groups, return_index=True)
+    best = np.sort(first)
+
+    results: List[Dict] = []
+    for pos in best[(page - 1) * page_size : page * page_size]:
+        row = int(order[pos])
+        msg_id = matrix.ids[row]
+        message = index.get(msg_id)
+        if message is None:
+            continue
+        same_group = order[groups == groups[pos]]
+        results.append(
+            {
+                **message,
+                "matched_skills": sorted(set(known) & index.skills_of(msg_id)),
+                "score": round(score_of[row], 4),
+                "semantic_score": round(float(sims[row]), 4),
+                "duplicate_ids": [matrix.ids[r] for r in same_group.tolist() if r != row],
+            }
+        )
+    return results, int(best.size)
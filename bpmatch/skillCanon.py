@@ -0,0 +1,141 @@
+import json
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SYNONYMS_PATH = Path(__file__).resolve().parent / "data" / "skill_synonyms.json"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_END = "\0"  # trie 结点上的终止标记，值为规范名
+# 不超过该长度的纯英数字别名（c / go / js / ts / py）在自由文本中极易误命中，
+# 扫描时要求两侧都不是任何文字（含假名/汉字），如「C案件」「ランクC」不算技能
+SHORT_ALIAS_LEN = 2
+
+
+def fold(text: str) -> str:
+    """
+    NFKC（全角→半角，如「ＡＷＳ」→「AWS」）+ 小写 + 折叠空白。
+    """
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _compact(text: str) -> str:
+    # 去掉空白后的查找键，使「Java Script」「javascript」命中同一条目
+    return text.replace(" ", "")
+
+
+class SkillCanonicalizer:
+    """
+    技能别名表：精确查找用 dict，自由文本扫描用字符 trie（最长匹配）。
+    由版本化的同义词文件构建，进程内只构建一次。
+    """
+
+    def __init__(self, synonyms: Dict[str, List[str]], version: int = 0):
+        self.version = version
+        self._lookup: Dict[str, str] = {}
+        self._trie: Dict = {}
+        for canonical, aliases in synonyms.items():
+            canonical_folded = fold(canonical)
+            for alias in [canonical, *aliases]:
+                folded = fold(alias)
+                if not folded:
+                    continue
+                self._lookup[_compact(folded)] = canonical_folded
+                self._insert(folded, canonical_folded)
+
+    def _insert(self, alias: str, canonical: str):
+        node = self._trie
+        for ch in alias:
+            node = node.setdefault(ch, {})
+        node[_END] = canonical
+
+    def canonical(self, skill: str) -> str:
+        """
+        单个技能名 → 规范名；不在别名表中的技能按折叠后的原文返回。
+        """
+        folded = fold(skill)
+        return self._lookup.get(_compact(folded), folded)
+
+    def known(self, skill: str) -> bool:
+        return _compact(fold(skill)) in self._lookup
+
+    def canonicalize(self, skills_raw) -> List[str]:
+        if not isinstance(skills_raw, (list, tuple, set, frozenset)):
+            return []
+        dedup: List[str] = []
+        seen = set()
+        for skill in skills_raw:
+            canonical = self.canonical(skill)
+            if canonical and canonical not in seen:
+                dedup.append(canonical)
+                seen.add(canonical)
+        return dedup
+
+    def scan(self, text: str) -> List[str]:
+        """
+        在自由文本中按最长匹配找出所有已知技能（按出现顺序去重）。
+        英数字别名要求两侧不是英数字，避免「go」命中「google」；
+        短别名（见 SHORT_ALIAS_LEN）还要求两侧不是假名/汉字。
+        """
+        folded = fold(text)
+        found: List[str] = []
+        seen = set()
+        i = 0
+        length = len(folded)
+        while i < length:
+            match = self._longest_match(folded, i)
+            if match is None:
+                i += 1
+                continue
+            end, canonical = match
+            if canonical not in seen:
+                found.append(canonical)
+                seen.add(canonical)
+            i = end
+        return found
+
+    def _longest_match(self, text: str, start: int) -> Optional[Tuple[int, str]]:
+        if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(text[start]):
+            return None
+        node = self._trie
+        best: Optional[Tuple[int, str]] = None
+        i = start
+        while i < len(text) and text[i] in node:
+            node = node[text[i]]
+            i += 1
+            if _END in node and not (
+                i < len(text) and _is_word_char(text[i - 1]) and _is_word_char(text[i])
+            ):
+                if _is_short_alias(text[start:i]) and not _isolated(text, start, i):
+                    continue
+                best = (i, node[_END])
+        return best
+
+
+def _is_short_alias(alias: str) -> bool:
+    return len(alias) <= SHORT_ALIAS_LEN and alias.isascii() and alias.isalnum()
+
+
+def _isolated(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch == "_")
+
+
+def _load() -> SkillCanonicalizer:
+    try:
+        with open(SYNONYMS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as exc:
+        print(f"[skill_canon] 读取同义词文件失败，仅做宽度/大小写归一: {exc}")
+        data = {}
+    return SkillCanonicalizer(data.get("skills") or {}, int(data.get("version") or 0))
+
+
+canonicalizer = _load()
@@ -0,0 +1,149 @@
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from .skillCanon import canonicalizer
+
+
+def normalize_skills(skills_raw) -> List[str]:
+    """
+    Normalize skills into canonical unique list（宽度/大小写折叠 + 同义词归一，见 skillCanon）。
+    """
+    return canonicalizer.canonicalize(skills_raw)
+
+
+def country_of(message: Dict) -> str:
+    """
+    求案件的国籍分区键："0" 日本籍，"1" 非日本籍（缺省）。
+    抽取结果的字段名是 country，兼容旧数据中的 country_code。
+    """
+    value = message.get("country_code", message.get("country", "1"))
+    return str(value).strip() or "1"
+
+
+def _timestamp(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class SkillIndex:
+    """
+    求案件倒排索引：国籍分区 → 归一化技能 → 候选人 ID。
+    每个候选人的技能只在加入索引时归一化一次；匹配成本与命中的倒排链长度成正比，与人员池大小无关。
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, Set[str]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self._skills: Dict[str, FrozenSet[str]] = {}
+        self._country: Dict[str, str] = {}
+        self._messages: Dict[str, Dict] = {}
+        self._partition_sizes: Counter = Counter()
+        # 构建时使用的同义词版本；版本变化后需整体重建
+        self.canon_version = canonicalizer.version
+        self._matrix = None  # 位矩阵，首次匹配时按当前内容生成，增删后作废
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __contains__(self, msg_id: str) -> bool:
+        return msg_id in self._messages
+
+    def copy(self) -> "SkillIndex":
+        clone = SkillIndex()
+        for country, postings in self._postings.items():
+            for skill, ids in postings.items():
+                clone._postings[country][skill] = set(ids)
+        clone._skills = dict(self._skills)
+        clone._country = dict(self._country)
+        clone._messages = dict(self._messages)
+        clone._partition_sizes = Counter(self._partition_sizes)
+        clone.canon_version = self.canon_version
+        return clone
+
+    def add(self, message: Dict):
+        msg_id = message.get("id")
+        if not msg_id:
+            return
+        if msg_id in self._messages:
+            self.remove(msg_id)
+        skills = frozenset(normalize_skills(message.get("skills", [])))
+        country = country_of(message)
+        for skill in skills:
+            self._postings[country][skill].add(msg_id)
+        self._skills[msg_id] = skills
+        self._country[msg_id] = country
+        self._messages[msg_id] = message
+        self._partition_sizes[country] += 1
+        self._matrix = None
+
+    def remove(self, msg_id: str):
+        if msg_id not in self._messages:
+            return
+        country = self._country.pop(msg_id)
+        postings = self._postings[country]
+        for skill in self._skills.pop(msg_id):
+            ids = postings.get(skill)
+            if ids is not None:
+                ids.discard(msg_id)
+                if not ids:
+                    del postings[skill]
+        del self._messages[msg_id]
+        self._partition_sizes[country] -= 1
+        self._matrix = None
+
+    def get(self, msg_id: str) -> Optional[Dict]:
+        return self._messages.get(msg_id)
+
+    def skills_of(self, msg_id: str) -> FrozenSet[str]:
+        return self._skills.get(msg_id, frozenset())
+
+    def doc_freq(self, country: str, skill: str) -> int:
+        return len(self._postings.get(country, {}).get(skill, ()))
+
+    def partition_size(self, country: str) -> int:
+        return self._partition_sizes.get(country, 0)
+
+    def overlaps(self, country: str, skills: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        返回 {候选人 ID: 命中的技能列表}，只遍历 job 技能对应的倒排链；len(列表) 即重叠数。
+        """
+        postings = self._postings.get(country)
+        matched: Dict[str, List[str]] = {}
+        if not postings:
+            return matched
+        for skill in normalize_skills(list(skills)):
+            for msg_id in postings.get(skill, ()):
+                matched.setdefault(msg_id, []).append(skill)
+        return matched
+
+    def matrix(self):
+        """
+        返回与当前内容一致的 SkillMatrix（见 skillMatrix）；未安装 numpy 时返回 None。
+        快照发布后索引不再修改，每个进程只在首次匹配时构建一次。
+        """
+        from . import skillMatrix
+        from .scoring import to_man_yen
+
+        if not skillMatrix.available():
+            return None
+        if self._matrix is None:
+            ids = list(self._messages)
+            self._matrix = skillMatrix.SkillMatrix(
+                ids,
+                [self._skills[msg_id] for msg_id in ids],
+                [self._country[msg_id] for msg_id in ids],
+                [to_man_yen(self._messages[msg_id].get("price")) for msg_id in ids],
+                [_timestamp(self._messages[msg_id].get("internal_ts")) for msg_id in ids],
+                [self._messages[msg_id].get("dup_group") or msg_id for msg_id in ids],
+            )
+        return self._matrix
+
+    @classmethod
+    def build(cls, messages: Iterable[Dict]) -> "SkillIndex":
+        index = cls()
+        for m in messages:
+            index.add(m)
+        return index
@@ -0,0 +1,93 @@
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时退回倒排索引逐个打分
+    np = None
+
+WORD_BITS = 64
+
+
+def available() -> bool:
+    return np is not None
+
+
+class SkillMatrix:
+    """
+    求案件技能的位矩阵：每行一个候选人，共享词表中第 j 个技能对应第 j 位，按 64 位打包为 uint64。
+    一次 AND + popcount 即得全部候选人与求人的技能重叠数；
+    国籍、单价、接收时间、折叠分组都是与行对齐的列，过滤和打分都是向量化运算。
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        skill_sets: Sequence[FrozenSet[str]],
+        partitions: Sequence[str],
+        prices: Sequence[float],
+        timestamps: Sequence[float],
+        groups: Sequence[str],
+    ):
+        self.ids = list(ids)
+        self.vocab: Dict[str, int] = {}
+        for skills in skill_sets:
+            for skill in sorted(skills):
+                self.vocab.setdefault(skill, len(self.vocab))
+        n_words = max((len(self.vocab) + WORD_BITS - 1) // WORD_BITS, 1)
+
+        # 先用 Python int 拼好每行的各个字，再一次性转成数组，避免逐位写 numpy 标量
+        rows = []
+        for skills in skill_sets:
+            words = [0] * n_words
+            for skill in skills:
+                j = self.vocab[skill]
+                words[j // WORD_BITS] |= 1 << (j % WORD_BITS)
+            rows.append(words)
+        self.words = np.array(rows, dtype=np.uint64).reshape(len(self.ids), n_words)
+
+        self.partitions = np.asarray(partitions, dtype=str)
+        self.prices = np.asarray(prices, dtype=np.float64)  # 万円，未知为 0
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)  # 秒，未知为 nan
+        # 折叠分组编码为整数，同组候选人的 code 相同
+        _, self.groups = np.unique(np.asarray(groups, dtype=str), return_inverse=True)
+        self._row = {msg_id: i for i, msg_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_of(self, msg_id: str) -> Optional[int]:
+        return self._row.get(msg_id)
+
+    def query(self, skills: Sequence[str]) -> Tuple["np.ndarray", List[str]]:
+        """
+        把求人技能打包成与行同宽的位向量；返回 (位向量, 词表中存在的技能)。
+        """
+        packed = [0] * self.words.shape[1]
+        known: List[str] = []
+        for skill in skills:
+            j = self.vocab.get(skill)
+            if j is None or skill in known:
+                continue
+            packed[j // WORD_BITS] |= 1 << (j % WORD_BITS)
+            known.append(skill)
+        return np.array(packed, dtype=np.uint64), known
+
+    def overlap_counts(self, packed: "np.ndarray") -> "np.ndarray":
+        return np.bitwise_count(self.words & packed).sum(axis=1, dtype=np.int32)
+
+    def has_skill(self, skill: str, rows: Optional["np.ndarray"] = None) -> "np.ndarray":
+        """
+        某个技能所在的位列（bool 数组）；指定 rows 时只取这些行。
+        """
+        j = self.vocab[skill]
+        words = self.words[:, j // WORD_BITS] if rows is None else self.words[rows, j // WORD_BITS]
+        return ((words >> np.uint64(j % WORD_BITS)) & np.uint64(1)) == 1
+
+    def mask(self, partition: str, max_price: float = 0) -> "np.ndarray":
+        """
+        国籍分区掩码；max_price（万円）> 0 时再排除单价超出的候选人（单价未知的保留）。
+        """
+        mask = self.partitions == partition
+        if max_price > 0:
+            mask &= (self.prices <= 0) | (self.prices <= max_price)
+        return mask
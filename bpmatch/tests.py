@@ -1,3 +1,717 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+
+from . import (
+    bodyTrim,
+    candidatePool,
+    dedup,
+    llmSchema,
+    pageTokenCache,
+    pipeline,
+    ruleExtractor,
+    scoring,
+    skillMatrix,
+    titleRules,
+)
+from .skillIndex import SkillIndex, country_of
+
+DAY = 86400
+
+
+def _candidates(now):
+    """
+    求案件人员池样例：分区 "1" 五人（a/f 同一 dup_group），分区 "0" 一人；接收时间各不相同，避免同分。
+    """
+    return [
+        {"id": "a", "skills": ["Java", "Spring"], "country": 1, "price": 60, "internal_ts": now - 1 * DAY, "dup_group": "g1"},
+        {"id": "b", "skills": ["java"], "country": 1, "price": 800000, "internal_ts": now - 2 * DAY},
+        {"id": "c", "skills": ["JAVA", "AWS", "COBOL"], "country": 1, "price": 50, "internal_ts": now - 3 * DAY},
+        {"id": "d", "skills": ["Python"], "country": 1, "price": 0, "internal_ts": now - 4 * DAY},
+        {"id": "f", "skills": ["java", "spring"], "country": 1, "price": 90, "internal_ts": now - 5 * DAY, "dup_group": "g1"},
+        {"id": "e", "skills": ["java", "spring"], "country": 0, "price": 40, "internal_ts": now - 1 * DAY},
+    ]
+
+
+class ScoringTests(TestCase):
+    JOB_SKILLS = ["java", "spring", "cobol"]
+
+    def setUp(self):
+        self.index = SkillIndex.build(_candidates(time.time()))
+
+    def rank(self, **kwargs):
+        overlaps = self.index.overlaps("1", self.JOB_SKILLS)
+        return scoring.rank(self.index, "1", overlaps, **kwargs)
+
+    def test_to_man_yen(self):
+        self.assertEqual(scoring.to_man_yen(60), 60)
+        self.assertEqual(scoring.to_man_yen("600000"), 60)
+        self.assertEqual(scoring.to_man_yen(None), 0)
+        self.assertEqual(scoring.to_man_yen(-5), 0)
+
+    def test_price_score(self):
+        self.assertEqual(scoring.price_score(0, 60), 0.5)
+        self.assertEqual(scoring.price_score(60, 0), 0.5)
+        self.assertEqual(scoring.price_score(60, 50), 1.0)
+        self.assertAlmostEqual(scoring.price_score(100, 120), 0.8)
+        self.assertEqual(scoring.price_score(50, 200), 0.0)
+
+    def test_recency_score(self):
+        now = time.time()
+        self.assertAlmostEqual(scoring.recency_score(now, now), 1.0)
+        self.assertAlmostEqual(
+            scoring.recency_score(now - scoring.RECENCY_HALF_LIFE_DAYS * DAY, now), 0.5
+        )
+        self.assertEqual(scoring.recency_score(now + DAY, now), 1.0)
+        self.assertEqual(scoring.recency_score(None, now), 0.0)
+        self.assertEqual(scoring.recency_score("nan", now), 0.0)
+
+    def test_rank_orders_by_weighted_score_and_collapses_duplicates(self):
+        results, total = self.rank(job_price=70)
+        # a 与 f 同组只保留得分更高的 a；d 没有技能重叠；e 在另一分区
+        self.assertEqual([r["id"] for r in results], ["c", "a", "b"])
+        self.assertEqual(total, 3)
+        self.assertEqual(results[0]["matched_skills"], ["cobol", "java"])
+        self.assertEqual(results[1]["duplicate_ids"], ["f"])
+        scores = [r["score"] for r in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_rank_pagination(self):
+        first, total = self.rank(job_price=70, page=1, page_size=2)
+        second, _ = self.rank(job_price=70, page=2, page_size=2)
+        self.assertEqual(total, 3)
+        self.assertEqual([r["id"] for r in first + second], ["c", "a", "b"])
+
+    def test_rank_max_price_and_similarities(self):
+        results, _ = self.rank(job_price=70, max_price=70)
+        self.assertNotIn("b", [r["id"] for r in results])  # 80 万超出上限
+
+        results, _ = self.rank(job_price=70, similarities={"d": 0.9, "b": 0.1})
+        ids = [r["id"] for r in results]
+        self.assertIn("d", ids)  # 无技能重叠，但语义相似度达到阈值
+        self.assertEqual(results[ids.index("d")]["semantic_score"], 0.9)
+
+        results, _ = self.rank(similarities={"d": scoring.SEMANTIC_MIN_SIMILARITY - 0.1})
+        self.assertNotIn("d", [r["id"] for r in results])
+
+
+@skipUnless(skillMatrix.available(), "未安装 numpy")
+class RankMatrixTests(TestCase):
+    """
+    rank_matrix（位矩阵向量化）与 rank（倒排索引逐个打分）的排序与得分一致。
+    """
+
+    CASES = [
+        {"skills": ["java", "spring", "cobol"], "job_price": 70},
+        {"skills": ["java"], "job_price": 0},
+        {"skills": ["aws", "python"], "job_price": 600000},
+        {"skills": ["java", "spring"], "job_price": 70, "max_price": 70},
+        {"skills": ["java"], "job_price": 70, "similarities": {"d": 0.9, "c": 0.7, "a": 0.2}},
+        {"skills": ["java", "spring", "cobol"], "job_price": 70, "page": 2, "page_size": 2},
+        {"skills": ["rust"], "job_price": 70},
+    ]
+
+    def setUp(self):
+        self.index = SkillIndex.build(_candidates(time.time()))
+
+    def test_same_ranking_as_rank(self):
+        for case in self.CASES:
+            kwargs = dict(case)
+            skills = kwargs.pop("skills")
+            similarities = kwargs.pop("similarities", {})
+            with self.subTest(**case):
+                for partition in ("0", "1"):
+                    # 与向量检索一致，相似度结果只含该分区的候选人
+                    kwargs["similarities"] = {
+                        msg_id: sim
+                        for msg_id, sim in similarities.items()
+                        if country_of(self.index.get(msg_id)) == partition
+                    }
+                    expected, expected_total = scoring.rank(
+                        self.index, partition, self.index.overlaps(partition, skills), **kwargs
+                    )
+                    actual, actual_total = scoring.rank_matrix(
+                        self.index, partition, skills, **kwargs
+                    )
+                    self.assertEqual(actual_total, expected_total)
+                    self.assertEqual([r["id"] for r in actual], [r["id"] for r in expected])
+                    for got, want in zip(actual, expected):
+                        self.assertAlmostEqual(got["score"], want["score"], places=3)
+                        self.assertEqual(got["matched_skills"], want["matched_skills"])
+                        self.assertEqual(got["semantic_score"], want["semantic_score"])
+                        self.assertEqual(sorted(got["duplicate_ids"]), sorted(want["duplicate_ids"]))
+
+    def test_matrix_rebuilt_after_index_change(self):
+        before = self.index.matrix()
+        self.index.add({"id": "z", "skills": ["cobol"], "country": 1, "price": 40, "internal_ts": time.time()})
+        self.assertIsNot(self.index.matrix(), before)
+        results, _ = scoring.rank_matrix(self.index, "1", ["cobol"])
+        self.assertEqual({r["id"] for r in results}, {"c", "z"})
+
+
+def _mail(msg_id, fp, sender="bp@example.com", thread_id=None, **fields):
+    return {"id": msg_id, "from": f"BP <{sender}>", "thread_id": thread_id or msg_id, "simhash": fp, **fields}
+
+
+class DedupTests(TestCase):
+    BODY = (
+        "【氏名】T.K\n【年齢】35歳\n【スキル】Java, Spring Boot, AWS\n"
+        "【単価】65万円\n【稼働】即日可能\n【最寄駅】品川\n弊社正社員です。よろしくお願いいたします。"
+    )
+    BASE = 0xF0F0_0000_0000_0000
+
+    def test_simhash_near_duplicate_threshold(self):
+        same = dedup.simhash(self.BODY)
+        self.assertEqual(same, dedup.simhash(self.BODY.replace("\n", "  \n")))
+        self.assertEqual(same, dedup.simhash(self.BODY + "\n> 以前のメールの引用\n> 引用2"))
+        # 全角/半角、大小写不影响指纹
+        self.assertEqual(same, dedup.simhash(self.BODY.replace("Java", "ＪＡＶＡ")))
+        other = dedup.simhash("【案件】金融系基盤更改\n【必須】COBOL, JCL\n【単価】~55万円\n【場所】大手町")
+        self.assertGreater(dedup.hamming(same, other), dedup.NEAR_DUP_DISTANCE)
+        self.assertEqual(dedup.simhash("  \n"), 0)
+
+    def test_find_distance_boundary(self):
+        index = dedup.DedupIndex([_mail("a", self.BASE)])
+        near, group = index.find(_mail("b", self.BASE | 0b111), self.BASE | 0b111)
+        self.assertEqual((near["id"], group), ("a", "a"))
+        near, group = index.find(_mail("c", self.BASE | 0b1111), self.BASE | 0b1111)
+        self.assertEqual((near, group), (None, None))
+        # 发件人不同时不视为重复
+        other = _mail("d", self.BASE, sender="other@example.com")
+        self.assertEqual(index.find(other, self.BASE), (None, None))
+        # 指纹为 0（空正文）不参与近重复判断
+        index.add(_mail("e", 0))
+        self.assertEqual(index.find(_mail("f", 0), 0), (None, None))
+
+    def test_same_thread_grouped_without_reuse(self):
+        index = dedup.DedupIndex([_mail("a", self.BASE, thread_id="t1", dup_group="g-a")])
+        far = self.BASE ^ 0xFFFF
+        near, group = index.find(_mail("b", far, thread_id="t1"), far)
+        self.assertIsNone(near)
+        self.assertEqual(group, "g-a")
+        near, group = index.find(_mail("c", far, thread_id="t2"), far)
+        self.assertEqual((near, group), (None, None))
+
+
+class QiuanjianDedupTests(TestCase):
+    """
+    qiuanjian_email_filter：近重复邮件沿 duplicate_of 复用真正被分析的那封的结果，绝不把原始邮件并入结果。
+    """
+
+    BASE = DedupTests.BASE
+
+    def setUp(self):
+        from . import bpmatch
+
+        self.bpmatch = bpmatch
+        self.analyzed = []
+
+    def analyze(self, email):
+        self.analyzed.append(email["id"])
+        if email.get("subject") == "not-qiuanjian":
+            return None
+        return {**email, "type": 1, "country": 1, "skills": ["java"], "price": 60}
+
+    def run_filter(self, emails, known=()):
+        with mock.patch.object(self.bpmatch, "_analyze_qiuanjian", side_effect=self.analyze):
+            return self.bpmatch.qiuanjian_email_filter(emails, known)
+
+    def test_chain_resolves_to_analyzed_canonical(self):
+        # b 与 a 近重复，c 只与 b 近重复（距离 a 为 6）：c 仍应复用 a 的分析结果
+        emails = [
+            _mail("a", self.BASE),
+            _mail("b", self.BASE | 0b111),
+            _mail("c", self.BASE | 0b111111),
+        ]
+        results = self.run_filter(emails)
+        self.assertEqual(self.analyzed, ["a"])
+        self.assertEqual([r["id"] for r in results], ["a", "b", "c"])
+        self.assertEqual([r.get("duplicate_of") for r in results], [None, "a", "a"])
+        for r in results:
+            self.assertEqual((r["type"], r["skills"]), (1, ["java"]))
+            self.assertEqual(r["dup_group"], "a")
+
+    def test_duplicates_of_rejected_mail_are_dropped(self):
+        emails = [
+            _mail("a", self.BASE, subject="not-qiuanjian"),
+            _mail("b", self.BASE | 0b111),
+            _mail("c", self.BASE | 0b111111),
+        ]
+        self.assertEqual(self.run_filter(emails), [])
+        self.assertEqual(self.analyzed, ["a"])
+
+    def test_reuses_known_result(self):
+        known = [{**_mail("k", self.BASE), "type": 1, "skills": ["cobol"], "price": 50}]
+        results = self.run_filter([_mail("n", self.BASE | 0b11)], known)
+        self.assertEqual(self.analyzed, [])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["id"], "n")
+        self.assertEqual(results[0]["duplicate_of"], "k")
+        self.assertEqual((results[0]["type"], results[0]["skills"]), (1, ["cobol"]))
+
+
+class RuleExtractorTests(TestCase):
+    """
+    (说明, 正文, 类型, 期望的抽取结果, 期望的待 LLM 补充字段)
+    """
+
+    CASES = [
+        (
+            "求案件：日本籍、词典内技能、単価关键词",
+            "【国籍】日本国籍\n【スキル】Java, Spring Boot, AWS\n【単価】65万円",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"country": 0, "skills": ["java", "spring boot", "aws"], "price": 65},
+            [],
+        ),
+        (
+            "求案件：外国籍，円单位",
+            "中国籍 / 日本語N1\nスキル: Python, Django\n希望単価 600,000円",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"country": 1, "skills": ["python", "django"], "price": 600000},
+            [],
+        ),
+        (
+            "求案件：非日本籍不是日本籍",
+            "非日本籍\nスキル: PHP, Laravel\n単価: 55万",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"country": 1, "skills": ["php", "laravel"], "price": 55},
+            [],
+        ),
+        (
+            "求案件：日本人と同等只是语言水平，交给 LLM",
+            "日本語: 日本人と同等\nスキル: Java\n単価: 60万",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"country": 1, "skills": ["java"], "price": 60},
+            ["country"],
+        ),
+        (
+            "求案件：国籍:日本以外",
+            "国籍: 日本以外\nスキル: Java\n単価: 60万",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"country": 1, "skills": ["java"], "price": 60},
+            [],
+        ),
+        (
+            "求人：日本籍のみ",
+            "必須: Java経験3年以上\n日本国籍のみ\n単価: 70万円",
+            ruleExtractor.KIND_QIUREN,
+            {"country": 0, "skills": ["java"], "price": 70},
+            [],
+        ),
+        (
+            "求人：外国籍可",
+            "環境: Go, AWS, Docker\n外国籍可\n単価: ~80万",
+            ruleExtractor.KIND_QIUREN,
+            {"country": 1, "skills": ["go", "aws", "docker"], "price": 80},
+            [],
+        ),
+        (
+            "求人：日本籍与外国籍可矛盾",
+            "日本国籍のみ\n外国籍可\nスキル: Java\n単価: 70万",
+            ruleExtractor.KIND_QIUREN,
+            {"country": 1},
+            ["country"],
+        ),
+        (
+            "署名中的资本金不是单价",
+            "スキル: Java\n\n株式会社テスト\n資本金 1,000万円",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"country": 1, "skills": ["java"], "price": 0},
+            ["price"],
+        ),
+        (
+            "没有单价关键词的金额需要复核",
+            "スキル: Java\n80万円程度でご検討ください",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"skills": ["java"], "price": 80},
+            ["price"],
+        ),
+        (
+            "完全没有金额时 0 即为结论",
+            "スキル: Java, Oracle",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"skills": ["java", "oracle"], "price": 0},
+            [],
+        ),
+        (
+            "词典外技术词交给 LLM",
+            "スキル: Vue, Nuxt, Snowflake\n単価: 60万",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"skills": ["vue"], "price": 60},
+            ["skills"],
+        ),
+        (
+            "短别名不在日文中误命中",
+            "C案件のご紹介\nランクC 以上の方\n単価: 60万",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"skills": [], "price": 60},
+            ["skills"],
+        ),
+        (
+            "PM/SE 等缩写不算词典外技术词",
+            "経験: PM, SE, Java\n単価: 60万",
+            ruleExtractor.KIND_QIUANJIAN,
+            {"skills": ["java"], "price": 60},
+            [],
+        ),
+    ]
+
+    def test_extract(self):
+        extractor = ruleExtractor.RuleExtractor()
+        for name, text, kind, expected, unresolved in self.CASES:
+            with self.subTest(name):
+                result, missing = extractor.extract(text, kind)
+                self.assertEqual({k: result[k] for k in expected}, expected)
+                self.assertEqual(missing, unresolved)
+        stats = extractor.stats()
+        self.assertEqual(stats["total"], len(self.CASES))
+        self.assertEqual(
+            stats["rule_only"], sum(1 for case in self.CASES if not case[4])
+        )
+
+
+class TitleRulesTests(TestCase):
+    def setUp(self):
+        self.classifier = titleRules.TitleRuleClassifier(titleRules.DEFAULT_RULES)
+
+    def test_classify(self):
+        cases = [
+            ("【急募案件】Java開発", titleRules.LABEL_JOB),
+            ("エンド直 PHP 案件のご紹介", titleRules.LABEL_JOB),
+            ("【弊社所属】30歳 Java 即日稼働可能", titleRules.LABEL_PROJECT),
+            ("１社下社員 ３５歳 ＰＭＯ", titleRules.LABEL_PROJECT),  # 全角经 NFKC 后匹配
+            ("案件募集：Python エンジニア 28歳", titleRules.LABEL_PROJECT),  # 「案件募集」优先于「案件」「募集」
+        ]
+        for title, label in cases:
+            with self.subTest(title):
+                self.assertEqual(self.classifier.classify(title), label)
+
+    def test_abstains_below_min_score_or_margin(self):
+        cases = [
+            "ご挨拶",  # 无命中
+            "案件について",  # 得分 1 < min_score
+            "案件 人材",  # 1 对 2，分差不足
+            "エンジニア募集 実績 人材",  # 3 对 3
+        ]
+        for title in cases:
+            with self.subTest(title):
+                self.assertIsNone(self.classifier.classify(title))
+
+    def test_thresholds_and_stats(self):
+        strict = titleRules.TitleRuleClassifier(
+            titleRules.DEFAULT_RULES, min_score=5, min_margin=1
+        )
+        self.assertIsNone(strict.classify("エンジニア募集"))
+        self.assertEqual(self.classifier.classify("エンジニア募集"), titleRules.LABEL_JOB)
+
+        self.classifier.classify("ご挨拶")
+        stats = self.classifier.stats()
+        self.assertEqual((stats["total"], stats["rule_hits_job"], stats["llm_fallbacks"]), (2, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_extra_rules(self):
+        classifier = titleRules.TitleRuleClassifier(
+            titleRules.DEFAULT_RULES + [("SES", titleRules.LABEL_PROJECT, 3)]
+        )
+        self.assertEqual(classifier.classify("SES ご紹介"), titleRules.LABEL_PROJECT)
+
+
+class BodyTrimTests(TestCase):
+    BODY = "お世話になっております。\n【氏名】T.K\n【スキル】Java, Spring\n【単価】65万円\n【稼働】即日"
+    SIGNATURE = "\n" + "-" * 20 + "\n株式会社テスト 営業部\n〒100-0001 東京都千代田区\nTEL: 03-0000-0000\n"
+
+    def test_strip_quoted_reply(self):
+        for reply in (
+            "\n\nOn Mon, Jan 1, 2024 at 10:00 AM Foo <foo@example.com> wrote:\n> 前回の案件\n> 単価 50万",
+            "\n-----Original Message-----\nFrom: foo\n【単価】50万円",
+            "\n2024年1月1日(月) 10:00 山田 <yamada@example.com>:\n> 以前の内容",
+        ):
+            with self.subTest(reply[:20]):
+                self.assertEqual(bodyTrim.trim(self.BODY + reply, budget=1000), self.BODY)
+        # 行内的引用行单独去掉，前后的正文保留
+        self.assertEqual(
+            bodyTrim.strip_reply("本文1\n> 引用\n＞引用2\n本文2"), "本文1\n本文2"
+        )
+
+    def test_strip_signature(self):
+        body = self.BODY + "\n【備考】リモート併用、面談1回。ご検討のほどよろしくお願いいたします。"
+        self.assertEqual(bodyTrim.trim(body + self.SIGNATURE, budget=1000), body)
+        # 分隔线之后仍有关键见出し时是正文内的区块分隔，不截断
+        text = self.BODY + "\n" + "=" * 20 + "\n【備考】面談1回 TEL面談可"
+        self.assertEqual(bodyTrim.strip_signature(text), text)
+        # 分隔线在前半部分时保留
+        text = "-" * 20 + "\nTEL: 03\n" + self.BODY * 2
+        self.assertEqual(bodyTrim.strip_signature(text), text)
+
+    def test_strip_boilerplate_keeps_content_lines(self):
+        text = (
+            self.BODY
+            + "\n※本メールはBCCにて送信しております。\n"
+            + "労働者派遣事業 許可番号: 派13-000000\n"
+            + "配信停止をご希望の方はご連絡ください。\n"
+            + "【案件】個人情報の取り扱いに関する業務\n"  # 含案件内容的行保留
+            + "秘密保持契約の締結が必要です"
+        )
+        self.assertEqual(
+            bodyTrim.trim(text, budget=1000),
+            self.BODY + "\n【案件】個人情報の取り扱いに関する業務\n秘密保持契約の締結が必要です",
+        )
+
+    def test_fit_budget(self):
+        self.assertEqual(bodyTrim.fit_budget(self.BODY, 1000), self.BODY)
+        filler = "あ" * 1000
+        text = "【案件名】基盤更改\n" + filler + "\n【スキル】COBOL\n" + filler + "\n【単価】55万"
+        trimmed = bodyTrim.fit_budget(text, 900)
+        self.assertLessEqual(len(trimmed.replace(bodyTrim._ELLIPSIS, "")), 900)
+        self.assertTrue(trimmed.startswith("【案件名】基盤更改"))
+        self.assertIn("【スキル】COBOL", trimmed)
+        self.assertIn("【単価】55万", trimmed)
+        self.assertEqual(trimmed.count(bodyTrim._ELLIPSIS), 2)
+        # 预算小于开头部分时只保留开头
+        self.assertEqual(bodyTrim.fit_budget(text, 50), text[:50])
+
+    def test_clean_keeps_long_sections_whole(self):
+        section = "【業務概要】\n" + "\n".join(f"{i}. 既存システムの改修と保守運用を担当します。" for i in range(60))
+        text = section + "\n【備考】面談1回\n> 引用\n※本メールはBCCにて送信しております。"
+        cleaned = bodyTrim.clean(text)
+        self.assertEqual(cleaned, section + "\n【備考】面談1回")
+        self.assertGreater(len(cleaned), bodyTrim.DEFAULT_BUDGET)
+        self.assertNotIn(bodyTrim._ELLIPSIS, cleaned)
+        self.assertEqual(bodyTrim.trim(text, budget=10000), cleaned)
+
+
+class LlmSchemaTests(TestCase):
+    DETAIL = {
+        "project_name": " 基盤更改 ",
+        "project_detail": "COBOL 改修",
+        "requirement": "3年以上",
+        "skills_must": ["COBOL", " JCL ", ""],
+        "skills_can": [],
+        "remark": "",
+    }
+
+    def test_parse_mail_fields_accepts(self):
+        cases = [
+            ('{"country": 0, "skills": ["Java", " AWS "], "price": 60}', (0, ["Java", "AWS"], 60)),
+            ('{"country": 1, "skills": [], "price": 600000}', (1, [], 600000)),
+            # 模型偶尔输出 60.0 或 "60"，视为整数；多余字段忽略
+            ('{"country": "1", "skills": [], "price": 60.0, "note": "x"}', (1, [], 60)),
+        ]
+        for raw, expected in cases:
+            with self.subTest(raw):
+                fields = llmSchema.parse_mail_fields(raw)
+                self.assertIsInstance(fields, llmSchema.MailFields)
+                self.assertEqual(tuple(fields), expected)
+
+    def test_parse_mail_fields_rejects(self):
+        cases = [
+            "",
+            "```json\n{}\n```",
+            '["country", 0]',
+            '{"country": 2, "skills": [], "price": 0}',
+            '{"country": true, "skills": [], "price": 0}',
+            '{"country": 0, "skills": "Java", "price": 0}',
+            '{"country": 0, "skills": [1], "price": 0}',
+            '{"country": 0, "skills": [], "price": -1}',
+            '{"country": 0, "skills": [], "price": "60万"}',
+            '{"country": 0, "skills": []}',
+        ]
+        for raw in cases:
+            with self.subTest(raw):
+                with self.assertRaises(llmSchema.SchemaError):
+                    llmSchema.parse_mail_fields(raw)
+
+    def test_parse_project_detail(self):
+        detail = llmSchema.parse_project_detail(json.dumps(self.DETAIL, ensure_ascii=False))
+        self.assertEqual(detail.project_name, "基盤更改")
+        self.assertEqual(detail.skills_must, ["COBOL", "JCL"])
+        self.assertEqual(json.loads(llmSchema.dumps(detail))["skills_must"], ["COBOL", "JCL"])
+
+        for name, value in [("remark", None), ("skills_can", "Java"), ("project_name", 1)]:
+            with self.subTest(name):
+                raw = json.dumps({**self.DETAIL, name: value})
+                with self.assertRaises(llmSchema.SchemaError):
+                    llmSchema.parse_project_detail(raw)
+        missing = {k: v for k, v in self.DETAIL.items() if k != "requirement"}
+        with self.assertRaisesRegex(llmSchema.SchemaError, "requirement"):
+            llmSchema.parse_project_detail(json.dumps(missing))
+
+    def test_schemas_require_all_fields(self):
+        self.assertEqual(llmSchema.MAIL_FIELDS_SCHEMA["required"], ["country", "skills", "price"])
+        self.assertEqual(
+            set(llmSchema.PROJECT_DETAIL_SCHEMA["required"]),
+            set(llmSchema.PROJECT_DETAIL_SCHEMA["properties"]),
+        )
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "bpmatch": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "bpmatch-tests",
+        },
+    },
+    BPMATCH_PAGE_TOKEN_CACHE="bpmatch",
+)
+class PageTokenCacheTests(TestCase):
+    QUERY = "after:2024/01/01"
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches["bpmatch"].clear()
+        self.tokens = pageTokenCache.PageTokenCache()
+
+    def head(self, msg_id, query=QUERY):
+        self.tokens.observe_head(query, {"messages": [{"id": msg_id}]})
+
+    def test_lookup_nearest_cached_page(self):
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 1), (1, None))
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 5), (1, None))
+        self.tokens.store(self.QUERY, 20, 2, "t2")
+        self.tokens.store(self.QUERY, 20, 3, "t3")
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 3), (3, "t3"))
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 6), (3, "t3"))
+        # 每页条数不同的 token 不通用
+        self.assertEqual(self.tokens.lookup(self.QUERY, 50, 3), (1, None))
+
+    def test_inbox_generation_invalidates_all_queries(self):
+        self.tokens.store(self.QUERY, 20, 2, "t2")
+        self.tokens.store("from:bp@example.com", 20, 2, "o2")
+        self.tokens.invalidate()
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (1, None))
+        self.assertEqual(self.tokens.lookup("from:bp@example.com", 20, 2), (1, None))
+        # 新一代的 token 照常缓存
+        self.tokens.store(self.QUERY, 20, 2, "t2b")
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (2, "t2b"))
+
+    def test_query_generation_invalidates_only_that_query(self):
+        self.tokens.store(self.QUERY, 20, 2, "t2")
+        self.tokens.store("from:bp@example.com", 20, 2, "o2")
+        self.tokens.invalidate(self.QUERY)
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (1, None))
+        self.assertEqual(self.tokens.lookup("from:bp@example.com", 20, 2), (2, "o2"))
+
+    def test_new_head_message_invalidates_query(self):
+        self.head("m1")
+        self.tokens.store(self.QUERY, 20, 2, "t2")
+        self.head("m1")  # 首条未变，缓存仍有效
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (2, "t2"))
+        self.head("m0")  # 有新邮件排到第 1 页首位
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (1, None))
+        self.tokens.observe_head(self.QUERY, {})  # 空结果不改变代数
+        self.tokens.store(self.QUERY, 20, 2, "t2b")
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (2, "t2b"))
+
+    @override_settings(BPMATCH_PAGE_TOKEN_CACHE="missing")
+    def test_noop_without_cache(self):
+        self.tokens.store(self.QUERY, 20, 2, "t2")
+        self.tokens.invalidate()
+        self.assertEqual(self.tokens.lookup(self.QUERY, 20, 2), (1, None))
+
+
+class InboundEmailLabelTests(TestCase):
+    def test_label_ids_round_trip(self):
+        from .models import InboundEmail
+
+        row = InboundEmail.from_message({"id": "m1", "label_ids": ["INBOX", "UNREAD"]})
+        self.assertEqual(row.to_message()["label_ids"], ["INBOX", "UNREAD"])
+        self.assertEqual(InboundEmail.from_message({"id": "m2"}).labels(), [])
+        self.assertEqual(InboundEmail(label_ids="").labels(), [])
+        # INBOX 按带引号的 JSON 字符串匹配，不会命中前缀相同的自定义标签
+        self.assertIn('"INBOX"', str(InboundEmail.inbox().query))
+
+
+class PipelineTests(TestCase):
+    def test_order_and_shared_executor(self):
+        def slow(n):
+            time.sleep(0.01 * (5 - n))
+            return n * n
+
+        self.assertEqual(pipeline.map_bounded(slow, range(5), concurrency=3), [0, 1, 4, 9, 16])
+        executor = pipeline._get_executor()
+        pipeline.map_bounded(slow, range(3))
+        self.assertIs(pipeline._get_executor(), executor)
+
+    def test_nested_calls_run_inline(self):
+        def outer(n):
+            return sum(pipeline.map_bounded(lambda m: m + n, range(3)))
+
+        items = range(pipeline.get_concurrency() * 2)
+        self.assertEqual(pipeline.map_bounded(outer, items), [3 + 3 * n for n in items])
+
+    def test_close_cancels_pending(self):
+        started = []
+        lock = threading.Lock()
+
+        def work(n):
+            with lock:
+                started.append(n)
+            time.sleep(0.02)
+            return n
+
+        results = pipeline.iter_bounded(work, range(20), concurrency=2)
+        self.assertEqual(next(results), 0)
+        results.close()
+        time.sleep(0.1)
+        # 每次调用最多 2 个任务在途：取走第 1 个结果后至多再提交 1 个
+        self.assertLessEqual(len(started), 3)
+
+    def test_errors_propagate(self):
+        def fail(n):
+            if n == 1:
+                raise ValueError("boom")
+            return n
+
+        with self.assertRaises(ValueError):
+            pipeline.map_bounded(fail, range(4), concurrency=2)
+
+
+@skipUnless(candidatePool.fcntl is not None, "需要 fcntl")
+class RefreshStatusTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "candidate_pool.json"
+        settings = override_settings(BPMATCH_POOL_SNAPSHOT_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_reports_refresh_in_this_process(self):
+        self.assertFalse(candidatePool.is_refreshing())
+        with candidatePool._process_lock(blocking=False) as acquired:
+            self.assertTrue(acquired)
+            self.assertTrue(candidatePool.is_refreshing())
+        self.assertFalse(candidatePool.is_refreshing())
+
+    def test_reports_refresh_in_other_process(self):
+        # 其他进程刷新时在 .status 文件上持有排他锁（flock 按打开的文件区分，这里用独立的 fd 模拟）
+        with open(f"{self.path}.status", "a") as other:
+            candidatePool.fcntl.flock(other, candidatePool.fcntl.LOCK_EX)
+            self.assertTrue(candidatePool.is_refreshing())
+        self.assertFalse(candidatePool.is_refreshing())
+
+    def test_polling_never_blocks_refresh(self):
+        stop = threading.Event()
+
+        def poll():
+            while not stop.is_set():
+                candidatePool.is_refreshing()
+
+        pollers = [threading.Thread(target=poll) for _ in range(4)]
+        for t in pollers:
+            t.start()
+        try:
+            for _ in range(200):
+                with candidatePool._process_lock(blocking=False) as acquired:
+                    self.assertTrue(acquired)
+        finally:
+            stop.set()
+            for t in pollers:
+                t.join()
@@ -0,0 +1,122 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from .conf import get_setting
+
+LABEL_JOB = 0  # 求人：我这边有案件
+LABEL_PROJECT = 1  # 求案件：我这边有人
+
+# (正则, 标签, 权重)。与 title_analysis 的 prompt 关键词保持一致；
+# 权重 10 的为决定性关键词（原 KEYWORDS_JOB），命中即判定。
+DEFAULT_RULES: List[Tuple[str, int, float]] = [
+    ("急募案件", LABEL_JOB, 10),
+    ("エンド直", LABEL_JOB, 10),
+    ("代替", LABEL_JOB, 10),
+    ("案件のご紹介", LABEL_JOB, 3),
+    ("エンジニア募集", LABEL_JOB, 3),
+    ("技術者募集", LABEL_JOB, 3),
+    ("募集", LABEL_JOB, 1),
+    ("支援", LABEL_JOB, 1),
+    ("フルリモート", LABEL_JOB, 0.5),
+    ("案件", LABEL_JOB, 1),
+    (r"\d{2}\s*歳", LABEL_PROJECT, 3),
+    ("歳", LABEL_PROJECT, 2),
+    ("1社下社員", LABEL_PROJECT, 4),
+    ("直個人", LABEL_PROJECT, 4),
+    ("弊社所属", LABEL_PROJECT, 3),
+    ("弊社のご紹介", LABEL_PROJECT, 2),
+    ("案件募集", LABEL_PROJECT, 3),
+    ("案件探してます", LABEL_PROJECT, 3),
+    ("案件を探して", LABEL_PROJECT, 3),
+    ("稼働可能", LABEL_PROJECT, 2),
+    ("即日", LABEL_PROJECT, 1),
+    ("実績", LABEL_PROJECT, 1),
+    ("人材", LABEL_PROJECT, 2),
+    ("要員", LABEL_PROJECT, 2),
+    ("社員", LABEL_PROJECT, 2),
+    ("フリーランス", LABEL_PROJECT, 2),
+]
+
+# 胜出标签的最低得分，以及与另一标签的最小分差；不满足时交给 LLM
+DEFAULT_MIN_SCORE = 2.0
+DEFAULT_MIN_MARGIN = 1.5
+
+
+class TitleRuleClassifier:
+    """
+    标题规则分类器：所有关键词编译成一个正则（长模式优先），一次扫描累加各标签权重。
+    """
+
+    def __init__(
+        self,
+        rules: List[Tuple[str, int, float]],
+        min_score: float = DEFAULT_MIN_SCORE,
+        min_margin: float = DEFAULT_MIN_MARGIN,
+    ):
+        # 交替分支按字面长度降序，使「案件募集」优先于「案件」匹配
+        self._rules = sorted(rules, key=lambda r: len(r[0]), reverse=True)
+        self._pattern = re.compile(
+            "|".join(f"(?P<r{i}>{pattern})" for i, (pattern, _, _) in enumerate(self._rules))
+        )
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+        self._lock = threading.Lock()
+        self._rule_hits = {LABEL_JOB: 0, LABEL_PROJECT: 0}
+        self._fallbacks = 0
+
+    def score(self, title: str) -> Dict[int, float]:
+        scores = {LABEL_JOB: 0.0, LABEL_PROJECT: 0.0}
+        text = unicodedata.normalize("NFKC", title or "")
+        for m in self._pattern.finditer(text):
+            _, label, weight = self._rules[int(m.lastgroup[1:])]
+            scores[label] += weight
+        return scores
+
+    def classify(self, title: str) -> Optional[int]:
+        """
+        返回 0/1；置信度不足时返回 None，由调用方回退到 LLM。同时记录命中率。
+        """
+        scores = self.score(title)
+        best = max(scores, key=scores.get)
+        other = LABEL_PROJECT if best == LABEL_JOB else LABEL_JOB
+        confident = (
+            scores[best] >= self.min_score
+            and scores[best] - scores[other] >= self.min_margin
+        )
+        with self._lock:
+            if confident:
+                self._rule_hits[best] += 1
+            else:
+                self._fallbacks += 1
+        return best if confident else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rule_total = sum(self._rule_hits.values())
+            total = rule_total + self._fallbacks
+            return {
+                "total": total,
+                "rule_hits": rule_total,
+                "rule_hits_job": self._rule_hits[LABEL_JOB],
+                "rule_hits_project": self._rule_hits[LABEL_PROJECT],
+                "llm_fallbacks": self._fallbacks,
+                "hit_rate": round(rule_total / total, 4) if total else 0.0,
+            }
+
+
+def _build() -> TitleRuleClassifier:
+    extra = [
+        (str(pattern), int(label), float(weight))
+        for pattern, label, weight in get_setting("BPMATCH_TITLE_RULES_EXTRA", []) or []
+    ]
+    return TitleRuleClassifier(
+        DEFAULT_RULES + extra,
+        min_score=float(get_setting("BPMATCH_TITLE_RULE_MIN_SCORE", DEFAULT_MIN_SCORE)),
+        min_margin=float(get_setting("BPMATCH_TITLE_RULE_MIN_MARGIN", DEFAULT_MIN_MARGIN)),
+    )
+
+
+classifier = _build()
@@ -0,0 +1,195 @@
+import base64
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 numpy 时不启用语义匹配，只按技能重叠打分
+    np = None
+
+try:
+    import faiss
+except ImportError:  # faiss 可选：未安装时始终精确检索
+    faiss = None
+
+from .conf import get_setting
+from .skillIndex import country_of
+
+# 默认关闭；启用时推荐 bge-m3（多语言模型，日/中/英混排的正文可直接比较）
+DEFAULT_EMBED_MODEL = ""
+# 修改 embedding 输入的构造方式时升级版本号，缓存中的旧向量即自然失效
+EMBED_VERSION = "v1"
+EMBED_MAX_CHARS = 2000  # 技能与单价一般在正文前部，截断以控制 CPU 推理耗时
+# 候选人数超过该值且安装了 faiss 时改用 HNSW 近似检索
+ANN_MIN_ROWS = 5000
+ANN_OVERFETCH = 4  # 近似检索多取几倍，再按国籍分区过滤
+
+
+def available() -> bool:
+    """
+    BPMATCH_EMBED_MODEL 为空（默认）时不启用语义匹配。
+    """
+    return np is not None and bool(embed_model())
+
+
+def embed_model() -> str:
+    return get_setting("BPMATCH_EMBED_MODEL", DEFAULT_EMBED_MODEL)
+
+
+def embed_text_of(message: Dict) -> str:
+    text = message.get("body") or message.get("detail") or ""
+    return " ".join(text.split())[:EMBED_MAX_CHARS]
+
+
+def _normalized(vector) -> "np.ndarray":
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def embed(text: str) -> "np.ndarray":
+    """
+    单段文本的 L2 归一化向量（内积即余弦相似度）。
+    结果经 llm_result_cache 缓存（float32 的 base64），同一正文只推理一次。
+    """
+    from . import llmCache
+    from .llmsTool import llm
+
+    model = embed_model()
+
+    def compute() -> str:
+        vector = _normalized(llm.embed([text], model)[0])
+        return base64.b64encode(vector.tobytes()).decode("ascii")
+
+    raw = llmCache.get_or_compute("embed", EMBED_VERSION, model, text, compute)
+    return np.frombuffer(base64.b64decode(raw), dtype=np.float32)
+
+
+def embed_messages(messages: Sequence[Dict]) -> Dict[str, "np.ndarray"]:
+    """
+    并发向量化一批候选人正文，返回 {id: 向量}；失败的邮件跳过（只按技能参与匹配）。
+    """
+    from . import pipeline
+
+    def run(message: Dict) -> Optional["np.ndarray"]:
+        text = embed_text_of(message)
+        if not text:
+            return None
+        try:
+            return embed(text)
+        except Exception as exc:
+            print(f"[vector_index] {message.get('id')} 向量化失败: {exc}")
+            return None
+
+    vectors = pipeline.map_bounded(run, messages)
+    return {m.get("id"): v for m, v in zip(messages, vectors) if v is not None}
+
+
+class VectorIndex:
+    """
+    候选人正文向量的只读索引：ids[i] 对应 matrix 第 i 行（已归一化），partitions[i] 为国籍分区。
+    默认精确检索（一次矩阵乘法）；行数较多且安装了 faiss 时用 HNSW 近似检索。
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        matrix: "np.ndarray",
+        partitions: Sequence[str],
+        model: str,
+    ):
+        self.ids = list(ids)
+        self.model = model  # 生成向量所用的模型；模型更换后旧向量不可比较，需全量重建
+        self.matrix = matrix
+        self.partitions = np.asarray(partitions, dtype=str)
+        self._row = {msg_id: i for i, msg_id in enumerate(self.ids)}
+        self._ann = None
+        if faiss is not None and len(self.ids) >= ANN_MIN_ROWS:
+            self._ann = faiss.IndexHNSWFlat(matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            self._ann.add(np.ascontiguousarray(matrix, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, msg_id: str) -> bool:
+        return msg_id in self._row
+
+    def vector_of(self, msg_id: str) -> Optional["np.ndarray"]:
+        row = self._row.get(msg_id)
+        return None if row is None else self.matrix[row]
+
+    def search(self, query: "np.ndarray", partition: str, k: int) -> Dict[str, float]:
+        """
+        返回该国籍分区内与 query 最相似的至多 k 个候选人 {id: 余弦相似度}。
+        """
+        if not self.ids or k <= 0:
+            return {}
+        query = _normalized(query)
+        if self._ann is not None:
+            sims, rows = self._ann.search(query[None, :], k * ANN_OVERFETCH)
+            pairs = [
+                (int(row), float(sim))
+                for row, sim in zip(rows[0], sims[0])
+                if row >= 0 and self.partitions[row] == partition
+            ]
+            return {self.ids[row]: sim for row, sim in pairs[:k]}
+
+        sims = self.matrix @ query
+        sims = np.where(self.partitions == partition, sims, -np.inf)
+        k = min(k, len(self.ids))
+        top = np.argpartition(-sims, k - 1)[:k]
+        return {self.ids[row]: float(sims[row]) for row in top if np.isfinite(sims[row])}
+
+    def save(self, path: Path):
+        """
+        原子写入 .npy（写临时文件后 os.replace），读取方可 mmap 加载。
+        """
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(
+        cls, path: Path, ids: Sequence[str], partitions: Sequence[str], model: str
+    ) -> Optional["VectorIndex"]:
+        """
+        以 mmap 方式加载：多个 worker 进程共享同一份页缓存，不各自复制整个矩阵。
+        """
+        matrix = np.load(path, mmap_mode="r")
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            print(f"[vector_index] 向量文件与快照不一致，忽略: {path}")
+            return None
+        return cls(ids, matrix, partitions, model)
+
+
+def build(
+    messages: Iterable[Dict],
+    vectors: Dict[str, "np.ndarray"],
+    previous: Optional[VectorIndex] = None,
+) -> Optional[VectorIndex]:
+    """
+    按 messages 顺序组装索引，向量取自 vectors 或 previous（同一模型时）；都没有的候选人不进入索引。
+    """
+    model = embed_model()
+    if previous is not None and previous.model != model:
+        previous = None
+    ids: List[str] = []
+    rows = []
+    partitions: List[str] = []
+    for m in messages:
+        msg_id = m.get("id")
+        vector = vectors.get(msg_id)
+        if vector is None and previous is not None:
+            vector = previous.vector_of(msg_id)
+        if vector is None:
+            continue
+        ids.append(msg_id)
+        rows.append(vector)
+        partitions.append(country_of(m))
+    if not rows:
+        return None
+    return VectorIndex(ids, np.vstack(rows).astype(np.float32), partitions, model)
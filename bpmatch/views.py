@@ -1,71 +1,183 @@
+import hashlib
+import hmac
 import json
 import re
+import uuid
 
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-
-from . import bpmatch, llmsTool
-from .gmailTool import GmailTool
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from . import (
+    bpmatch,
+    candidatePool,
+    gmailPush,
+    llmSchema,
+    llmsTool,
+    outbox,
+    ruleExtractor,
+    titleRules,
+)
+from .conf import get_setting
+from .gmailTool import get_gmail_tool
+from .llmSchema import SchemaError
 from .models import SentEmailLog
 
 
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def _stream_response(fmt: str, events):
+    """
+    把 (event, data) 序列输出为 NDJSON（每行一个 {"event":..., "data":...}）或 SSE。
+    生成过程中的异常作为 error 事件发送，最后总是以 done 事件结束。
+    """
+
+    def encode(event: str, data) -> str:
+        if fmt == "sse":
+            return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+    def generate():
+        count = 0
+        try:
+            for event, data in events:
+                if event == "item":
+                    count += 1
+                yield encode(event, data)
+        except Exception as exc:
+            yield encode("error", {"error": str(exc)})
+        yield encode("done", {"count": count})
+
+    response = StreamingHttpResponse(generate(), content_type=STREAM_FORMATS[fmt])
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # 关闭 nginx 缓冲，逐条下发
+    return response
+
+
+def _stream_format(request) -> str:
+    fmt = request.GET.get("stream", "").strip().lower()
+    return fmt if fmt in STREAM_FORMATS else ""
+
+
+def _include_body(request) -> bool:
+    # 列表接口默认只返回摘要；?include_body=1 时内联正文（兼容旧调用方）
+    return request.GET.get("include_body", "").strip() == "1"
+
+
 @csrf_exempt
 @require_GET
 def messages(request):
+    params = {
+        "keyword": request.GET.get("keyword", ""),
+        "date_str": request.GET.get("date", ""),
+        "start_date_str": request.GET.get("start_date", ""),
+        "end_date_str": request.GET.get("end_date", ""),
+        "page_str": request.GET.get("page", "1"),
+        "page_size_str": request.GET.get("page_size", ""),
+        "limit_str": request.GET.get("limit", ""),
+        "include_body": _include_body(request),
+    }
+    # ?stream=ndjson|sse：每分类完一封就下发一条
+    fmt = _stream_format(request)
+    if fmt:
+        return _stream_response(fmt, bpmatch.iter_page_emails(**params))
+
     try:
-        payload = bpmatch.fetch_page_emails(
-            keyword=request.GET.get("keyword", ""),
-            date_str=request.GET.get("date", ""),
-            start_date_str=request.GET.get("start_date", ""),
-            end_date_str=request.GET.get("end_date", ""),
-            page_str=request.GET.get("page", "1"),
-            page_size_str=request.GET.get("page_size", ""),
-            limit_str=request.GET.get("limit", ""),
-        )
+        payload = bpmatch.fetch_page_emails(**params)
     except Exception as exc:
         return JsonResponse({"error": str(exc)}, status=500)
 
     return JsonResponse(payload)
 
 
+def _person_item(m, include_body: bool = False):
+    """
+    人员摘要：头信息 + 抽取字段；正文通过 /messages/<id>/body 按需获取。
+    """
+    skills = m.get("skills")
+    item = {
+        "id": m.get("id") or "",
+        "name": m.get("subject") or "(无标题)",
+        "belong": m.get("from") or "",
+        "date": m.get("date") or "",
+        "thread_id": m.get("thread_id") or "",
+        "message_id_header": m.get("message_id_header") or "",
+        "references_header": m.get("references_header") or "",
+        "skills": skills if isinstance(skills, list) else [],
+        "country": m.get("country", m.get("country_code", "")),
+        "price": m.get("price") or 0,
+    }
+    if include_body:
+        item["detail"] = m.get("body") or ""
+    return item
+
+
 @csrf_exempt
 @require_GET
 def persons(request):
     refresh = request.GET.get("refresh", "").strip() == "1"
-    try:
-        if refresh:
-            msgs = bpmatch.fetch_recent_two_weeks_emails()
-        else:
-            msgs = bpmatch.qiuanjian_message or []
-        refreshed_at = bpmatch.update_time
-    except Exception as exc:
-        return JsonResponse({"error": str(exc)}, status=500)
-
-    items = []
-    for m in msgs or []:
-        items.append(
-            {
-                "id": m.get("id") or "",
-                "name": m.get("subject") or "(无标题)",
-                "belong": m.get("from") or "",
-                "detail": m.get("body") or "",
-                "date": m.get("date") or "",
-                "thread_id": m.get("thread_id") or "",
-                "message_id_header": m.get("message_id_header") or "",
-                "references_header": m.get("references_header") or "",
+    # 刷新在后台线程执行，这里立即返回上一份完整快照
+    if refresh:
+        candidatePool.refresh_async()
+    snapshot = candidatePool.get_snapshot()
+    refreshed_at = snapshot.update_time
+    update_time = refreshed_at.isoformat() if refreshed_at else ""
+    include_body = _include_body(request)
+
+    fmt = _stream_format(request)
+    if fmt:
+
+        def events():
+            yield "meta", {
+                "update_time": update_time,
+                "refreshing": candidatePool.is_refreshing(),
             }
-        )
+            for m in snapshot.messages:
+                yield "item", _person_item(m, include_body)
+
+        return _stream_response(fmt, events())
 
     return JsonResponse(
         {
-            "items": items,
-            "update_time": refreshed_at.isoformat() if refreshed_at else "",
+            "items": [_person_item(m, include_body) for m in snapshot.messages],
+            "update_time": update_time,
+            "refreshing": candidatePool.is_refreshing(),
         }
     )
 
 
+@csrf_exempt
+@require_GET
+def message_body(request, message_id):
+    """
+    单封邮件正文，支持 ETag 条件请求：邮件内容不变，If-None-Match 命中时返回 304。
+    """
+    try:
+        message = bpmatch.get_message(message_id)
+    except Exception as exc:
+        return JsonResponse({"error": str(exc)}, status=500)
+    if message is None:
+        return JsonResponse({"error": "Message not found"}, status=404)
+
+    body = message.get("body") or ""
+    etag = quote_etag(hashlib.sha1(body.encode("utf-8")).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(
+            {"id": message.get("id") or message_id, "body": body}
+        )
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
+
+
 @csrf_exempt
 def log_job_click(request):
     """
@@ -87,44 +199,41 @@ def log_job_click(request):
         print(f"[job_click] 调用 match 失败: {exc}")
         return JsonResponse({"error": str(exc)}, status=500)
 
-    # 标准化匹配结果，方便前端直接渲染人员列表
+    # 标准化匹配结果，方便前端直接渲染人员列表（match 已按得分排好序并分页）
     matches_raw = match_result.get("matches") if isinstance(match_result, dict) else []
 
-    def _match_len(item):
-        if isinstance(item, dict):
-            skills = item.get("matched_skills")
-            if isinstance(skills, list):
-                return len(skills)
-        return 0
-
-    sorted_matches = sorted(matches_raw or [], key=_match_len, reverse=True)
+    # 只返回摘要：正文与完整的 match 分析结果不再回传，正文由 /messages/<id>/body 按需获取
     items = []
-    for idx, match in enumerate(sorted_matches):
+    for idx, match in enumerate(matches_raw or []):
         matched_skills = match.get("matched_skills") if isinstance(match, dict) else []
-        items.append(
+        item = _person_item(match)
+        item.update(
             {
                 "id": match.get("id") or f"match-{idx}",
                 "subject": match.get("subject") or match.get("title") or "",
                 "name": match.get("subject") or match.get("title") or "(无标题)",
-                "belong": match.get("from") or "",
-                "detail": match.get("body") or match.get("detail") or "",
-                "date": match.get("date") or "",
-                "thread_id": match.get("thread_id") or "",
-                "message_id_header": match.get("message_id_header") or "",
-                "references_header": match.get("references_header") or "",
                 "matched_skills": (
                     matched_skills if isinstance(matched_skills, list) else []
                 ),
+                "score": match.get("score", 0),
+                "semantic_score": match.get("semantic_score", 0),
+                "duplicate_count": len(match.get("duplicate_ids") or []),
             }
         )
-
-    return JsonResponse(
-        {
-            "status": "ok",
-            "match": match_result,
-            "matches": items,
-        }
-    )
+        items.append(item)
+
+    response = {
+        "status": "ok",
+        "country": match_result.get("country", 1),
+        "job_skills": match_result.get("job_skills", []),
+        "matches": items,
+        "total": match_result.get("total", len(items)),
+        "page": match_result.get("page", 1),
+        "has_next": match_result.get("has_next", False),
+    }
+    if match_result.get("error"):
+        response["error"] = match_result["error"]
+    return JsonResponse(response)
 
 
 @csrf_exempt
@@ -145,28 +254,15 @@ def extract_qiuren_detail(request):
     if not text.strip():
         return JsonResponse({"error": "Missing field: text"}, status=400)
 
+    # 结果已按 schema 校验为 ProjectDetail；修复重试后仍不合格时明确报错，而不是返回空模板
     try:
-        llm_result = llmsTool.extract_qiuren_detail(text)
+        detail = llmsTool.extract_qiuren_detail(text)
+    except SchemaError as exc:
+        print(f"[extract_qiuren_detail] LLM 输出不符合 schema: {exc}")
+        return JsonResponse({"error": f"LLM 输出格式错误: {exc}"}, status=502)
     except Exception as exc:
         return JsonResponse({"error": str(exc)}, status=500)
 
-    # extract_qiuren_detail 返回的是 JSON 字符串，这里尝试解析以便前端直接使用
-    def clean_llm_json(s: str) -> str:
-        s = s.strip()
-        if s.startswith("```"):
-            s = s.removeprefix("```json").removeprefix("```").strip()
-            s = s.removesuffix("```").strip()
-        return s
-
-    try:
-        parsed = json.loads(clean_llm_json(llm_result))
-    except Exception as exc:
-        print(f"[extract_qiuren_detail] 解析 LLM JSON 失败: {exc}")
-        parsed = {}
-
-    if not isinstance(parsed, dict):
-        parsed = {}
-
     def make_block(title: str, value) -> str:
         """
         生成一个「标题 + 内容 + 空行」的区块
@@ -185,20 +281,13 @@ def extract_qiuren_detail(request):
 
         return f"{title}\n{value}\n\n"
 
-    project_name = parsed.get("project_name")
-    project_detail = parsed.get("project_detail")
-    requirement = parsed.get("requirement", [])
-    skills_must = parsed.get("skills_must", [])
-    skills_can = parsed.get("skills_can", [])
-    remark = parsed.get("remark")
-
     fields = {
-        "project_block": make_block("【案件名】", project_name),
-        "detail_block": make_block("【業務概要】", project_detail),
-        "requirement_block": make_block("【条件】", requirement),
-        "skills_must_block": make_block("【必須スキル】", skills_must),
-        "skills_can_block": make_block("【尚可スキル】", skills_can),
-        "remark_block": make_block("【備考】", remark),
+        "project_block": make_block("【案件名】", detail.project_name),
+        "detail_block": make_block("【業務概要】", detail.project_detail),
+        "requirement_block": make_block("【条件】", detail.requirement),
+        "skills_must_block": make_block("【必須スキル】", detail.skills_must),
+        "skills_can_block": make_block("【尚可スキル】", detail.skills_can),
+        "remark_block": make_block("【備考】", detail.remark),
     }
 
     # todo 根据需求更改模板
@@ -240,25 +329,15 @@ def extract_qiuren_detail(request):
         {
             "status": "ok",
             "data": formatted_message,
-            "raw": llm_result,
+            "raw": llmSchema.dumps(detail),
         }
     )
 
 
-@csrf_exempt
-def send_mail(request):
+def _send_params(payload: dict):
     """
-    发送邮件到指定收件人，支持抄送和附件（base64）。
+    从请求 JSON 中整理出 GmailTool.send_message 的参数；缺少必填字段时返回 (None, 错误信息)。
     """
-    if request.method != "POST":
-        return JsonResponse({"error": "Only POST is allowed"}, status=405)
-
-    try:
-        raw_body = request.body.decode("utf-8") if request.body else "{}"
-        payload = json.loads(raw_body or "{}")
-    except json.JSONDecodeError:
-        return JsonResponse({"error": "Invalid JSON body"}, status=400)
-
     to_addr = (payload.get("to") or "").strip()
     cc_addr = (payload.get("cc") or "").strip()
     subject = (payload.get("subject") or "送信页邮件").strip() or "送信页邮件"
@@ -273,9 +352,9 @@ def send_mail(request):
     ).strip()
 
     if not to_addr:
-        return JsonResponse({"error": "Missing field: to"}, status=400)
+        return None, "Missing field: to"
     if not body.strip():
-        return JsonResponse({"error": "Missing field: body"}, status=400)
+        return None, "Missing field: body"
 
     # 标准化附件结构
     normalized_atts = []
@@ -290,18 +369,39 @@ def send_mail(request):
             }
         )
 
+    return {
+        "to": to_addr,
+        "cc": cc_addr or None,
+        "subject": subject,
+        "body": body,
+        "attachments": normalized_atts,
+        "thread_id": thread_id or None,
+        "in_reply_to": in_reply_to or None,
+        "references": references or None,
+    }, None
+
+
+@csrf_exempt
+def send_mail(request):
+    """
+    发送邮件到指定收件人，支持抄送和附件（base64）。
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST is allowed"}, status=405)
+
     try:
-        gmail = GmailTool()
-        message_id = gmail.send_message(
-            to=to_addr,
-            cc=cc_addr or None,
-            subject=subject,
-            body=body,
-            attachments=normalized_atts,
-            thread_id=thread_id or None,
-            in_reply_to=in_reply_to or None,
-            references=references or None,
-        )
+        raw_body = request.body.decode("utf-8") if request.body else "{}"
+        payload = json.loads(raw_body or "{}")
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    params, error = _send_params(payload)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+
+    try:
+        # 复用进程内共享的 GmailTool，不再每个请求重新加载凭据、构建 service
+        message_id = get_gmail_tool().send_message(**params)
     except FileNotFoundError as exc:
         return JsonResponse({"error": f"OAuth credentials missing: {exc}"}, status=500)
     except Exception as exc:
@@ -310,6 +410,45 @@ def send_mail(request):
     return JsonResponse({"status": "ok", "message_id": message_id})
 
 
+@csrf_exempt
+def send_mail_bulk(request):
+    """
+    批量送信：{"messages": [send-mail 的请求体, ...]} 写入发件队列后立即返回 202，
+    由 outbox worker 按 Gmail 配额分批发送，结果见 send-history 的 status。
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST is allowed"}, status=405)
+
+    try:
+        raw_body = request.body.decode("utf-8") if request.body else "{}"
+        payload = json.loads(raw_body or "{}")
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    items = payload.get("messages")
+    if not isinstance(items, list) or not items:
+        return JsonResponse({"error": "Missing field: messages"}, status=400)
+
+    queued = []
+    for idx, item in enumerate(items):
+        params, error = _send_params(item if isinstance(item, dict) else {})
+        if error:
+            return JsonResponse({"error": f"messages[{idx}]: {error}"}, status=400)
+        queued.append(params)
+
+    batch_id = uuid.uuid4().hex
+    try:
+        log_ids = outbox.enqueue(queued, batch_id=batch_id)
+    except Exception as exc:
+        return JsonResponse({"error": str(exc)}, status=500)
+    outbox.worker.kick()
+
+    return JsonResponse(
+        {"status": "queued", "batch_id": batch_id, "ids": log_ids, "count": len(log_ids)},
+        status=202,
+    )
+
+
 @csrf_exempt
 @require_GET
 def send_history(request):
@@ -343,3 +482,48 @@ def send_history(request):
         )
 
     return JsonResponse({"items": items, "count": len(items)})
+
+
+@csrf_exempt
+@require_GET
+def match_stats(request):
+    """
+    返回匹配流水线的运行统计（标题规则命中率等），用于观察省下的 LLM 调用。
+    """
+    return JsonResponse(
+        {
+            "title_rules": titleRules.classifier.stats(),
+            "detail_rules": ruleExtractor.extractor.stats(),
+        }
+    )
+
+
+@csrf_exempt
+def gmail_push(request):
+    """
+    Gmail 推送通知入口：解码通知后立即应答（204），增量同步与人员池更新在后台执行。
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST is allowed"}, status=405)
+
+    # 该端点不经过登录校验（见 middleware），未配置 token 时拒绝所有请求
+    token = get_setting("BPMATCH_GMAIL_PUSH_TOKEN", "")
+    if not token:
+        print("[gmail_push] 未配置 BPMATCH_GMAIL_PUSH_TOKEN，拒绝推送")
+        return JsonResponse({"error": "Push endpoint is not configured"}, status=403)
+    if not hmac.compare_digest(
+        request.GET.get("token", "").encode("utf-8"), token.encode("utf-8")
+    ):
+        return JsonResponse({"error": "Invalid token"}, status=403)
+
+    try:
+        notification = gmailPush.get_transport()(request.body)
+    except gmailPush.PushError as exc:
+        print(f"[gmail_push] 忽略无法解析的通知: {exc}")
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    print(
+        f"[gmail_push] 收到通知 {notification.email_address} historyId={notification.history_id}"
+    )
+    gmailPush.dispatcher.notify(notification)
+    return HttpResponse(status=204)
@@ -17,6 +17,9 @@ class SessionLoginRequiredMiddleware:
     def _should_skip(path: str) -> bool:
         if path in {"/login.html", "/favicon.ico", "/favicon.png"}:
             return True
+        # Gmail push notifications come from Pub/Sub without a session (token-checked in the view).
+        if path == "/gmail/push":
+            return True
         if path.startswith(("/api/", "/admin/", "/static/")):
             return True
         return False
\ No newline at end of file
@@ -146,3 +146,62 @@ X_FRAME_OPTIONS = "SAMEORIGIN"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+
+# bpmatch：LLM 结果缓存（llm_result_cache 表）
+BPMATCH_LLM_CACHE_TTL = 60 * 60 * 24 * 30  # 秒
+BPMATCH_LLM_CACHE_MAX_ENTRIES = 50000
+
+# bpmatch：Ollama 推理池（按进行中请求数最少分配，故障主机熔断后自动切换）
+# 所有主机须部署同一个模型；留空则使用 OLLAMA_HOST 或本机 11434
+BPMATCH_OLLAMA_HOSTS = [
+    "http://127.0.0.1:11434",
+]
+BPMATCH_OLLAMA_MODEL = "llama3.2:3b-instruct-q4_K_M"
+
+# bpmatch：正文语义匹配的 embedding 模型；为空时只按技能匹配（默认）。
+# 启用：先在 BPMATCH_OLLAMA_HOSTS 的每台主机上执行 `ollama pull bge-m3`，再设为 "bge-m3"，
+# 然后刷新人员池（candidatePool.refresh）以生成候选人向量
+BPMATCH_EMBED_MODEL = ""
+
+# bpmatch：LLM 调用并发与超时
+BPMATCH_LLM_CONCURRENCY = 4  # 每台 Ollama 主机的并发
+BPMATCH_LLM_TIMEOUT = 120  # 秒
+BPMATCH_LLM_MAX_RETRIES = 2
+BPMATCH_LLM_BODY_BUDGET = 1200  # 去掉引用/署名/定型文后送入 LLM 的正文上限（字符，约等于 token）
+
+# bpmatch：求案件人员池共享快照（多 worker 进程共用，按版本惰性重新加载）
+BPMATCH_POOL_SNAPSHOT_PATH = BASE_DIR / "var" / "candidate_pool.json"
+# 人员池窗口内最多读取的本地邮件数（按接收时间倒序），0 为不限
+BPMATCH_POOL_WINDOW_LIMIT = 0
+
+# bpmatch：标题规则分类（追加规则格式 [(正则, 标签0/1, 权重), ...]）
+BPMATCH_TITLE_RULES_EXTRA = []
+BPMATCH_TITLE_RULE_MIN_SCORE = 2.0
+BPMATCH_TITLE_RULE_MIN_MARGIN = 1.5
+
+# bpmatch：Gmail pageToken 等跨 worker 共享的短期缓存
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "bpmatch": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "var" / "cache",
+        "TIMEOUT": 600,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+BPMATCH_PAGE_TOKEN_CACHE = "bpmatch"
+
+# bpmatch：Gmail 推送通知（users.watch → Pub/Sub push → /gmail/push）
+# 传输方式："pubsub"（Pub/Sub 信封）、"local"（本地替身直接 POST JSON）或解码函数的点分路径
+BPMATCH_GMAIL_PUSH_TRANSPORT = "pubsub"
+# 推送 URL 须带 ?token=<值>（在 Pub/Sub 订阅的 push endpoint 中配置）；为空时推送端点拒绝所有请求
+BPMATCH_GMAIL_PUSH_TOKEN = ""
+# users.watch 的 Pub/Sub topic，形如 projects/<project>/topics/<topic>
+BPMATCH_GMAIL_PUSH_TOPIC = ""
+
+# bpmatch：批量送信队列（outbound_emails），令牌桶限速以符合 Gmail 配额
+# 令牌桶状态存于 send_rate_buckets 表，所有发件进程合计不超过该速率
+BPMATCH_SEND_RATE = 2.0  # 封/秒
+BPMATCH_SEND_BURST = 5  # 单个 batch 请求最多发送的封数
@@ -22,11 +22,15 @@ from django.views.generic.base import RedirectView
 
 from bpmatch.views import (
     messages,
+    message_body,
     persons,
     log_job_click,
     extract_qiuren_detail,
     send_mail,
+    send_mail_bulk,
     send_history,
+    match_stats,
+    gmail_push,
 )
 from attendance.views import (
     attendance_punch_api,
@@ -107,9 +111,13 @@ urlpatterns = [
     path("api/my-attendance-summary", my_attendance_summary_api, name="my-attendance-summary"),
     path("api/my-attendance-detail", my_attendance_detail_api, name="my-attendance-detail"),
     path("messages", messages),
+    path("messages/<str:message_id>/body", message_body),
     path("persons", persons),
     path("job-click", log_job_click),
     path("extract-qiuren-detail", extract_qiuren_detail),
     path("send-mail", send_mail),
+    path("send-mail-bulk", send_mail_bulk),
     path("send-history", send_history),
+    path("match-stats", match_stats),
+    path("gmail/push", gmail_push),
 ]
@@ -23,3 +23,122 @@ CREATE TABLE `sent_email_logs` (
   DEFAULT CHARSET=utf8mb4
   COLLATE=utf8mb4_unicode_ci
   COMMENT='已发送邮件日志(Gmail API)';
+
+CREATE TABLE `inbound_emails` (
+  `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '主键',
+
+  `gmail_id` VARCHAR(64) NOT NULL COMMENT 'Gmail message id',
+  `thread_id` VARCHAR(64) NOT NULL DEFAULT '' COMMENT 'Gmail thread id',
+  `subject` VARCHAR(512) NOT NULL DEFAULT '' COMMENT '邮件主题',
+  `sender` VARCHAR(512) NOT NULL DEFAULT '' COMMENT '发件人',
+  `to` TEXT NOT NULL COMMENT '收件人',
+  `date` VARCHAR(64) NOT NULL DEFAULT '' COMMENT '接收时间(ISO)',
+  `date_header` VARCHAR(255) NOT NULL DEFAULT '' COMMENT 'Date 头',
+  `message_id_header` VARCHAR(512) NOT NULL DEFAULT '' COMMENT 'Message-ID 头',
+  `references_header` TEXT NOT NULL COMMENT 'References 头',
+  `internal_ts` DOUBLE NULL COMMENT '接收时间戳(秒)',
+  `body` MEDIUMTEXT NOT NULL COMMENT '邮件正文',
+  `label_ids` TEXT NOT NULL COMMENT 'Gmail labelIds(JSON)',
+
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_gmail_id` (`gmail_id`),
+  KEY `idx_thread_id` (`thread_id`),
+  KEY `idx_internal_ts` (`internal_ts`)
+) ENGINE=InnoDB
+  DEFAULT CHARSET=utf8mb4
+  COLLATE=utf8mb4_unicode_ci
+  COMMENT='收件缓存(Gmail API)';
+
+CREATE TABLE `gmail_sync_state` (
+  `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '主键',
+
+  `name` VARCHAR(64) NOT NULL COMMENT '同步通道名',
+  `history_id` BIGINT NOT NULL DEFAULT 0 COMMENT '最近同步到的 Gmail historyId',
+  `synced_at` DATETIME NULL COMMENT '最近同步时间',
+
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_name` (`name`)
+) ENGINE=InnoDB
+  DEFAULT CHARSET=utf8mb4
+  COLLATE=utf8mb4_unicode_ci
+  COMMENT='Gmail 增量同步状态';
+
+CREATE TABLE `llm_result_cache` (
+  `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '主键',
+
+  `cache_key` CHAR(64) NOT NULL COMMENT '缓存键(sha256)',
+  `func_name` VARCHAR(64) NOT NULL COMMENT '调用函数名',
+  `prompt_version` VARCHAR(32) NOT NULL COMMENT 'prompt 版本',
+  `model_name` VARCHAR(128) NOT NULL COMMENT '模型名',
+  `text_hash` CHAR(64) NOT NULL COMMENT '归一化输入文本哈希',
+  `result` MEDIUMTEXT NOT NULL COMMENT 'LLM 输出',
+  `hit_count` INT NOT NULL DEFAULT 0 COMMENT '命中次数',
+  `expires_at` DATETIME NOT NULL COMMENT '过期时间',
+  `last_used_at` DATETIME NOT NULL COMMENT '最近使用时间(LRU)',
+
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_cache_key` (`cache_key`),
+  KEY `idx_func_name` (`func_name`),
+  KEY `idx_expires_at` (`expires_at`),
+  KEY `idx_last_used_at` (`last_used_at`)
+) ENGINE=InnoDB
+  DEFAULT CHARSET=utf8mb4
+  COLLATE=utf8mb4_unicode_ci
+  COMMENT='LLM 结果缓存';
+
+CREATE TABLE `outbound_emails` (
+  `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '主键',
+
+  `sent_log_id` BIGINT UNSIGNED NOT NULL COMMENT '对应 sent_email_logs.id',
+  `batch_id` VARCHAR(64) NOT NULL DEFAULT '' COMMENT '批量发送批次',
+  `payload` LONGTEXT NOT NULL COMMENT '发送参数(JSON，附件为 base64)',
+  `status` VARCHAR(20) NOT NULL DEFAULT 'queued' COMMENT '队列状态',
+  `attempts` INT NOT NULL DEFAULT 0 COMMENT '已尝试次数',
+  `next_attempt_at` DATETIME NOT NULL COMMENT '下次可发送时间',
+  `last_error` TEXT NOT NULL COMMENT '最近一次错误',
+
+  `created_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_sent_log_id` (`sent_log_id`),
+  KEY `idx_batch_id` (`batch_id`),
+  KEY `idx_status` (`status`),
+  KEY `idx_next_attempt_at` (`next_attempt_at`),
+  CONSTRAINT `fk_outbound_sent_log` FOREIGN KEY (`sent_log_id`)
+    REFERENCES `sent_email_logs` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB
+  DEFAULT CHARSET=utf8mb4
+  COLLATE=utf8mb4_unicode_ci
+  COMMENT='发件队列';
+
+CREATE TABLE `send_rate_buckets` (
+  `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '主键',
+
+  `name` VARCHAR(64) NOT NULL COMMENT '令牌桶名',
+  `tokens` DOUBLE NOT NULL DEFAULT 0 COMMENT '当前令牌数',
+  `refilled_at` DATETIME(6) NOT NULL COMMENT '上次补充令牌的时间',
+
+  `updated_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_name` (`name`)
+) ENGINE=InnoDB
+  DEFAULT CHARSET=utf8mb4
+  COLLATE=utf8mb4_unicode_ci
+  COMMENT='发件限速令牌桶(多进程共享)';
+
+-- 已有库升级：inbound_emails 增加 label_ids（旧记录由下次同步按 INBOX 列表回填）
+-- ALTER TABLE `inbound_emails` ADD COLUMN `label_ids` TEXT NOT NULL COMMENT 'Gmail labelIds(JSON)' AFTER `body`;
+-- UPDATE `inbound_emails` SET `label_ids` = '[]' WHERE `label_ids` = '';